@@ -0,0 +1,144 @@
+"""Response compression negotiated from ``Accept-Encoding``.
+
+Brotli is used when the client accepts it (``brotli`` is in requirements.txt;
+an install without it serves gzip to everyone), gzip otherwise. Streaming
+responses are compressed chunk by chunk, and each chunk is flushed so the
+client can decode it as soon as it arrives. Compressed responses get an
+encoding-specific ETag (``"<tag>-br"``, ``"<tag>-gzip"``) so caches never mix
+representations; app/cache.py accepts either form in ``If-None-Match``.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1000"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/csv", "text/plain", "text/html")
+
+
+def negotiate(accept_encoding):
+    """Pick "br", "gzip" or None from an Accept-Encoding header."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def process(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message  # held back until the first body chunk decides the headers
+                headers = MutableHeaders(raw=start["headers"])
+                if start["status"] == 304 and "etag" in headers:
+                    # Echo the tag of the representation the client holds
+                    suffixed = headers["etag"][:-1] + f'-{encoding}"'
+                    if suffixed in request_headers.get("if-none-match", ""):
+                        headers["ETag"] = suffixed
+                return
+            if message["type"] != "http.response.body":
+                if start is not None:
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if (
+                    "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                ):
+                    compressor = _Brotli() if encoding == "br" else _Gzip()
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if "etag" in headers and headers["etag"].endswith('"'):
+                        headers["ETag"] = headers["etag"][:-1] + f'-{encoding}"'
+                    if "content-length" in headers:
+                        del headers["Content-Length"]
+                    if not more_body:
+                        body = compressor.process(body) + compressor.finish()
+                        headers["Content-Length"] = str(len(body))
+                        compressor = None
+                        message = {**message, "body": body}
+                        await send(start)
+                        start = None
+                        await send(message)
+                        return
+                await send(start)
+                start = None
+
+            if compressor is not None:
+                body = compressor.process(body)
+                if not more_body:
+                    body += compressor.finish()
+                elif message.get("body"):
+                    # Otherwise the compressor holds a listing's rows back until it has a block's worth
+                    body += compressor.flush()
+                message = {**message, "body": body}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
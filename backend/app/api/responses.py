@@ -0,0 +1,28 @@
+"""Fast JSON encoding for API responses.
+
+``orjson`` is used when installed (it is listed in requirements.txt) and the
+standard library otherwise; both produce the same compact UTF-8 output.
+Routes that return many rows build a ``FastJSONResponse`` themselves, which
+skips FastAPI's ``jsonable_encoder`` walk over every value.
+"""
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with ``dumps``; the app's default response class."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,94 +1,461 @@
-from fastapi import APIRouter, HTTPException, Query
+import asyncio
+import tempfile
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+
+import app.async_database as adb
 import app.database as db
+import app.jobs as jobs
+from app import cache, collection_io, images
+from app.api.responses import FastJSONResponse, dumps
+from app.api.schemas import CollectionBatch
+from app.pool import PoolTimeout
 
 router = APIRouter()
 
-#Expansion
+
+async def _cached(request: Request, build):
+    """Serve a GET from the response cache, building and storing the JSON bytes on a miss.
+
+    Hits are answered on the event loop; ``build`` (blocking) runs on a reader
+    thread. Responses carry a strong ETag; a matching If-None-Match gets a bodiless 304.
+    """
+    key = request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    entry = cache.responses.get(key)
+    if entry is None:
+        generation = cache.responses.generation
+        entry = cache.responses.put(key, generation, await adb.read(build))
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _owner(owner: str = Query(db.DEFAULT_OWNER, description="Whose collection to use")) -> int:
+    """Resolve the `owner` query parameter of collection-scoped routes to an owner id."""
+    owner_id = await adb.get_owner_id(owner)
+    if owner_id is None:
+        raise HTTPException(status_code=404, detail="Unknown owner")
+    return owner_id
+
+
+def _page_chunks(key, page, records, columnar=False):
+    """Encode ``{key: [...], "next_cursor": ...}`` in chunks, without building the list in memory.
+
+    Columnar pages are ``{"columns": [...], "rows": [[...], ...], "next_cursor": ...}``.
+    """
+    if columnar:
+        yield b'{"columns":' + dumps(page.fields) + b',"rows":['
+    else:
+        yield f'{{"{key}":['.encode()
+    batch = []
+    for i, record in enumerate(records):
+        if i:
+            batch.append(b",")
+        batch.append(dumps(record))
+        if len(batch) >= 400:
+            yield b"".join(batch)
+            batch = []
+    batch.append(b'],"next_cursor":' + dumps(page.next_cursor) + b"}")
+    yield b"".join(batch)
+
+
+def _busy(e):
+    # Every streaming connection stayed taken for app.pool.STREAM_TIMEOUT
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def _stream_page(key, page, records, columnar=False):
+    return StreamingResponse(adb.iterate(_page_chunks(key, page, records, columnar)), media_type="application/json")
+
+
+# `layout=columnar` returns a column header plus row arrays instead of one object per row
+LAYOUT = Query("objects", pattern="^(objects|columnar)$",
+               description="`objects` (one JSON object per row) or `columnar` (columns + row arrays)")
+
+
+# Expansion
 @router.get("/expansions/", tags=["expansion"])
-def list_expansions():
-    """Fetch a list of Pokémon TCG expansions."""
-    expansions = db.get_expansions()
-    return {"expansions": expansions}
+async def list_expansions(request: Request):
+    """Fetch Pokémon TCG expansions grouped by series, plus per-series summaries (latest release, counts)."""
+    # An in-memory snapshot, built at startup and after each catalogue sync
+    body, etag = db.get_expansion_tree().encoded(dumps)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 
 @router.get("/expansion/{set_id}/cards", tags=["expansion"])
-def list_cards(set_id: str):
-    """Fetch all cards in a specific expansion."""
-    cards = db.get_cards_by_expansion(set_id)
-    if not cards:
-        raise HTTPException(status_code=404, detail="Expansion not found or no cards available")
-    return {"cards": cards}
-
-#Search and Filter
+async def list_cards(
+    request: Request,
+    set_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    sort: Optional[str] = Query(None, description="Comma-separated sort keys, '-' for descending"),
+    limit: int = Query(1000, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    layout: str = LAYOUT,
+    rarity: Optional[str] = None,
+    type_: List[str] = Query(None),
+    subtype: List[str] = Query(None),
+    supertype: Optional[str] = None,
+    hp_min: Optional[int] = Query(None, ge=0),
+    hp_max: Optional[int] = Query(None, ge=0),
+):
+    """Fetch the cards of an expansion, a page at a time (follow `next_cursor`), optionally filtered."""
+    columnar = layout == "columnar"
+
+    def build():
+        if not cursor and not db.expansion_has_cards(set_id):
+            raise HTTPException(status_code=404, detail="Expansion not found or no cards available")
+        try:
+            page, records = db.get_cards_by_expansion(
+                set_id, fields, sort, limit, cursor, columnar, rarity=rarity, type_=type_, subtype=subtype,
+                supertype=supertype, hp_min=hp_min, hp_max=hp_max)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except PoolTimeout as e:
+            raise _busy(e)
+        return b"".join(_page_chunks("cards", page, records, columnar))
+    return await _cached(request, build)
+
+
+# Search and Filter
 @router.get("/search/cards/", tags=["search"])
-def search_cards(
-    q: str = Query(..., min_length=1),
+async def search_cards(
+    request: Request,
+    q: str = Query(None),
     rarity: str = Query(None),
-    type_: str = Query(None)  # `type_` because `type` is a reserved Python keyword
+    # `type_` because `type` is a reserved Python keyword; repeat or comma-separate for several
+    type_: List[str] = Query(None),
+    subtype: List[str] = Query(None),
+    supertype: str = Query(None),
+    hp_min: int = Query(None, ge=0),
+    hp_max: int = Query(None, ge=0),
+    series: List[str] = Query(None),
+    owned: bool = Query(None, description="true: only collected cards, false: only missing ones"),
+    facets: bool = Query(False, description="Also return rarity/type/supertype/series/owned counts"),
+    limit: int = Query(60, ge=1, le=250),
+    cursor: str = Query(None),
+    owner_id: int = Depends(_owner),
 ):
-    """Search for cards by name with optional rarity and type filters."""
-    cards = db.get_cards_by_name(q, rarity, type_)
-    return {"cards": cards}
+    """Search for cards by name (prefix matching, ranked) and/or rarity, type, subtype, supertype, HP, series
+    and owned filters."""
+    if not (q or rarity or type_ or subtype or supertype or hp_min is not None or hp_max is not None
+            or series or owned is not None):
+        raise HTTPException(status_code=400, detail="Give a search query or at least one filter")
+
+    def build():
+        try:
+            return dumps(db.get_cards_by_name(q, rarity, type_, limit=limit, cursor=cursor, with_facets=facets,
+                                              subtype=subtype, supertype=supertype, hp_min=hp_min, hp_max=hp_max,
+                                              series=series, owned=owned, owner_id=owner_id))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await _cached(request, build)
+
 
-#Collection
+# Collection
 @router.get("/collection/", tags=["collection"])
-def get_collection_cards():
-    """Retrieve all collected cards."""
-    return {"collection": db.get_collection()}
+async def get_collection_cards(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    sort: Optional[str] = Query(None, description="Comma-separated sort keys, '-' for descending"),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    layout: str = LAYOUT,
+    owner_id: int = Depends(_owner),
+):
+    """Retrieve collected cards, a page at a time (follow `next_cursor`)."""
+    columnar = layout == "columnar"
+    try:
+        page, records = await adb.open_stream(db.get_collection, fields, sort, limit, cursor, columnar,
+                                              owner_id=owner_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeout as e:
+        raise _busy(e)
+    return _stream_page("collection", page, records, columnar)
 
 
 @router.get("/collection/{expansion_id}/", tags=["collection"])
-def get_collection_for_expansion(expansion_id: str):
-    """Retrieve collection data for a specific expansion, including stats."""
-    return db.get_collection_by_expansion(expansion_id)
+async def get_collection_for_expansion(
+    expansion_id: str,
+    layout: str = LAYOUT,
+    facets: bool = Query(False, description="Also return rarity/type/supertype/series/owned counts"),
+    owner_id: int = Depends(_owner),
+):
+    """Retrieve collection data for a specific expansion, including stats (and facet counts)."""
+    return FastJSONResponse(await adb.get_collection_by_expansion(
+        expansion_id, columnar=layout == "columnar", with_facets=facets, owner_id=owner_id))
 
 
 @router.post("/collection/update/", tags=["collection"])
-def update_collection(card_id: str, change: int):
-    """Update the quantity of a card in the collection."""
-    result = db.update_card_quantity(card_id, change)
+async def update_collection(
+    card_id: str,
+    change: int,
+    variant: str = Query(None, description="e.g. normal, holofoil, reverseHolofoil, 1stEditionHolofoil"),
+    owner_id: int = Depends(_owner),
+):
+    """Update the quantity of a card in the collection (of one variant, if given)."""
+    result = await adb.update_card_quantity(card_id, change, owner_id, variant)
     if not result:
         raise HTTPException(status_code=400, detail="Failed to update quantity")
     return {"message": "Quantity updated"}
 
-#Settings
+
+@router.post("/collection/batch", tags=["collection"])
+async def update_collection_batch(batch: CollectionBatch, owner_id: int = Depends(_owner)):
+    """Apply many quantity changes (relative `change` or absolute `quantity`) in a single transaction."""
+    items = [item.model_dump(exclude_none=True) for item in batch.items]
+    return FastJSONResponse(await adb.apply_collection_changes(items, owner_id))
+
+
+# Uploads larger than this are spooled to disk while they are received
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+@router.post("/collection/import", tags=["collection"])
+async def import_collection(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|json)$"),
+    mode: str = Query("set", pattern="^(set|add)$"),
+    owner_id: int = Depends(_owner),
+):
+    """Import a CSV or JSON collection file sent as the raw request body.
+
+    The format comes from `format` or the Content-Type. `mode=set` replaces the
+    quantity of each listed card, `mode=add` adds to it. Unmatched rows are reported.
+    """
+    if format is None:
+        format = "json" if "json" in request.headers.get("content-type", "") else "csv"
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        try:
+            return await adb.import_collection(upload, format, mode, owner_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/collection/export", tags=["collection"])
+async def export_collection(format: str = Query("csv", pattern="^(csv|json)$"), owner_id: int = Depends(_owner)):
+    """Stream the whole collection as CSV or JSON (re-importable with /collection/import)."""
+    try:
+        chunks = await adb.open_stream(db.export_collection, format, owner_id=owner_id)
+    except PoolTimeout as e:
+        raise _busy(e)
+    return StreamingResponse(
+        adb.iterate(chunks),
+        media_type=collection_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="collection.{format}"'},
+    )
+
+
+# Valuation
+PRICE_SOURCE = Query("tcgplayer", pattern="^(tcgplayer|cardmarket)$",
+                     description="`tcgplayer` (USD market prices) or `cardmarket` (EUR trend prices)")
+
+
+@router.get("/collection/value", tags=["valuation"])
+async def collection_value(
+    source: str = PRICE_SOURCE,
+    days: int = Query(30, ge=1, le=3650, description="Also report the value this many days ago"),
+    owner_id: int = Depends(_owner),
+):
+    """Value the whole collection at current market prices, with the change over `days`."""
+    return await adb.get_collection_value(owner_id, source, days)
+
+
+@router.get("/collection/value/expansions", tags=["valuation"])
+async def collection_value_by_expansion(source: str = PRICE_SOURCE, owner_id: int = Depends(_owner)):
+    """Collection value per expansion, most valuable first."""
+    return FastJSONResponse(await adb.get_collection_value_by_expansion(owner_id, source))
+
+
+@router.get("/collection/movers", tags=["valuation"])
+async def collection_movers(
+    source: str = PRICE_SOURCE,
+    days: int = Query(7, ge=1, le=3650),
+    limit: int = Query(10, ge=1, le=100),
+    owner_id: int = Depends(_owner),
+):
+    """Owned cards whose value rose (`gainers`) or fell (`losers`) the most over the last `days`."""
+    return await adb.get_collection_movers(owner_id, source, days, limit)
+
+
+# Owners
+@router.get("/owners/", tags=["owners"])
+async def list_owners():
+    """List the owners (each with their own collection) and how many cards each has."""
+    return await adb.list_owners()
+
+
+@router.post("/owners/", tags=["owners"], status_code=201)
+async def create_owner(name: str):
+    """Add an owner with an empty collection; use it as `owner=<name>` on collection and widget routes."""
+    try:
+        return await adb.create_owner(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/owners/{name}", tags=["owners"])
+async def delete_owner(name: str):
+    """Delete an owner together with their collection."""
+    try:
+        deleted = await adb.delete_owner(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Unknown owner")
+    return {"message": "Owner deleted"}
+
+
+# Images
+# Image URLs are keyed by card/set id, not content, and a later download may store a different file under
+# the same key; so browsers revalidate with the content-hash ETag (a cheap 304) instead of caching blindly
+IMAGE_CACHE_CONTROL = "no-cache"
+IMAGE_SIZE = Query("thumb", pattern="^(thumb|medium|original)$")
+
+
+class _PinnedFileResponse(FileResponse):
+    """FileResponse that releases its pinned image (images.checkout) once sent, or on disconnect."""
+
+    def __init__(self, image, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.image = image
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            images.release(self.image)
+
+
+async def _serve_image(request: Request, key: str, size: str):
+    """Serve a cached image, downloading it first on a miss; falls back to a redirect upstream."""
+    # Pinned from here until the response is sent, so quota eviction cannot delete the file meanwhile
+    image = await adb.read(images.checkout, key)
+    if image is None:
+        try:
+            image = await asyncio.to_thread(images.fetch, key)
+        except images.ImageError:
+            url = await adb.read(images.source_url, key)
+            if url is None:
+                raise HTTPException(status_code=404, detail="Image not found")
+            return RedirectResponse(url, status_code=302)
+        if image is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        if images.touch(image):
+            await adb.write(images.flush_touches)
+        etag = f'"{image["sha256"]}-{size}"'
+        headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+        if cache.etag_matches(request.headers.get("if-none-match"), etag):
+            images.release(image)
+            return Response(status_code=304, headers=headers)
+        path, media_type = await asyncio.to_thread(images.file_for, image, size)
+    except BaseException:
+        images.release(image)
+        raise
+    return _PinnedFileResponse(image, path, media_type=media_type, headers=headers)
+
+
+@router.get("/images/expansion/{set_id}/{kind}", tags=["images"])
+async def expansion_image(request: Request, set_id: str, kind: str = Path(..., pattern="^(symbol|logo)$"),
+                          size: str = Query("original", pattern="^(thumb|medium|original)$")):
+    """An expansion's symbol or logo, served from the local image cache."""
+    return await _serve_image(request, f"{set_id}/{kind}", size)
+
+
+@router.get("/images/{card_id}", tags=["images"])
+async def card_image(request: Request, card_id: str, size: str = IMAGE_SIZE):
+    """A card image from the local cache: `thumb` (120px), `medium` (200px) or `original`."""
+    return await _serve_image(request, card_id, size)
+
+
+# Settings
+def _job_response(response: Response, job, created, message):
+    # 202 for a newly queued job; 200 when an identical job was already in flight
+    response.status_code = 202 if created else 200
+    return {"message": message, "job_id": job["id"], "status": job["status"], "job": job}
+
+
 @router.post("/expansions/update/", tags=["settings"])
-def update_expansions_endpoint():
-    """Endpoint to update expansions by checking for new releases from the PokémonTCG API."""
+async def update_expansions_endpoint(response: Response):
+    """Queue a delta sync of new or changed sets from the PokémonTCG API. Poll /jobs/{job_id} for progress."""
     try:
-        db.update_expansions()
-        return {"message": "Expansions updated successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
+        job, created = await adb.submit_job("sync_expansions")
+    except jobs.JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    message = "Expansion update started." if created else "Expansion update already in progress."
+    return _job_response(response, job, created, message)
+
+
 @router.post("/expansion/{set_id}/cards/update", tags=["settings"])
-def update_expansion_cards(set_id: str):
-    """Fetch and store missing cards for a specific expansion chosen by the user."""
-    result = db.fetch_cards_for_expansion(set_id)
-    if not result.get("success"):
-        raise HTTPException(status_code=400, detail=result.get("error", "Failed to fetch cards."))
-    return result
-
-#Widgets on the home page
+async def update_expansion_cards(set_id: str, response: Response):
+    """Queue a fetch of the cards of one expansion chosen by the user. Poll /jobs/{job_id} for progress."""
+    try:
+        job, created = await adb.submit_job("sync_expansion_cards", {"set_id": set_id})
+    except jobs.JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    message = f"Card update for {set_id} started." if created else f"Card update for {set_id} already in progress."
+    return _job_response(response, job, created, message)
+
+
+# Jobs
+@router.get("/jobs/", tags=["jobs"])
+async def list_jobs(status: str = Query(None), limit: int = Query(50, ge=1, le=500)):
+    """List recent background jobs, newest first."""
+    return FastJSONResponse({"jobs": await adb.list_jobs(status=status, limit=limit)})
+
+
+@router.get("/jobs/{job_id}", tags=["jobs"])
+async def get_job(job_id: str):
+    """Fetch a job's status and progress (sets_done/sets_total, cards_written, errors)."""
+    job = await adb.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel", tags=["jobs"])
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one after the set it is working on."""
+    job = await adb.cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Widgets on the home page
 @router.get("/widgets/totalCards", tags=["widgets"])
-def total_cards_endpoint():
+async def total_cards_endpoint(owner_id: int = Depends(_owner)):
     """
     Endpoint to get the total number of cards in the user's collection.
     Response format: { "totalCards": <number> }
     """
-    total = db.get_total_cards_collection()
+    total = await adb.get_total_cards_collection(owner_id)
     return {"totalCards": total}
 
+
 @router.get("/widgets/totalExpansions", tags=["widgets"])
-def total_expansions_endpoint():
+async def total_expansions_endpoint(owner_id: int = Depends(_owner)):
     """
     Endpoint to get the total number of expansions collected.
     Response format: { "totalExpansions": <number> }
     """
-    total = db.get_total_expansions_collection()
+    total = await adb.get_total_expansions_collection(owner_id)
     return {"totalExpansions": total}
 
+
 @router.get("/widgets/cardsByExpansion", tags=["widgets"])
-def cards_by_expansion_endpoint():
+async def cards_by_expansion_endpoint(owner_id: int = Depends(_owner)):
     """
     Endpoint to get a breakdown of the cards by expansion.
     Response format: [
@@ -97,5 +464,5 @@ def cards_by_expansion_endpoint():
          ...
     ]
     """
-    data = db.get_cards_by_expansion_collection()
-    return data
\ No newline at end of file
+    data = await adb.get_cards_by_expansion_collection(owner_id)
+    return data
@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class CollectionChange(BaseModel):
+    """One collection edit: either a relative ``change`` or an absolute ``quantity``.
+
+    With a ``variant`` (e.g. ``reverseHolofoil``) it applies to the copies of that variant;
+    a ``quantity`` without one sets the card's total and clears its variant breakdown.
+    """
+    card_id: str
+    change: Optional[int] = None
+    quantity: Optional[int] = Field(None, ge=0)
+    variant: Optional[str] = None
+
+    @model_validator(mode="after")
+    def one_of_change_or_quantity(self):
+        if (self.change is None) == (self.quantity is None):
+            raise ValueError("Provide exactly one of 'change' or 'quantity'")
+        return self
+
+
+class CollectionBatch(BaseModel):
+    items: List[CollectionChange] = Field(..., min_length=1, max_length=10000)
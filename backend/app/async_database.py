@@ -0,0 +1,181 @@
+"""Awaitable versions of the app.database operations used by the API.
+
+sqlite3 is blocking, so every call still runs on a thread, but not on the
+shared anyio threadpool that FastAPI uses for sync routes. Reads run on an
+executor sized like the read connection pool whose workers are dedicated
+readers (app.pool.dedicate_thread): each keeps its own connection outside the
+slots that jobs, imports and other threads share, so it never waits for one.
+Writes run on a single thread: they
+queue there in submission order and never occupy a reader thread, so cheap
+reads stay fast during write bursts. Streamed responses are stepped on their
+own executor, one thread per streaming connection: a stream that holds a
+connection can always advance, whatever the readers are waiting on. Upstream API traffic does not go
+through here; syncs run as background jobs (app/jobs.py).
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import app.database as db
+import app.jobs as jobs
+from app.pool import READ_POOL_SIZE, STREAM_POOL_SIZE, dedicate_thread
+
+_executors = {}
+
+
+def _executor(kind):
+    # Created on first use, so the module can be started again after shutdown()
+    if kind not in _executors:
+        if kind == "read":
+            _executors[kind] = ThreadPoolExecutor(
+                max_workers=READ_POOL_SIZE, thread_name_prefix="db-read", initializer=dedicate_thread
+            )
+        elif kind == "stream":
+            _executors[kind] = ThreadPoolExecutor(max_workers=STREAM_POOL_SIZE, thread_name_prefix="db-stream")
+        else:
+            _executors[kind] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{kind}")
+    return _executors[kind]
+
+
+async def read(fn, *args, **kwargs):
+    """Run a blocking read on the reader executor."""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so DB time is charged to the request (app.metrics)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor("read"), functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def write(fn, *args, **kwargs):
+    """Run a blocking write on the single writer thread."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor("write"), functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def open_stream(fn, *args, **kwargs):
+    """Run a blocking call that opens a streamed result (see app.database._RowBatches).
+
+    Opening can wait for a streaming connection, so it runs on the default
+    thread pool: a waiting call occupies neither a reader thread nor a stream
+    thread. Raises app.pool.PoolTimeout when no connection becomes free.
+    """
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def iterate(iterator):
+    """Step a blocking iterator over an opened stream (e.g. a streamed page) on the stream executor."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(_executor("stream"), context.run, next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            await loop.run_in_executor(_executor("stream"), context.run, close)
+
+
+def shutdown():
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Catalogue
+async def get_expansions():
+    return await read(db.get_expansions)
+
+
+async def expansion_has_cards(set_id):
+    return await read(db.expansion_has_cards, set_id)
+
+
+async def get_cards_by_name(query, rarity=None, type_=None, limit=60, cursor=None, with_facets=False, **filters):
+    return await read(db.get_cards_by_name, query, rarity, type_, limit=limit, cursor=cursor,
+                      with_facets=with_facets, **filters)
+
+
+# Collection
+async def get_collection_by_expansion(expansion_id, columnar=False, with_facets=False, owner_id=db.DEFAULT_OWNER_ID):
+    return await read(db.get_collection_by_expansion, expansion_id, columnar, with_facets, owner_id)
+
+
+async def apply_collection_changes(items, owner_id=db.DEFAULT_OWNER_ID):
+    return await write(db.apply_collection_changes, items, owner_id)
+
+
+async def update_card_quantity(card_id, change, owner_id=db.DEFAULT_OWNER_ID, variant=None):
+    return await write(db.update_card_quantity, card_id, change, owner_id, variant)
+
+
+async def import_collection(stream, fmt="csv", mode="set", owner_id=db.DEFAULT_OWNER_ID):
+    # Long-running: kept off the writer thread. It takes the write lock one chunk at
+    # a time, so interactive writes queued meanwhile interleave with it.
+    return await asyncio.to_thread(db.import_collection, stream, fmt, mode, owner_id=owner_id)
+
+
+# Owners
+async def get_owner_id(name):
+    # Cached after the first lookup, so only the first request per owner touches the database
+    owner_id = db.cached_owner_id(name)
+    return owner_id if owner_id is not None else await read(db.get_owner_id, name)
+
+
+async def list_owners():
+    return await read(db.list_owners)
+
+
+async def create_owner(name):
+    return await write(db.create_owner, name)
+
+
+async def delete_owner(name):
+    return await write(db.delete_owner, name)
+
+
+# Valuation
+async def get_collection_value(owner_id=db.DEFAULT_OWNER_ID, source="tcgplayer", days=30):
+    return await read(db.get_collection_value, owner_id, source, days)
+
+
+async def get_collection_value_by_expansion(owner_id=db.DEFAULT_OWNER_ID, source="tcgplayer"):
+    return await read(db.get_collection_value_by_expansion, owner_id, source)
+
+
+async def get_collection_movers(owner_id=db.DEFAULT_OWNER_ID, source="tcgplayer", days=7, limit=10):
+    return await read(db.get_collection_movers, owner_id, source, days, limit)
+
+
+# Widgets
+async def get_total_cards_collection(owner_id=db.DEFAULT_OWNER_ID):
+    return await read(db.get_total_cards_collection, owner_id)
+
+
+async def get_total_expansions_collection(owner_id=db.DEFAULT_OWNER_ID):
+    return await read(db.get_total_expansions_collection, owner_id)
+
+
+async def get_cards_by_expansion_collection(owner_id=db.DEFAULT_OWNER_ID):
+    return await read(db.get_cards_by_expansion_collection, owner_id)
+
+
+# Jobs
+async def submit_job(kind, params=None):
+    return await write(jobs.runner.submit, kind, params)
+
+
+async def get_job(job_id):
+    return await read(jobs.runner.get, job_id)
+
+
+async def list_jobs(status=None, limit=50):
+    return await read(jobs.runner.list, status=status, limit=limit)
+
+
+async def cancel_job(job_id):
+    return await write(jobs.runner.cancel, job_id)
@@ -0,0 +1,94 @@
+"""In-process cache of serialized GET responses.
+
+Entries are keyed by the request path and query string plus a data
+*generation*: a counter bumped after every committed catalogue or collection
+write. A bump drops every entry, and a response built while a write was
+committing is never stored under the new generation, so a cached body is
+always what the database would produce right now. Each entry carries a
+strong ETag derived from its bytes so clients can revalidate with
+``If-None-Match``. Memory is bounded by entry count and total body size,
+evicting least recently used entries first.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Does an ``If-None-Match`` header value match ``etag``? (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        # Compressed representations carry "<tag>-gzip" / "<tag>-br" (app/api/compression.py)
+        for suffix in ('-gzip"', '-br"'):
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=int(RESPONSE_CACHE_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def bump(self):
+        """Invalidate everything. Call after a write that changes what endpoints return has committed."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key):
+        """Return ``(body, etag)`` for a cached key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, generation, body):
+        """Store a body built while ``generation`` was current. Returns ``(body, etag)``."""
+        entry = (body, make_etag(body))
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry  # a write committed while it was built
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "generation": self.generation,
+                    "hits": self.hits, "misses": self.misses}
+
+
+responses = ResponseCache()
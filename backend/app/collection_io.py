@@ -0,0 +1,180 @@
+"""Streaming readers and writers for collection import/export files.
+
+Two formats are understood: CSV with a header row, and JSON, either one array
+of objects or one object per line (JSON Lines). Readers yield one normalized
+row at a time, so a file of any size is parsed in bounded memory. Writers turn
+database rows into encoded chunks for a streaming response or a file.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+
+FORMATS = ("csv", "json")
+
+# Column order of exported files; an exported file imports back unchanged
+EXPORT_COLUMNS = ("card_id", "set_id", "number", "name", "rarity", "quantity", "collection_number", "variant")
+
+# Accepted spellings of each import column
+_ALIASES = {
+    "card_id": "card_id", "id": "card_id",
+    "set_id": "set_id", "set": "set_id", "expansion_id": "set_id", "expansion": "set_id",
+    "number": "number", "card_number": "number", "no": "number",
+    "quantity": "quantity", "qty": "quantity", "count": "quantity",
+    "collection_number": "collection_number",
+    "variant": "variant", "finish": "variant",
+}
+
+_READ_SIZE = 64 * 1024
+
+# Longest JSON record read before giving up on it; malformed input fails here instead of buffering the whole file
+MAX_JSON_RECORD_KB = int(os.getenv("MAX_JSON_RECORD_KB", "1024"))
+
+
+class RowError(ValueError):
+    pass
+
+
+def _normalize(raw):
+    """Map a parsed record onto card_id / set_id / number / quantity / collection_number / variant."""
+    if not isinstance(raw, dict):
+        raise RowError("Row is not an object")
+    row = {}
+    for key, value in raw.items():
+        column = _ALIASES.get(str(key).strip().lower())
+        if column and value not in (None, ""):
+            row[column] = str(value).strip() if column in ("card_id", "set_id", "number", "variant") else value
+    if not row.get("card_id") and not (row.get("set_id") and row.get("number")):
+        raise RowError("Row needs a card_id or a set_id and number")
+    for column in ("quantity", "collection_number"):
+        if column in row:
+            try:
+                row[column] = int(row[column])
+            except (TypeError, ValueError):
+                raise RowError(f"Invalid {column}: {row[column]!r}")
+    if row.get("quantity", 1) < 0:
+        raise RowError("Quantity cannot be negative")
+    return row
+
+
+def _text(stream):
+    """Decode a binary stream incrementally (UTF-8, optional BOM)."""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def _iter_csv(stream):
+    reader = csv.DictReader(_text(stream))
+    for record in reader:
+        yield reader.line_num, record
+
+
+def iter_json(stream):
+    """Yield ``(n, record)`` from a JSON array or JSON Lines, decoding one object at a time.
+
+    Raises RowError (a ValueError) on malformed JSON, and on a record still
+    undecoded after MAX_JSON_RECORD_KB. Also used for the catalogue dump
+    files (app/ingest.py).
+    """
+    text = _text(stream)
+    decoder = json.JSONDecoder()
+    buffer, pos, index, eof = "", 0, 0, False
+    in_array = None
+
+    def fill():
+        nonlocal buffer, pos, eof
+        if len(buffer) - pos > MAX_JSON_RECORD_KB * 1024:
+            raise RowError(f"Invalid JSON near record {index + 1}: record is over {MAX_JSON_RECORD_KB} KB")
+        chunk = text.read(_READ_SIZE)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+
+    while True:
+        # Skip whitespace and separators between records
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            return
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == "]":
+            return
+
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise RowError(f"Invalid JSON near record {index + 1}: {e.msg}")
+                fill()
+                continue
+            # A number (or literal) may be cut off at the buffer edge; make sure it ended
+            if end == len(buffer) and not eof and not isinstance(record, (dict, list, str)):
+                fill()
+                continue
+            break
+        pos = end
+        index += 1
+        yield index, record
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(line, row, error)`` for every record of an import file.
+
+    ``line`` is the CSV line or JSON record number, ``row`` the normalized row
+    (None when the record was rejected) and ``error`` the reason it was.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    records = _iter_csv(stream) if fmt == "csv" else iter_json(stream)
+    for line, record in records:
+        try:
+            yield line, _normalize(record), None
+        except RowError as e:
+            yield line, None, str(e)
+
+
+def _encoder():
+    return codecs.getincrementalencoder("utf-8")()
+
+
+def write_csv(rows):
+    """Encode rows (sequences in EXPORT_COLUMNS order) as CSV, one chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    encoder = _encoder()
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in rows:
+        writer.writerows(batch)
+        yield encoder.encode(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+    yield encoder.encode(buffer.getvalue(), final=True)
+
+
+def write_json(rows):
+    """Encode rows as a JSON array of objects, one chunk per batch of rows."""
+    encoder = _encoder()
+    first = True
+    yield encoder.encode("[")
+    for batch in rows:
+        parts = []
+        for row in batch:
+            parts.append(("\n" if first else ",\n") + json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            first = False
+        yield encoder.encode("".join(parts))
+    yield encoder.encode("\n]\n", final=True)
+
+
+WRITERS = {"csv": write_csv, "json": write_json}
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "json": "application/json"}
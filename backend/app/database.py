@@ -1,522 +1,1800 @@
-import sqlite3
-import requests
+import hashlib
+import json
+import logging
 import os
+import re
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from typing import List, Dict
 
+from app import cache, collection_io, expansion_tree, facets, ingest, prices
+from app.migrations import MIGRATIONS, run_migrations
+from app.paging import Page, keyset_condition
+from app.pool import ConnectionPool, connect
+from app.search import build_match_query, cursor_keys, decode_cursor, encode_cursor, split_terms
+from app.sync import ApiClient, ApiError
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_PATH = os.getenv("DATABASE_PATH", "pokemon.db")
-POKEMON_TCG_API_URL = "https://api.pokemontcg.io/v2/sets"
-API_KEY = os.getenv("POKEMON_TCG_API_KEY")
-HEADERS = {"X-Api-Key": API_KEY}
+# Every collection belongs to an owner; owner-scoped calls default to this one (created by migration 13)
+DEFAULT_OWNER = "default"
+DEFAULT_OWNER_ID = 1
+OWNER_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Printings a collected copy can be recorded as, by code (migration 14). The names are the
+# API's tcgplayer.prices keys; code 0 is "unspecified". Append only: codes are stored.
+VARIANTS = (None, "normal", "holofoil", "reverseHolofoil", "1stEditionNormal", "1stEditionHolofoil",
+            "unlimitedHolofoil", "1stEdition", "unlimited")
+VARIANT_CODES = {name.lower(): code for code, name in enumerate(VARIANTS) if name}
+
+_pool = None
+_pool_lock = threading.Lock()
+_api_client = None
+_expansion_tree = None
+_owner_ids = {}  # lower-cased owner name -> id
+# Facet bitmap index and owned-card bitsets per owner (app/facets.py), built on first use and
+# dropped after writes commit; the generation tells a build that raced a write to discard itself
+_facet_index = None
+_facet_owned = {}
+_facets_generation = 0
+_facets_lock = threading.Lock()
+# Price histories per source and holdings per owner (app/prices.py), cached the same way
+_price_histories = {}
+_holdings = {}
+_prices_generation = 0
+_prices_lock = threading.Lock()
+
+INSERT_EXPANSION_SQL = """
+    INSERT OR IGNORE INTO expansions (
+        id, name, series, printed_total, total, legal_unlimited, legal_standard, legal_expanded,
+        ptcgo_code, release_date, updated_at, symbol_url, logo_url
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_EXPANSION_SQL = INSERT_EXPANSION_SQL.replace("INSERT OR IGNORE", "INSERT") + """
+    ON CONFLICT(id) DO UPDATE SET
+        name = excluded.name, series = excluded.series, printed_total = excluded.printed_total,
+        total = excluded.total, legal_unlimited = excluded.legal_unlimited, legal_standard = excluded.legal_standard,
+        legal_expanded = excluded.legal_expanded, ptcgo_code = excluded.ptcgo_code,
+        release_date = excluded.release_date,
+        updated_at = excluded.updated_at, symbol_url = excluded.symbol_url, logo_url = excluded.logo_url
+    WHERE (
+        expansions.name, expansions.series, expansions.printed_total, expansions.total, expansions.legal_unlimited,
+        expansions.legal_standard, expansions.legal_expanded, expansions.ptcgo_code, expansions.release_date,
+        expansions.updated_at, expansions.symbol_url, expansions.logo_url
+    ) IS NOT (
+        excluded.name, excluded.series, excluded.printed_total, excluded.total, excluded.legal_unlimited,
+        excluded.legal_standard, excluded.legal_expanded, excluded.ptcgo_code, excluded.release_date,
+        excluded.updated_at, excluded.symbol_url, excluded.logo_url
+    )
+"""
+
+UPSERT_CARD_SQL = """
+    INSERT INTO cards (
+        id, name, expansion_id, number, number_int, rarity, supertype, subtype, hp, types, evolves_from, image_url,
+        variants
+    )
+    VALUES (?, ?, ?, ?, CAST(? AS INTEGER), ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        name = excluded.name, expansion_id = excluded.expansion_id, number = excluded.number,
+        number_int = excluded.number_int, rarity = excluded.rarity, supertype = excluded.supertype,
+        subtype = excluded.subtype, hp = excluded.hp, types = excluded.types,
+        evolves_from = excluded.evolves_from, image_url = excluded.image_url, variants = excluded.variants
+"""
+
+# Recompute the stats rows of one expansion: card totals, then every owner's progress
+REFRESH_CATALOGUE_STATS_SQL = """
+    INSERT INTO catalogue_stats (expansion_id, rarity, sort_key, total_cards)
+    SELECT expansion_id, COALESCE(rarity, 'Unknown'), MIN(number_int), COUNT(*)
+    FROM cards
+    WHERE expansion_id = ?
+    GROUP BY COALESCE(rarity, 'Unknown')
+"""
+REFRESH_COLLECTION_STATS_SQL = """
+    INSERT INTO collection_stats (owner_id, expansion_id, rarity, collected_cards, quantity)
+    SELECT col.owner_id, c.expansion_id, COALESCE(c.rarity, 'Unknown'),
+           COUNT(CASE WHEN col.quantity > 0 THEN 1 END), SUM(col.quantity)
+    FROM cards c
+    JOIN collection col ON col.card_id = c.id
+    WHERE c.expansion_id = ?
+    GROUP BY col.owner_id, COALESCE(c.rarity, 'Unknown')
+"""
+
+# Same column order as _card_row, so stored and fetched cards compare as tuples
+STORED_CARDS_SQL = """
+    SELECT id, name, expansion_id, number, number, rarity, supertype, subtype, hp, types, evolves_from, image_url,
+           variants
+    FROM cards WHERE expansion_id = ?
+"""
+
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Open a standalone tuned connection (for scripts; app code uses the pool)."""
+    return connect(DATABASE_PATH)
 
-def init_db():
-    """Fetch expansions from PokémonTCG.io and store in the database with additional details."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Create the expansions table with additional fields
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS expansions (
-        id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        series TEXT NOT NULL,
-        printed_total INTEGER,
-        total INTEGER,
-        legal_unlimited TEXT,
-        legal_standard TEXT,
-        legal_expanded TEXT,
-        ptcgo_code TEXT,
-        release_date TEXT NOT NULL,
-        updated_at TEXT,
-        symbol_url TEXT,
-        logo_url TEXT
+
+def open_pool(path=None):
+    """Create the shared connection pool and bring the schema up to date. Called once at startup.
+
+    Also builds the expansion tree, so /expansions/ never waits on the database.
+    """
+    global _pool, _expansion_tree
+    with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool(path or DATABASE_PATH)
+            with pool.writer() as conn:
+                run_migrations(conn)
+                _expansion_tree = expansion_tree.build(conn)
+            _pool = pool
+        return _pool
+
+
+def close_pool():
+    """Close every pooled connection and forget what was cached from the database. Called at application shutdown."""
+    global _pool, _expansion_tree
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        _expansion_tree = None
+        _owner_ids.clear()
+    # The next pool may open another database file
+    _drop_facet_index()
+    _drop_price_histories()
+    _drop_holdings()
+    cache.responses.bump()
+
+
+def get_pool():
+    return _pool if _pool is not None else open_pool()
+
+
+@contextmanager
+def read_connection():
+    """Borrow the calling thread's read connection from the pool."""
+    with get_pool().reader() as conn:
+        yield conn
+
+
+@contextmanager
+def write_connection():
+    """Borrow the serialized writer; the block runs as one transaction."""
+    with get_pool().writer() as conn:
+        yield conn
+
+
+def _data_changed():
+    """Mark the open write transaction as changing what the API returns.
+
+    Cached responses are dropped once it commits (see app/cache.py).
+    """
+    get_pool().after_commit(cache.responses.bump)
+    get_pool().after_commit(_drop_owned_facet)
+    get_pool().after_commit(_drop_holdings)
+
+
+def _catalogue_changed():
+    """Like _data_changed, for writes to expansions or cards: also rebuilds the expansion tree."""
+    _data_changed()
+    get_pool().after_commit(_refresh_expansion_tree)
+    get_pool().after_commit(_drop_facet_index)
+    get_pool().after_commit(_drop_price_histories)
+
+
+def _drop_facet_index():
+    global _facet_index, _facet_owned, _facets_generation
+    with _facets_lock:
+        _facets_generation += 1
+        _facet_index = None
+        _facet_owned = {}
+
+
+def _drop_owned_facet():
+    global _facet_owned, _facets_generation
+    with _facets_lock:
+        _facets_generation += 1
+        _facet_owned = {}
+
+
+def _facet_bitsets(conn, owner_id=DEFAULT_OWNER_ID):
+    """The facet index and an owner's owned-card bitset, building whatever a write has dropped."""
+    global _facet_index
+    with _facets_lock:
+        index, owned, generation = _facet_index, _facet_owned.get(owner_id), _facets_generation
+    if index is None:
+        index = facets.build(conn)
+    if owned is None:
+        owned = facets.build_owned(conn, owner_id)
+    with _facets_lock:
+        if generation == _facets_generation:
+            _facet_index = index
+            _facet_owned[owner_id] = owned
+    return index, owned
+
+
+def _drop_price_histories():
+    global _price_histories, _prices_generation
+    with _prices_lock:
+        _prices_generation += 1
+        _price_histories = {}
+
+
+def _drop_holdings():
+    global _holdings, _prices_generation
+    with _prices_lock:
+        _prices_generation += 1
+        _holdings = {}
+
+
+def _valuation_inputs(conn, source, owner_id):
+    """A source's price history and an owner's holdings, building whatever a write has dropped."""
+    if source not in prices.SOURCES:
+        raise ValueError(f"Unknown price source: {source}")
+    with _prices_lock:
+        history, holdings, generation = _price_histories.get(source), _holdings.get(owner_id), _prices_generation
+    if history is None:
+        history = prices.build(conn, source)
+    if holdings is None:
+        holdings = prices.build_holdings(conn, owner_id)
+    with _prices_lock:
+        if generation == _prices_generation:
+            _price_histories[source] = history
+            _holdings[owner_id] = holdings
+    return history, holdings
+
+
+class _RowBatches:
+    """The result of a query as lists of plain tuples, straight from the cursor.
+
+    Takes one of the pool's streaming connections and runs the query as soon
+    as it is created, so a caller learns of a busy pool (PoolTimeout) before it
+    starts a response; the batches can then be read from any thread (a
+    streaming response steps them on app/async_database.py's stream executor).
+    The connection goes back to the pool once the rows run out or on close().
+    """
+
+    def __init__(self, sql, params=(), batch_size=500):
+        self._pool = get_pool()
+        self._batch_size = batch_size
+        self._conn = None
+        self._conn = self._pool.acquire_stream()
+        try:
+            self._cursor = self._conn.cursor()
+            self._cursor.row_factory = None
+            self._cursor.execute(sql, params)
+        except BaseException:
+            self.close()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._conn is None:
+            raise StopIteration
+        rows = self._cursor.fetchmany(self._batch_size)
+        if not rows:
+            self.close()
+            raise StopIteration
+        return rows
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                cursor = getattr(self, "_cursor", None)
+                if cursor is not None:
+                    cursor.close()
+            finally:
+                self._pool.release_stream(conn)
+
+    def __del__(self):
+        self.close()
+
+
+def _iter_batches(sql, params=(), batch_size=500):
+    return _RowBatches(sql, params, batch_size)
+
+
+def _iter_rows(sql, params=(), batch_size=500):
+    # The connection is taken here, not when the rows are first read (see _RowBatches)
+    return _rows(_RowBatches(sql, params, batch_size))
+
+
+def _rows(batches):
+    with closing(batches):
+        for rows in batches:
+            yield from rows
+
+
+def migrate():
+    """Apply any pending schema migrations (see app/migrations.py)."""
+    with write_connection() as conn:
+        return run_migrations(conn)
+
+
+def get_api_client():
+    """Shared PokémonTCG.io client (pooled session, rate limit, retries)."""
+    global _api_client
+    with _pool_lock:
+        if _api_client is None:
+            _api_client = ApiClient()
+        return _api_client
+
+
+def _valid_sets(expansions):
+    """The API sets that can be stored (they have an id and a name); the rest are logged and dropped."""
+    valid = []
+    for exp in expansions:
+        if exp.get("id") and exp.get("name"):
+            valid.append(exp)
+        else:
+            logger.warning("❌ Skipping malformed set: %.80r", exp.get("id") or exp)
+    return valid
+
+
+def _expansion_row(exp):
+    """Map an API set (see _valid_sets) onto an expansions row."""
+    legalities = exp.get("legalities") or {}
+    images = exp.get("images") or {}
+    return (
+        exp["id"], exp["name"], exp.get("series") or "Other", exp.get("printedTotal"), exp.get("total"),
+        legalities.get("unlimited"), legalities.get("standard"), legalities.get("expanded"),
+        exp.get("ptcgoCode"), exp.get("releaseDate") or "", exp.get("updatedAt"),
+        images.get("symbol"), images.get("logo")
     )
-    """)
 
-    # Fetch expansions from API
-    response = requests.get(POKEMON_TCG_API_URL, headers=HEADERS)
-
-    if response.status_code == 200:
-        expansions = response.json().get("data", [])
-
-        if not expansions:
-            print("No expansions found in API response.")
-            return
-
-        # Insert expansions into the database with the new fields
-        cursor.executemany("""
-            INSERT OR IGNORE INTO expansions (
-                id, name, series, printed_total, total, legal_unlimited, legal_standard, legal_expanded, 
-                ptcgo_code, release_date, updated_at, symbol_url, logo_url
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, [
-            (
-                exp["id"], exp["name"], exp["series"], exp.get("printedTotal"), exp.get("total"),
-                exp["legalities"].get("unlimited"), exp["legalities"].get("standard"), exp["legalities"].get("expanded"),
-                exp.get("ptcgoCode"), exp["releaseDate"], exp.get("updatedAt"),
-                exp["images"]["symbol"], exp["images"]["logo"]
-            ) for exp in expansions
-        ])
-        
-        conn.commit()
-        print(f"✔ {len(expansions)} expansions added to database with full details!")
+
+def _parse_hp(value):
+    """The API sends hp as a string ("120"); store it as an integer (None when missing or odd)."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _variant_mask(card):
+    """Bitmask of the VARIANTS an API card is priced in (its tcgplayer.prices keys)."""
+    quotes = (card.get("tcgplayer") or {}).get("prices") or {}
+    mask = 0
+    for name in quotes:
+        code = VARIANT_CODES.get(str(name).lower())
+        if code:
+            mask |= 1 << code
+    return mask
+
+
+def _card_row(card, set_id):
+    """Map an API card onto a cards row; None when it lacks an id, name or number."""
+    if not card.get("id") or not card.get("name") or not card.get("number"):
+        return None
+    return (
+        card["id"], card["name"], set_id, card["number"], card["number"], card.get("rarity"),
+        card.get("supertype"), ",".join(card.get("subtypes") or []), _parse_hp(card.get("hp")),
+        ",".join(card.get("types") or []), card.get("evolvesFrom"), (card.get("images") or {}).get("small"),
+        _variant_mask(card)
+    )
+
+
+def _card_rows(cards, set_id):
+    """Map one set's API cards in a single pass: ``(cards rows, price rows, malformed count)``.
+
+    Malformed cards are skipped and logged. ``cards`` may be a one-shot
+    iterator (a streamed dump file); nothing but the rows is kept.
+    """
+    rows, quotes, skipped = [], [], 0
+    for card in cards:
+        row = _card_row(card, set_id)
+        if row is None:
+            logger.warning("❌ Skipping malformed card in %s: %.80r", set_id, card.get("id") or card)
+            skipped += 1
+            continue
+        rows.append(row)
+        quotes.extend(prices.extract(card, VARIANT_CODES))
+    return rows, quotes, skipped
+
+
+def _write_card_attributes(conn, rows):
+    """Rewrite the card_types / card_subtypes rows of freshly stored card rows (see _card_row)."""
+    ids = [(row[0],) for row in rows]
+    conn.executemany("DELETE FROM card_types WHERE card_id = ?", ids)
+    conn.executemany("DELETE FROM card_subtypes WHERE card_id = ?", ids)
+    conn.executemany("INSERT OR IGNORE INTO card_types (type, card_id) VALUES (?, ?)",
+                     [(value, row[0]) for row in rows for value in row[9].split(",") if value])
+    conn.executemany("INSERT OR IGNORE INTO card_subtypes (subtype, card_id) VALUES (?, ?)",
+                     [(value, row[0]) for row in rows for value in row[7].split(",") if value])
+
+
+def _refresh_stats(conn, set_ids):
+    """Recompute catalogue_stats and every owner's collection_stats for the given expansions.
+
+    Call inside a write transaction.
+    """
+    for set_id in set_ids:
+        conn.execute("DELETE FROM catalogue_stats WHERE expansion_id = ?", (set_id,))
+        conn.execute(REFRESH_CATALOGUE_STATS_SQL, (set_id,))
+        conn.execute("DELETE FROM collection_stats WHERE expansion_id = ?", (set_id,))
+        conn.execute(REFRESH_COLLECTION_STATS_SQL, (set_id,))
+
+
+def _apply_stats_deltas(conn, owner_id, deltas):
+    """Fold one owner's quantity changes into collection_stats (call inside the same write transaction).
+
+    ``deltas`` maps (expansion_id, rarity) to [quantity_delta, collected_delta].
+    """
+    conn.executemany("""
+        INSERT INTO collection_stats (owner_id, expansion_id, rarity, collected_cards, quantity)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(owner_id, expansion_id, rarity) DO UPDATE SET
+            collected_cards = collected_cards + excluded.collected_cards,
+            quantity = quantity + excluded.quantity
+    """, [
+        (owner_id, expansion_id, rarity or "Unknown", collected_delta, quantity_delta)
+        for (expansion_id, rarity), (quantity_delta, collected_delta) in deltas.items()
+        if quantity_delta or collected_delta
+    ])
+
+
+def _expansion_stats(conn, expansion_id, owner_id=DEFAULT_OWNER_ID):
+    """An owner's progress in one expansion, from the materialized stats, ordered like the cards."""
+    stats = conn.execute("""
+        SELECT t.rarity, t.total_cards, COALESCE(s.collected_cards, 0) AS collected_cards
+        FROM catalogue_stats t
+        LEFT JOIN collection_stats s
+            ON s.owner_id = ? AND s.expansion_id = t.expansion_id AND s.rarity = t.rarity
+        WHERE t.expansion_id = ? ORDER BY t.sort_key, t.rarity
+    """, (owner_id, expansion_id)).fetchall()
+
+    total_cards = sum(row["total_cards"] for row in stats)
+    collected_cards = sum(row["collected_cards"] for row in stats)
+    return {
+        "total": f"{collected_cards}/{total_cards}",
+        "rarities": {row["rarity"]: f"{row['collected_cards']}/{row['total_cards']}" for row in stats}
+    }
+
+
+def rebuild_stats():
+    """Recompute every catalogue_stats and collection_stats row from scratch (repair tool)."""
+    with write_connection() as conn:
+        set_ids = [row["id"] for row in conn.execute("SELECT id FROM expansions")]
+        conn.execute("DELETE FROM catalogue_stats")
+        conn.execute("DELETE FROM collection_stats")
+        _refresh_stats(conn, set_ids)
+        _data_changed()
+    logger.info("✔ Collection stats rebuilt for %d expansions", len(set_ids))
+    return len(set_ids)
+
+
+def _content_hash(rows):
+    payload = json.dumps(sorted(rows, key=lambda row: row[0]), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _store_cards(set_id, cards, expansion=None):
+    """Apply one set's fetched cards as a delta, in a single transaction.
+
+    Only new or changed cards are written (UPSERT); cards that disappeared
+    upstream are removed unless they are in the collection. When the set's
+    content hash matches the last sync no card is touched at all. Price
+    changes are appended to price_history either way. ``expansion``
+    (the API's set object) is upserted in the same transaction, so its
+    updated_at only advances once the cards are stored. Cached views are only
+    dropped when a card or expansion row actually changed.
+    Returns {"inserted": n, "updated": n, "removed": n}.
+    """
+    rows, quotes, _ = _card_rows(cards, set_id)
+    content_hash = _content_hash(rows)
+    counts = {"inserted": 0, "updated": 0, "removed": 0}
+
+    with write_connection() as conn:
+        state = conn.execute("SELECT content_hash FROM sync_state WHERE set_id = ?", (set_id,)).fetchone()
+        if state is None or state["content_hash"] != content_hash:
+            stored = {row[0]: tuple(row) for row in conn.execute(STORED_CARDS_SQL, (set_id,))}
+            changed = [row for row in rows if stored.get(row[0]) != row]
+            counts["inserted"] = sum(1 for row in changed if row[0] not in stored)
+            counts["updated"] = len(changed) - counts["inserted"]
+            conn.executemany(UPSERT_CARD_SQL, changed)
+            _write_card_attributes(conn, changed)
+
+            fetched_ids = {row[0] for row in rows}
+            stale = [(card_id,) for card_id in stored if card_id not in fetched_ids]
+            if stale:
+                counts["removed"] = conn.executemany("""
+                    DELETE FROM cards WHERE id = ? AND NOT EXISTS (SELECT 1 FROM collection WHERE card_id = cards.id)
+                """, stale).rowcount
+            if any(counts.values()):
+                _refresh_stats(conn, [set_id])
+                _catalogue_changed()
+
+        # Prices are not part of the content hash: they are recorded on every sync of the set
+        if prices.record(conn, quotes):
+            get_pool().after_commit(_drop_price_histories)
+
+        # The upsert leaves an unchanged expansion alone, so a no-op sync keeps the caches
+        if expansion is not None and conn.execute(UPSERT_EXPANSION_SQL, _expansion_row(expansion)).rowcount:
+            _catalogue_changed()
+        conn.execute("""
+            INSERT INTO sync_state (set_id, status, card_count, content_hash, error, updated_at)
+            VALUES (?, 'done', ?, ?, NULL, datetime('now'))
+            ON CONFLICT(set_id) DO UPDATE SET
+                status = 'done', card_count = excluded.card_count, content_hash = excluded.content_hash,
+                error = NULL, updated_at = excluded.updated_at
+        """, (set_id, len(rows), content_hash))
+    return counts
+
+
+def _mark_sync_state(set_ids, status, error=None):
+    with write_connection() as conn:
+        conn.executemany("""
+            INSERT INTO sync_state (set_id, status, error, updated_at)
+            VALUES (?, ?, ?, datetime('now'))
+            ON CONFLICT(set_id) DO UPDATE SET
+                status = excluded.status, error = excluded.error, updated_at = excluded.updated_at
+        """, [(set_id, status, error) for set_id in set_ids])
+
+
+def sync_cards(set_ids, resume=False, expansions=None, progress=None):
+    """Fetch and store the cards of several sets concurrently.
+
+    Every page of every set is followed and applied as a delta (see _store_cards).
+    Progress is recorded per set in ``sync_state``; with ``resume=True`` sets
+    already marked done are skipped, so an interrupted run picks up where it
+    stopped. ``expansions`` optionally maps set IDs to API set objects that are
+    upserted together with their cards. ``progress(sets_done=, sets_total=,
+    cards_written=, errors=)`` is called after every set; raising from it stops
+    the sync and leaves the remaining sets pending.
+    Returns {"synced": [...], "failed": {set_id: error}, "cards": n,
+             "inserted": n, "updated": n, "removed": n, "changes": {set_id: counts}}.
+    """
+    set_ids = list(set_ids)
+    expansions = expansions or {}
+    if resume:
+        with read_connection() as conn:
+            done = {row["set_id"] for row in conn.execute("SELECT set_id FROM sync_state WHERE status = 'done'")}
+        set_ids = [set_id for set_id in set_ids if set_id not in done]
     else:
-        print(f"❌ Failed to fetch expansions: {response.status_code}")
+        _mark_sync_state(set_ids, "pending")
+
+    client = get_api_client()
+    result = {"synced": [], "failed": {}, "cards": 0, "inserted": 0, "updated": 0, "removed": 0, "changes": {}}
+    sets_done = 0
+
+    def report():
+        if progress is not None:
+            progress(sets_done=sets_done, sets_total=len(set_ids), cards_written=result["cards"],
+                     errors=[{"set_id": set_id, "error": error} for set_id, error in result["failed"].items()])
+
+    report()
+
+    def fetch_and_store(set_id):
+        cards = client.get_cards(set_id)
+        if not cards:
+            return 0, None
+        return len(cards), _store_cards(set_id, cards, expansions.get(set_id))
+
+    with closing(client.map_sets(set_ids, fetch_and_store)) as outcomes:
+        for set_id, outcome, error in outcomes:
+            sets_done += 1
+            if error is not None:
+                result["failed"][set_id] = str(error)
+                _mark_sync_state([set_id], "failed", str(error))
+                logger.error("❌ Failed to fetch cards for %s: %s", set_id, error)
+                report()
+                continue
+
+            count, counts = outcome
+            if not count:
+                result["failed"][set_id] = "No cards found in API response."
+                _mark_sync_state([set_id], "failed", "No cards found in API response.")
+                logger.error("❌ No cards found for expansion %s.", set_id)
+                report()
+                continue
+
+            result["synced"].append(set_id)
+            result["cards"] += count
+            for key in ("inserted", "updated", "removed"):
+                result[key] += counts[key]
+            if any(counts.values()):
+                result["changes"][set_id] = counts
+            logger.info("✔ %d cards synced for expansion %s (%d new, %d updated, %d removed)",
+                        count, set_id, counts["inserted"], counts["updated"], counts["removed"])
+            report()
+    return result
+
+
+def sync_catalogue(delta=True, progress=None):
+    """Refresh expansions and cards from the API.
+
+    With ``delta=True`` only sets whose upstream ``updatedAt`` differs from the
+    stored ``expansions.updated_at`` (or whose last sync did not finish) are
+    re-fetched; everything else costs nothing beyond the one /sets listing.
+    Returns the sync_cards report plus "sets_checked" and "sets_changed".
+    """
+    api_expansions = _valid_sets(get_api_client().get_sets())
 
-    conn.close()
+    with read_connection() as conn:
+        stored = {row["id"]: row["updated_at"] for row in conn.execute("SELECT id, updated_at FROM expansions")}
+        done = {row["set_id"] for row in conn.execute("SELECT set_id FROM sync_state WHERE status = 'done'")}
 
-def fetch_and_store_cards():
-    """Fetch cards for all expansions and store in the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Create the cards table if it doesn't exist
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS cards (
-        id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        expansion_id TEXT NOT NULL,
-        number TEXT NOT NULL,
-        rarity TEXT,
-        supertype TEXT,
-        subtype TEXT,
-        hp TEXT,
-        types TEXT,
-        evolves_from TEXT,
-        image_url TEXT,
-        FOREIGN KEY(expansion_id) REFERENCES expansions(id)
+    if delta:
+        changed = [
+            exp for exp in api_expansions
+            if stored.get(exp["id"]) != exp.get("updatedAt") or exp["id"] not in done
+        ]
+    else:
+        changed = list(api_expansions)
+
+    # Brand-new sets show up in the dropdown right away, even before their cards land
+    new_expansions = [exp for exp in changed if exp["id"] not in stored]
+    if new_expansions:
+        with write_connection() as conn:
+            conn.executemany(INSERT_EXPANSION_SQL, [_expansion_row(exp) for exp in new_expansions])
+            _catalogue_changed()
+        logger.info("✔ %d new expansion(s) added to the database!", len(new_expansions))
+
+    logger.info("⏳ %d of %d expansions changed upstream", len(changed), len(api_expansions))
+    result = sync_cards(
+        [exp["id"] for exp in changed], expansions={exp["id"]: exp for exp in changed}, progress=progress
     )
-    """)
+    with write_connection() as conn:
+        if prices.downsample(conn):
+            get_pool().after_commit(_drop_price_histories)
+    result["sets_checked"] = len(api_expansions)
+    result["sets_changed"] = len(changed)
+    return result
+
+
+def init_db():
+    """Fetch expansions from PokémonTCG.io and store in the database with additional details."""
+    # The schema (tables and indexes) is owned by app/migrations.py
+    migrate()
+
+    # Fetch expansions from API (outside the writer so readers are never blocked on the network)
+    try:
+        expansions = _valid_sets(get_api_client().get_sets())
+    except ApiError as e:
+        logger.error("❌ Failed to fetch expansions: %s", e)
+        return
+
+    if not expansions:
+        logger.warning("No expansions found in API response.")
+        return
+
+    # Insert expansions into the database with the new fields
+    with write_connection() as conn:
+        conn.executemany(INSERT_EXPANSION_SQL, [_expansion_row(exp) for exp in expansions])
+        _catalogue_changed()
+
+    logger.info("✔ %d expansions added to database with full details!", len(expansions))
+
+
+def fetch_and_store_cards(resume=False):
+    """Fetch cards for all expansions and store in the database."""
+    migrate()
 
     # Fetch expansions from the DB
-    expansions = cursor.execute("SELECT id FROM expansions").fetchall()
+    with read_connection() as conn:
+        set_ids = [row["id"] for row in conn.execute("SELECT id FROM expansions")]
+
+    return sync_cards(set_ids, resume=resume)
 
-    for exp in expansions:
-        set_id = exp["id"]
-        response = requests.get(f"https://api.pokemontcg.io/v2/cards?q=set.id:{set_id}", headers=HEADERS)
-
-        if response.status_code == 200:
-            cards = response.json().get("data", [])
-
-            if cards:
-                cursor.executemany("""
-                INSERT OR IGNORE INTO cards (id, name, expansion_id, number, rarity, supertype, subtype, hp, types, evolves_from, image_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, [
-                    (
-                        card["id"], card["name"], card["set"]["id"], card["number"], card.get("rarity"),
-                        card["supertype"], ",".join(card.get("subtypes", [])), card.get("hp"),
-                        ",".join(card.get("types", [])), card.get("evolvesFrom"), card["images"]["small"]
-                    ) for card in cards
-                ])
-
-                conn.commit()
-                print(f"✔ {len(cards)} cards added for expansion {set_id}")
-        else:
-            print(f"❌ Failed to fetch cards for {set_id}: {response.status_code}")
 
-    conn.close()
+def get_expansion_tree():
+    """The current series -> expansions snapshot (built on first use, rebuilt after catalogue writes)."""
+    global _expansion_tree
+    tree = _expansion_tree
+    if tree is None:
+        with read_connection() as conn:
+            tree = _expansion_tree = expansion_tree.build(conn)
+    return tree
+
+
+def _refresh_expansion_tree():
+    global _expansion_tree
+    with read_connection() as conn:
+        tree = expansion_tree.build(conn)
+    _expansion_tree = tree  # one reference swap; readers never see a half-built tree
+
 
 def get_expansions():
-    conn = get_db_connection()
-    expansions = conn.execute("""
-        SELECT * FROM expansions 
-        ORDER BY series DESC, release_date DESC
-    """).fetchall()
-    conn.close()
-    
-    grouped_expansions = {}
-    sorted_series = []
-    
-    for exp in expansions:
-        series = exp["series"]
-        if series not in grouped_expansions:
-            grouped_expansions[series] = []
-            sorted_series.append(series)
-        grouped_expansions[series].append(dict(exp))
-    
-    # Sort the series by the most recent release date in that group
-    sorted_series.sort(key=lambda s: max(e["release_date"] for e in grouped_expansions[s]), reverse=True)
-    
-    return {series: grouped_expansions[series] for series in sorted_series}
-
-def get_cards_by_expansion(set_id):
-    conn = get_db_connection()
-    cards = conn.execute("""
-        SELECT * FROM cards WHERE expansion_id = ? ORDER BY CAST(number AS INTEGER) ASC
-    """, (set_id,)).fetchall()
-    conn.close()
-    return [dict(card) for card in cards]
+    """Expansions grouped by series, newest series first (from the precomputed tree; read-only)."""
+    return get_expansion_tree().grouped
+
+
+# Fields and sort keys of the /expansion/{set_id}/cards listing
+CARD_COLUMNS = {
+    name: name for name in (
+        "id", "name", "expansion_id", "number", "number_int", "rarity", "supertype",
+        "subtype", "hp", "types", "evolves_from", "image_url",
+    )
+}
+CARD_SORTS = {
+    "number": "number_int", "name": "name", "rarity": "COALESCE(rarity, '')",
+    "hp": "COALESCE(hp, 0)", "id": "id",
+}
+
+
+def expansion_has_cards(set_id):
+    with read_connection() as conn:
+        return conn.execute("SELECT 1 FROM cards WHERE expansion_id = ? LIMIT 1", (set_id,)).fetchone() is not None
+
+
+def _card_filters(table, rarity=None, type_=None, subtype=None, supertype=None, hp_min=None, hp_max=None,
+                  series=None, owned=None, owner_id=DEFAULT_OWNER_ID, drive=False):
+    """WHERE clauses and params for the card facet filters, written against ``table``.
+
+    List filters take a single value, a comma-separated string or a list, and match
+    cards having any of the values; ``owned`` keeps only cards in (True) or missing
+    from (False) the collection of ``owner_id``. Type and subtype filters probe the card_types /
+    card_subtypes primary keys per card; with ``drive=True`` they are written as
+    ``id IN (...)`` instead, so SQLite can start from the junction rows when nothing
+    else (like a full-text match) narrows the cards down first.
+    """
+    clauses, params = [], []
+    rarities = split_terms(rarity)
+    if rarities:
+        clauses.append(f"{table}.rarity COLLATE NOCASE IN ({', '.join('?' for _ in rarities)})")
+        params.extend(rarities)
+    for junction, column, value in (("card_types", "type", type_), ("card_subtypes", "subtype", subtype)):
+        terms = split_terms(value)
+        if not terms:
+            continue
+        placeholders = ", ".join("?" for _ in terms)
+        if drive:
+            clauses.append(f"{table}.id IN (SELECT card_id FROM {junction} WHERE {column} IN ({placeholders}))")
+        else:
+            clauses.append(f"EXISTS (SELECT 1 FROM {junction} j WHERE j.{column} IN ({placeholders}) "
+                           f"AND j.card_id = {table}.id)")
+        params.extend(terms)
+    supertypes = split_terms(supertype)
+    if supertypes:
+        clauses.append(f"{table}.supertype COLLATE NOCASE IN ({', '.join('?' for _ in supertypes)})")
+        params.extend(supertypes)
+    if hp_min is not None:
+        clauses.append(f"{table}.hp >= ?")
+        params.append(hp_min)
+    if hp_max is not None:
+        clauses.append(f"{table}.hp <= ?")
+        params.append(hp_max)
+    series_terms = split_terms(series)
+    if series_terms:
+        clauses.append(f"{table}.expansion_id IN (SELECT id FROM expansions "
+                       f"WHERE series COLLATE NOCASE IN ({', '.join('?' for _ in series_terms)}))")
+        params.extend(series_terms)
+    if owned and drive:
+        clauses.append(f"{table}.id IN (SELECT card_id FROM collection WHERE owner_id = ? AND quantity > 0)")
+        params.append(owner_id)
+    elif owned is not None:
+        clauses.append(f"{'' if owned else 'NOT '}EXISTS (SELECT 1 FROM collection col "
+                       f"WHERE col.owner_id = ? AND col.card_id = {table}.id AND col.quantity > 0)")
+        params.append(owner_id)
+    return clauses, params
+
+
+# Facets counted from the bitmap index -> the _card_filters argument filtering on them
+FACET_FILTERS = {"rarity": "rarity", "type": "type_", "supertype": "supertype", "series": "series"}
+
+
+def _facet_counts(conn, match=None, expansion_id=None, **filters):
+    """Facet counts (see app/facets.py) over the cards matching ``match``, ``expansion_id`` and ``filters``.
+
+    Filters on the facets themselves are applied to the bitsets, so each facet can
+    leave out its own; the others narrow the SQL that picks the candidate cards.
+    """
+    selected = {facet: split_terms(filters.pop(name, None)) for facet, name in FACET_FILTERS.items()}
+    selected["owned"] = filters.pop("owned", None)
+    clauses, params = _card_filters("c", drive=match is None, **filters)
+    if match is not None:
+        clauses.insert(0, "c.rowid IN (SELECT rowid FROM cards_fts WHERE cards_fts MATCH ?)")
+        params.insert(0, match)
+    if expansion_id is not None:
+        clauses.insert(0, "c.expansion_id = ?")
+        params.insert(0, expansion_id)
+
+    index, owned = _facet_bitsets(conn, filters.get("owner_id", DEFAULT_OWNER_ID))
+    base = None
+    if clauses:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(f"SELECT c.rowid FROM cards c WHERE {' AND '.join(clauses)}", params)
+        base = facets.bitset(rowid for rowid, in rows)
+    return facets.count(index, owned, base, selected)
+
+
+def get_cards_by_expansion(set_id, fields=None, sort=None, limit=1000, cursor=None, columnar=False, **filters):
+    """One page of an expansion's cards, in card-number order by default.
+
+    ``filters`` are the facet filters of _card_filters (rarity, type_, subtype,
+    supertype, hp_min, hp_max). Returns ``(page, records)`` like get_collection.
+    """
+    clauses, params = _card_filters("cards", **filters)
+    page = Page("cards", ["expansion_id = ?"] + clauses, [set_id] + params, CARD_COLUMNS, CARD_SORTS, "id",
+                fields=fields, sort=sort, default_sort="number", limit=limit, cursor=cursor)
+    rows = _iter_rows(page.sql, page.params)
+    return page, page.values(rows) if columnar else page.records(rows)
 
-if __name__ == "__main__":
-    init_db()
-    fetch_and_store_cards()
-    print("Database initialized with expansions and cards from PokémonTCG.io.")
 
 def fetch_missing_cards():
     """Fetch cards only for expansions that are missing in the cards table."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     # Get expansions that have no cards stored
-    expansions = cursor.execute("""
-        SELECT id FROM expansions 
-        WHERE id NOT IN (SELECT DISTINCT expansion_id FROM cards)
-    """).fetchall()
+    with read_connection() as conn:
+        expansions = conn.execute("""
+            SELECT id FROM expansions
+            WHERE NOT EXISTS (SELECT 1 FROM cards WHERE cards.expansion_id = expansions.id)
+        """).fetchall()
 
     if not expansions:
-        print("✅ All expansions already have cards fetched!")
-        conn.close()
+        logger.info("✅ All expansions already have cards fetched!")
         return
 
-    print(f"⏳ Fetching cards for {len(expansions)} missing expansions...")
-
-    for exp in expansions:
-        set_id = exp["id"]
-        response = requests.get(f"https://api.pokemontcg.io/v2/cards?q=set.id:{set_id}", headers=HEADERS)
-
-        if response.status_code == 200:
-            cards = response.json().get("data", [])
-
-            if cards:
-                cursor.executemany("""
-                INSERT OR IGNORE INTO cards (id, name, expansion_id, number, rarity, supertype, subtype, hp, types, evolves_from, image_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, [
-                    (
-                        card["id"], card["name"], card["set"]["id"], card["number"], card.get("rarity"),
-                        card["supertype"], ",".join(card.get("subtypes", [])), card.get("hp"),
-                        ",".join(card.get("types", [])), card.get("evolvesFrom"), card["images"]["small"]
-                    ) for card in cards
-                ])
-
-                conn.commit()
-                print(f"✔ {len(cards)} cards added for expansion {set_id}")
-        else:
-            print(f"❌ Failed to fetch cards for {set_id}: {response.status_code}")
+    logger.info("⏳ Fetching cards for %d missing expansions...", len(expansions))
+    return sync_cards([exp["id"] for exp in expansions])
 
-    conn.close()
 
-def get_cards_by_name(query, rarity=None, type_=None):
-    """Search for cards by name with optional filtering."""
-    conn = get_db_connection()
-    sql = "SELECT * FROM cards WHERE LOWER(name) LIKE LOWER(?)"
-    params = [f"%{query}%"]
+def get_cards_by_name(query, rarity=None, type_=None, limit=60, cursor=None, with_facets=False, **filters):
+    """Search cards through the FTS5 index with prefix matching and relevance ranking.
 
-    if rarity and rarity.strip():
-        sql += " AND LOWER(COALESCE(rarity, '')) = LOWER(?)"
-        params.append(rarity.strip().lower())
-
-    if type_ and type_.strip():
-        sql += " AND LOWER(COALESCE(types, '')) = LOWER(?)"
-        params.append(type_.strip().lower())  # Direct match for single-type cards
+    ``rarity`` and ``type_`` (plus the other facet filters of _card_filters) accept a
+    single value or a comma-separated list; a card matches the type filter if it has
+    any of the given types. Without a text query the filters alone select the cards,
+    ordered by name. Results are paged with an opaque ``cursor`` (a keyset on rank,
+    name and id); the returned ``next_cursor`` is None on the last page. ``with_facets`` adds the facet counts
+    of all matching cards under "facets".
+    """
+    match = build_match_query(query)
+    clauses, filter_params = _card_filters("c", rarity, type_, drive=match is None, **filters)
+    if match is None and not clauses:
+        return {"cards": [], "next_cursor": None}
+
+    # Keyset paging: the cursor carries the last row's sort key, so a deep page
+    # neither ranks nor returns the rows before it
+    if match is not None:
+        source = "cards_fts JOIN cards c ON c.rowid = cards_fts.rowid"
+        clauses = ["cards_fts MATCH ?"] + clauses
+        params = [match] + filter_params
+        keys = ["cards_fts.rank", "c.name", "c.id"]
+    else:
+        source = "cards c"
+        params = filter_params
+        keys = ["c.name", "c.id"]
+    if cursor:
+        after = cursor_keys(decode_cursor(cursor), len(keys))
+        condition, condition_params = keyset_condition(keys, [False] * len(keys), after)
+        clauses.append(condition)
+        params.extend(condition_params)
+
+    # Fetch one extra row to learn whether another page exists
+    sql = f"""
+        SELECT c.*, {", ".join(f"{key} AS _k{i}" for i, key in enumerate(keys))} FROM {source}
+        WHERE {" AND ".join(clauses)}
+        ORDER BY {", ".join(keys)} LIMIT ?
+    """
+    params.append(limit + 1)
+
+    with read_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+        counts = _facet_counts(conn, match, rarity=rarity, type_=type_, **filters) if with_facets else None
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"after": [rows[-1][f"_k{i}"] for i in range(len(keys))]})
+    cards = []
+    for row in rows:
+        card = dict(row)
+        for i in range(len(keys)):
+            del card[f"_k{i}"]
+        cards.append(card)
+    result = {"cards": cards, "next_cursor": next_cursor}
+    if with_facets:
+        result["facets"] = counts
+    return result
 
-    sql += " ORDER BY name ASC"
-    cards = conn.execute(sql, tuple(params)).fetchall()
-    conn.close()
-    return [dict(card) for card in cards]
 
 def init_collection_table():
     """Ensure the collection table exists and has the necessary columns."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't exist
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS collection (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        card_id TEXT UNIQUE NOT NULL,
-        name TEXT NOT NULL,
-        expansion_id TEXT NOT NULL,
-        number TEXT NOT NULL,
-        rarity TEXT,
-        supertype TEXT,
-        hp TEXT,
-        types TEXT,
-        evolves_from TEXT,
-        image_url TEXT,
-        quantity INTEGER NOT NULL DEFAULT 0,
-        collection_number INTEGER DEFAULT 0,
-        FOREIGN KEY(expansion_id) REFERENCES expansions(id)
-    )
-    """)
+    migrate()
 
-    conn.commit()
-    conn.close()
-    print("✔ Collection table initialized with collection_number column.")
-
-
-
-def get_collection():
-    """Retrieve all cards in the user's collection."""
-    conn = get_db_connection()
-    cards = conn.execute("""
-        SELECT card_id, name, supertype AS type, types AS color, rarity, image_url, quantity
-        FROM collection
-        ORDER BY name ASC
-    """).fetchall()
-    conn.close()
-    return [dict(card) for card in cards]
-
-def get_collection():
-    """Retrieve all cards in the user's collection."""
-    conn = get_db_connection()
-    cards = conn.execute("""
-        SELECT card_id, name, supertype AS type, types AS color, rarity, image_url, quantity
-        FROM collection
-        ORDER BY name ASC
-    """).fetchall()
-    conn.close()
-    return [dict(card) for card in cards]
-
-def get_collection_by_expansion(expansion_id):
-    """Retrieve all cards from a selected expansion, showing collection quantities and stats."""
-    conn = get_db_connection()
-
-    # Fetch all cards from the expansion
-    cards = conn.execute("""
-        SELECT 
-            c.id AS card_id, 
-            c.name, 
-            c.supertype AS type, 
-            c.types AS color, 
-            c.rarity, 
-            c.image_url, 
-            COALESCE(col.quantity, 0) AS quantity,
-            COALESCE(col.collection_number, CAST(c.number AS INTEGER)) AS collection_number
-        FROM cards c
-        LEFT JOIN collection col ON c.id = col.card_id
-        WHERE c.expansion_id = ?
-        ORDER BY collection_number ASC
-    """, (expansion_id,)).fetchall()
-
-    # Convert to list of dicts
-    cards_list = [dict(card) for card in cards]
-
-    # Calculate total collected and breakdown by rarity
-    total_cards = len(cards_list)
-    collected_cards = sum(1 for card in cards_list if card["quantity"] > 0)
-
-    rarity_counts = {}
-    rarity_collected = {}
-
-    for card in cards_list:
-        rarity = card["rarity"] or "Unknown"
-        rarity_counts[rarity] = rarity_counts.get(rarity, 0) + 1
-        if card["quantity"] > 0:
-            rarity_collected[rarity] = rarity_collected.get(rarity, 0) + 1
-
-    conn.close()
+    logger.info("✔ Collection table initialized with collection_number column.")
+
+
+# Fields and sort keys of the /collection/ listing (collection rows joined with their cards)
+COLLECTION_SOURCE = "collection col JOIN cards c ON c.id = col.card_id"
+COLLECTION_COLUMNS = {
+    "card_id": "col.card_id", "name": "c.name", "set_id": "c.expansion_id", "number": "c.number",
+    "rarity": "c.rarity", "type": "c.supertype", "color": "c.types", "hp": "c.hp",
+    "evolves_from": "c.evolves_from", "image_url": "c.image_url", "quantity": "col.quantity",
+    "collection_number": "COALESCE(col.collection_number, c.number_int)",
+}
+COLLECTION_DEFAULT_FIELDS = ["card_id", "name", "type", "color", "rarity", "image_url", "quantity"]
+COLLECTION_SORTS = {
+    "name": "c.name", "card_id": "c.id", "set": "c.expansion_id",
+    "number": "COALESCE(col.collection_number, c.number_int, 0)", "rarity": "COALESCE(c.rarity, '')",
+    "quantity": "col.quantity",
+}
+
+
+def get_collection(fields=None, sort=None, limit=500, cursor=None, columnar=False, owner_id=DEFAULT_OWNER_ID):
+    """One page of an owner's collection, by name unless ``sort`` says otherwise.
+
+    Returns ``(page, records)``: ``records`` streams the rows (dicts, or tuples
+    in ``page.fields`` order when ``columnar``) and ``page.next_cursor`` is set
+    once it is exhausted.
+    """
+    page = Page(COLLECTION_SOURCE, ["col.owner_id = ?"], [owner_id], COLLECTION_COLUMNS, COLLECTION_SORTS, "c.id",
+                fields=fields, sort=sort, default_fields=COLLECTION_DEFAULT_FIELDS,
+                default_sort="name", limit=limit, cursor=cursor)
+    rows = _iter_rows(page.sql, page.params)
+    return page, page.values(rows) if columnar else page.records(rows)
 
-    return {
-        "collection": cards_list,
-        "stats": {
-            "total": f"{collected_cards}/{total_cards}",
-            "rarities": {rarity: f"{rarity_collected.get(rarity, 0)}/{count}" for rarity, count in rarity_counts.items()}
-        }
-    }
 
-def update_card_quantity(card_id, change):
-    """Increase or decrease the quantity of a collected card while preserving collection_number."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if card exists in collection
-    existing_card = cursor.execute(
-        "SELECT quantity, collection_number FROM collection WHERE card_id = ?", (card_id,)
-    ).fetchone()
-
-    if not existing_card:
-        # Fetch card details from cards table to insert a complete row
-        card = cursor.execute(
-            "SELECT id, name, expansion_id, number, rarity, supertype, hp, types, evolves_from, image_url FROM cards WHERE id = ?", (card_id,)
-        ).fetchone()
-
-        if not card:
-            conn.close()
-            return False  # Prevents inserting an unknown card
-
-        # Insert the new card into collection with the correct collection_number
-        cursor.execute(
-            """
-            INSERT INTO collection (card_id, name, expansion_id, number, rarity, supertype, hp, types, evolves_from, image_url, quantity, collection_number)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                card["id"], card["name"], card["expansion_id"], card["number"], card["rarity"],
-                card["supertype"], card["hp"], card["types"], card["evolves_from"], card["image_url"],
-                max(0, change),  # Ensure quantity is non-negative
-                int(card["number"])  # Use card number as default collection number
-            ),
-        )
-        conn.commit()
-        conn.close()
-        return True
-
-    new_quantity = max(0, existing_card["quantity"] + change)
-
-    # Preserve collection_number when updating quantity
-    if new_quantity > 0:
-        cursor.execute(
-            "UPDATE collection SET quantity = ?, collection_number = ? WHERE card_id = ?",
-            (new_quantity, existing_card["collection_number"], card_id),
-        )
+def get_collection_by_expansion(expansion_id, columnar=False, with_facets=False, owner_id=DEFAULT_OWNER_ID):
+    """Retrieve all cards from a selected expansion, showing an owner's quantities and stats.
+
+    ``quantity`` is each card's total; ``variants`` breaks down the copies
+    recorded as a specific variant ({"reverseHolofoil": 2}, or None).
+    With ``columnar`` the cards come as {"columns": [...], "rows": [[...], ...]};
+    ``with_facets`` adds the expansion's facet counts under "facets".
+    """
+    # Fetch all cards from the expansion, as plain tuples
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute("""
+            SELECT
+                c.id AS card_id,
+                c.name,
+                c.supertype AS type,
+                c.types AS color,
+                c.rarity,
+                c.image_url,
+                COALESCE(col.quantity, 0) AS quantity,
+                COALESCE(col.collection_number, c.number_int) AS collection_number
+            FROM cards c
+            LEFT JOIN collection col ON col.owner_id = ? AND col.card_id = c.id
+            WHERE c.expansion_id = ?
+            ORDER BY collection_number ASC
+        """, (owner_id, expansion_id)).fetchall()
+        columns = [column[0] for column in cursor.description] + ["variants"]
+        variants = {}
+        for card_id, variant, quantity in cursor.execute("""
+            SELECT v.card_id, v.variant, v.quantity FROM collection_variants v
+            WHERE v.owner_id = ? AND v.card_id IN (SELECT id FROM cards WHERE expansion_id = ?)
+        """, (owner_id, expansion_id)):
+            variants.setdefault(card_id, {})[VARIANTS[variant]] = quantity
+        rows = [row + (variants.get(row[0]),) for row in rows]
+
+        # Stats come precomputed from collection_stats
+        stats = _expansion_stats(conn, expansion_id, owner_id)
+        counts = _facet_counts(conn, expansion_id=expansion_id, owner_id=owner_id) if with_facets else None
+
+    if columnar:
+        result = {"columns": columns, "rows": rows, "stats": stats}
     else:
-        cursor.execute("DELETE FROM collection WHERE card_id = ?", (card_id,))
+        result = {"collection": [dict(zip(columns, row)) for row in rows], "stats": stats}
+    if with_facets:
+        result["facets"] = counts
+    return result
 
-    conn.commit()
-    conn.close()
-    return True
 
-def update_expansions():
-    """Check for new expansions from PokémonTCG API, update the database, and fetch associated cards for new expansions."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get IDs of current expansions in the database
-    current_ids = {row["id"] for row in cursor.execute("SELECT id FROM expansions")}
-    
-    # Fetch expansions from API
-    response = requests.get(POKEMON_TCG_API_URL, headers=HEADERS)
-    if response.status_code != 200:
-        print(f"❌ Failed to fetch expansions: {response.status_code}")
-        conn.close()
-        return
-    
-    api_expansions = response.json().get("data", [])
-    if not api_expansions:
-        print("No expansions found in API response.")
-        conn.close()
-        return
+def _chunks(items, size=500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
-    # Identify new expansions not present in the DB
-    new_expansions = [exp for exp in api_expansions if exp["id"] not in current_ids]
-    
-    if new_expansions:
-        # Insert new expansions into the database
-        cursor.executemany("""
-            INSERT INTO expansions (
-                id, name, series, printed_total, total, legal_unlimited, legal_standard, legal_expanded, 
-                ptcgo_code, release_date, updated_at, symbol_url, logo_url
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, [
-            (
-                exp["id"],
-                exp["name"],
-                exp["series"],
-                exp.get("printedTotal"),
-                exp.get("total"),
-                exp["legalities"].get("unlimited"),
-                exp["legalities"].get("standard"),
-                exp["legalities"].get("expanded"),
-                exp.get("ptcgoCode"),
-                exp["releaseDate"],
-                exp.get("updatedAt"),
-                exp["images"]["symbol"],
-                exp["images"]["logo"]
+
+def _write_collection_changes(conn, items, owner_id=DEFAULT_OWNER_ID):
+    """Apply quantity changes to an owner's collection on an open write connection.
+
+    Returns one result per item.
+
+    Items may also carry a ``collection_number``, which is stored with the row
+    (without one, the card's own number applies), and a ``variant`` (a VARIANTS
+    name): the change then applies to the copies of that variant, otherwise to
+    the unspecified ones. Either way the card's total moves by the same amount.
+    An absolute ``quantity`` without a variant is the card's new total and
+    clears its variant breakdown.
+    """
+    card_ids = list(dict.fromkeys(item["card_id"] for item in items))
+    results = []
+
+    # Look everything up in batches: the cards (for stats), current totals and variant quantities
+    cards, current, variants = {}, {}, {}
+    for chunk in _chunks(card_ids):
+        placeholders = ", ".join("?" for _ in chunk)
+        for row in conn.execute(f"""
+            SELECT id, expansion_id, rarity, variants FROM cards WHERE id IN ({placeholders})
+        """, chunk):
+            cards[row["id"]] = row
+        for row in conn.execute(f"""
+            SELECT card_id, quantity FROM collection WHERE owner_id = ? AND card_id IN ({placeholders})
+        """, [owner_id] + chunk):
+            current[row["card_id"]] = row["quantity"]
+        for row in conn.execute(f"""
+            SELECT card_id, variant, quantity FROM collection_variants
+            WHERE owner_id = ? AND card_id IN ({placeholders})
+        """, [owner_id] + chunk):
+            variants.setdefault(row["card_id"], {})[row["variant"]] = row["quantity"]
+    original = dict(current)
+    original_variants = {card_id: dict(counts) for card_id, counts in variants.items()}
+    numbers = {}
+
+    for item in items:
+        card_id = item["card_id"]
+        if card_id not in cards:
+            results.append({"card_id": card_id, "ok": False, "error": "Unknown card"})
+            continue
+        code = VARIANT_CODES.get(item["variant"].lower()) if item.get("variant") else 0
+        if code is None:
+            results.append({"card_id": card_id, "ok": False, "error": f"Unknown variant: {item['variant']}"})
+            continue
+        offered = cards[card_id]["variants"]
+        if code and offered and not offered >> code & 1:
+            results.append({"card_id": card_id, "ok": False, "error": f"No {VARIANTS[code]} variant of this card"})
+            continue
+        counts = variants.setdefault(card_id, {})
+        total = current.get(card_id, 0)
+        if item.get("quantity") is not None and not code:
+            # A total without a variant replaces the card's breakdown: every copy becomes unspecified
+            for variant in counts:
+                counts[variant] = 0
+            current[card_id] = max(0, item["quantity"])
+        else:
+            before = counts.get(code, 0) if code else total - sum(counts.values())
+            if item.get("quantity") is not None:
+                after = max(0, item["quantity"])
+            else:
+                after = max(0, before + item.get("change", 0))
+            if code:
+                counts[code] = after
+            current[card_id] = total - before + after
+        if item.get("collection_number") is not None:
+            numbers[card_id] = item["collection_number"]
+        result = {"card_id": card_id, "ok": True, "quantity": current[card_id]}
+        if code:
+            result.update(variant=VARIANTS[code], variant_quantity=after)
+        results.append(result)
+
+    upserts, deletes = [], []
+    deltas = {}
+    for card_id, quantity in current.items():
+        before = original.get(card_id, 0)
+        if quantity == before and card_id in original and card_id not in numbers:
+            continue
+        card = cards[card_id]
+        if quantity > 0:
+            upserts.append((owner_id, card_id, quantity, numbers.get(card_id)))
+        elif card_id in original:
+            deletes.append((owner_id, card_id))
+        delta = deltas.setdefault((card["expansion_id"], card["rarity"] or "Unknown"), [0, 0])
+        delta[0] += quantity - before
+        delta[1] += (quantity > 0) - (before > 0)
+
+    # UPSERT keeps an existing row's collection_number unless a new one was given
+    conn.executemany("""
+        INSERT INTO collection (owner_id, card_id, quantity, collection_number) VALUES (?, ?, ?, ?)
+        ON CONFLICT(owner_id, card_id) DO UPDATE SET
+            quantity = excluded.quantity,
+            collection_number = COALESCE(excluded.collection_number, collection.collection_number)
+    """, upserts)
+    conn.executemany("DELETE FROM collection WHERE owner_id = ? AND card_id = ?", deletes)
+
+    variant_upserts, variant_deletes = [], []
+    for card_id, counts in variants.items():
+        for code, quantity in counts.items():
+            before = original_variants.get(card_id, {}).get(code, 0)
+            if quantity == before:
+                continue
+            if quantity > 0:
+                variant_upserts.append((owner_id, card_id, code, quantity))
+            else:
+                variant_deletes.append((owner_id, card_id, code))
+    conn.executemany("""
+        INSERT INTO collection_variants (owner_id, card_id, variant, quantity) VALUES (?, ?, ?, ?)
+        ON CONFLICT(owner_id, card_id, variant) DO UPDATE SET quantity = excluded.quantity
+    """, variant_upserts)
+    conn.executemany("DELETE FROM collection_variants WHERE owner_id = ? AND card_id = ? AND variant = ?",
+                     variant_deletes)
+
+    _apply_stats_deltas(conn, owner_id, deltas)
+    if upserts or deletes or variant_upserts or variant_deletes:
+        _data_changed()
+    return results
+
+
+def _collection_totals(conn, owner_id=DEFAULT_OWNER_ID):
+    return {
+        "totalCards": conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM collection_stats WHERE owner_id = ?", (owner_id,)
+        ).fetchone()[0],
+        "totalExpansions": conn.execute(
+            "SELECT COUNT(DISTINCT expansion_id) FROM collection_stats WHERE owner_id = ? AND collected_cards > 0",
+            (owner_id,),
+        ).fetchone()[0],
+    }
+
+
+def apply_collection_changes(items, owner_id=DEFAULT_OWNER_ID):
+    """Apply many quantity changes in one transaction.
+
+    Each item is {"card_id": ..., "change": n} (relative) or {"card_id": ...,
+    "quantity": n} (absolute). Items are applied in order, so the same card may
+    appear more than once. Quantities never go below zero, rows that reach zero
+    are removed, and collection_number is preserved. Returns per-item results
+    plus the updated stats of every touched expansion and the widget totals.
+    """
+    with write_connection() as conn:
+        results = _write_collection_changes(conn, items, owner_id)
+        expansion_ids = sorted({
+            row["expansion_id"] for row in conn.execute(
+                "SELECT DISTINCT expansion_id FROM cards WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([result["card_id"] for result in results if result["ok"]]),),
             )
-            for exp in new_expansions
-        ])
-        conn.commit()
-        print(f"✔ {len(new_expansions)} new expansion(s) added to the database!")
-        conn.close()
-
-        # For each new expansion, fetch its associated cards
-        for exp in new_expansions:
-            result = fetch_cards_for_expansion(exp["id"])
-            if result.get("success"):
-                print(f"✔ Cards fetched for expansion {exp['id']}")
+        })
+        stats = {expansion_id: _expansion_stats(conn, expansion_id, owner_id) for expansion_id in expansion_ids}
+        totals = _collection_totals(conn, owner_id)
+
+    return {"results": results, "stats": stats, "totals": totals}
+
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+# Unmatched rows listed in an import report; the count is always exact
+IMPORT_REPORT_LIMIT = 1000
+
+
+def _resolve_set_numbers(conn, rows):
+    """Fill in card_id for rows given as set_id + number, in batched lookups."""
+    wanted = list({(row["set_id"], row["number"]) for row in rows if not row.get("card_id")})
+    found = {}
+    for chunk in _chunks(wanted, 400):
+        values = ", ".join("(?, ?)" for _ in chunk)
+        params = [value for pair in chunk for value in pair]
+        for row in conn.execute(f"""
+            SELECT id, expansion_id, number FROM cards
+            WHERE (expansion_id, number) IN (VALUES {values})
+        """, params):
+            found[(row["expansion_id"], row["number"])] = row["id"]
+    for row in rows:
+        if not row.get("card_id"):
+            row["card_id"] = found.get((row["set_id"], row["number"]))
+
+
+def import_collection(stream, fmt="csv", mode="set", progress=None, owner_id=DEFAULT_OWNER_ID):
+    """Import a CSV or JSON collection file from a binary stream.
+
+    Rows are parsed one at a time and written in chunks of IMPORT_CHUNK_SIZE,
+    each chunk in its own transaction. ``mode="set"`` makes each row's quantity
+    absolute; ``mode="add"`` adds it to what is already collected. A row without
+    a quantity counts as one card. Returns counts plus the rows that could not
+    be matched to a card.
+    """
+    if mode not in ("set", "add"):
+        raise ValueError(f"Unknown import mode: {mode}")
+    report = {"rows": 0, "imported": 0, "unmatched_count": 0, "unmatched": []}
+
+    def reject(line, row, error):
+        report["unmatched_count"] += 1
+        if len(report["unmatched"]) < IMPORT_REPORT_LIMIT:
+            entry = {"line": line, "error": error}
+            if row:
+                entry.update({key: row[key] for key in ("card_id", "set_id", "number") if row.get(key)})
+            report["unmatched"].append(entry)
+
+    def flush(chunk):
+        with write_connection() as conn:
+            _resolve_set_numbers(conn, [row for _, row in chunk])
+            items = []
+            for line, row in chunk:
+                if not row["card_id"]:
+                    reject(line, row, "Unknown card")
+                    continue
+                quantity = row.get("quantity", 1)
+                item = {"card_id": row["card_id"], "collection_number": row.get("collection_number"),
+                        "variant": row.get("variant")}
+                item["quantity" if mode == "set" else "change"] = quantity
+                items.append((line, row, item))
+            results = _write_collection_changes(conn, [item for _, _, item in items], owner_id)
+        for (line, row, _), result in zip(items, results):
+            if result["ok"]:
+                report["imported"] += 1
             else:
-                print(f"❌ Failed to fetch cards for expansion {exp['id']}: {result.get('error')}")
-    else:
-        print("✅ No new expansions to update.")
-        conn.close()
+                reject(line, row, result["error"])
+        if progress:
+            progress(rows=report["rows"], imported=report["imported"], unmatched=report["unmatched_count"])
+
+    chunk = []
+    for line, row, error in collection_io.iter_rows(stream, fmt):
+        report["rows"] += 1
+        if error:
+            reject(line, None, error)
+            continue
+        chunk.append((line, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    report["unmatched"].sort(key=lambda entry: entry["line"])
+    return report
+
+
+def export_collection(fmt="csv", batch_size=1000, owner_id=DEFAULT_OWNER_ID):
+    """Yield the collection as encoded CSV or JSON chunks, straight from the cursor.
+
+    A card with copies recorded as specific variants gets one line per variant,
+    after a line for its unspecified copies (even when there are none), so a
+    ``set`` import rebuilds the same breakdown.
+    """
+    variant_name = "CASE p.variant " + " ".join(
+        f"WHEN {code} THEN '{name}'" for code, name in enumerate(VARIANTS) if name) + " END"
+    # One line per recorded variant plus one for the unspecified rest of each card's total
+    return collection_io.WRITERS[fmt](_iter_batches(f"""
+        SELECT col.card_id, c.expansion_id, c.number, c.name, c.rarity, p.quantity,
+               COALESCE(col.collection_number, c.number_int), {variant_name}
+        FROM (
+            SELECT card_id, variant, quantity FROM collection_variants WHERE owner_id = ?
+            UNION ALL
+            SELECT card_id, 0, quantity - COALESCE((
+                SELECT SUM(v.quantity) FROM collection_variants v
+                WHERE v.owner_id = collection.owner_id AND v.card_id = collection.card_id
+            ), 0) FROM collection WHERE owner_id = ?
+        ) p
+        JOIN collection col ON col.owner_id = ? AND col.card_id = p.card_id
+        JOIN cards c ON c.id = p.card_id
+        WHERE p.quantity > 0 OR p.variant = 0
+        ORDER BY c.expansion_id, c.number_int, p.card_id, p.variant
+    """, (owner_id, owner_id, owner_id), batch_size))
+
+
+def update_card_quantity(card_id, change, owner_id=DEFAULT_OWNER_ID, variant=None):
+    """Increase or decrease the quantity of a collected card (of one variant) while preserving collection_number."""
+    result = apply_collection_changes([{"card_id": card_id, "change": change, "variant": variant}], owner_id)
+    return result["results"][0]["ok"]
+
+
+def get_owner_id(name):
+    """Id of the owner called ``name`` (case-insensitive), or None if there is none."""
+    key = name.lower()
+    if key not in _owner_ids:
+        with read_connection() as conn:
+            row = conn.execute("SELECT id FROM owners WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        _owner_ids[key] = row["id"]
+    return _owner_ids[key]
+
+
+def cached_owner_id(name):
+    """Id of the owner called ``name`` if get_owner_id has already looked it up, else None (no query)."""
+    return _owner_ids.get(name.lower())
+
+
+def list_owners():
+    """Every owner with the number of cards in their collection."""
+    with read_connection() as conn:
+        rows = conn.execute("""
+            SELECT o.name, o.created_at,
+                   (SELECT COALESCE(SUM(s.quantity), 0) FROM collection_stats s WHERE s.owner_id = o.id) AS total_cards
+            FROM owners o ORDER BY o.id
+        """).fetchall()
+    return [dict(row) for row in rows]
+
+
+def create_owner(name):
+    """Add an owner with an empty collection. Raises ValueError for an invalid or taken name."""
+    if not OWNER_NAME_RE.match(name or ""):
+        raise ValueError("Owner names are 1-64 letters, digits, '.', '_' or '-'")
+    try:
+        with write_connection() as conn:
+            owner_id = conn.execute(
+                "INSERT INTO owners (name, created_at) VALUES (?, datetime('now'))", (name,)
+            ).lastrowid
+    except sqlite3.IntegrityError:
+        raise ValueError(f"Owner {name} already exists")
+    _owner_ids[name.lower()] = owner_id
+    logger.info("✔ Owner %s created", name)
+    return {"name": name, "id": owner_id}
+
+
+def delete_owner(name):
+    """Remove an owner and their whole collection. Returns False if there is no such owner."""
+    owner_id = get_owner_id(name)
+    if owner_id is None:
+        return False
+    if owner_id == DEFAULT_OWNER_ID:
+        raise ValueError("The default owner cannot be deleted")
+    with write_connection() as conn:
+        conn.execute("DELETE FROM collection WHERE owner_id = ?", (owner_id,))
+        conn.execute("DELETE FROM collection_variants WHERE owner_id = ?", (owner_id,))
+        conn.execute("DELETE FROM collection_stats WHERE owner_id = ?", (owner_id,))
+        conn.execute("DELETE FROM owners WHERE id = ?", (owner_id,))
+        _data_changed()
+    _owner_ids.pop(name.lower(), None)
+    logger.info("✔ Owner %s deleted", name)
+    return True
+
 
+def update_expansions(progress=None):
+    """Check for new or changed expansions on the PokémonTCG API and sync only those (delta sync)."""
+    try:
+        result = sync_catalogue(delta=True, progress=progress)
+    except ApiError as e:
+        logger.error("❌ Failed to fetch expansions: %s", e)
+        raise
 
-def fetch_cards_for_expansion(expansion_id: str):
+    if not result["sets_changed"]:
+        logger.info("✅ No new expansions to update.")
+    return result
+
+
+def fetch_cards_for_expansion(expansion_id: str, progress=None):
     """Fetch cards for a specific expansion by its ID from the API and store them in the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    response = requests.get(f"https://api.pokemontcg.io/v2/cards?q=set.id:{expansion_id}", headers=HEADERS)
-    if response.status_code != 200:
-        conn.close()
-        print(f"❌ Failed to fetch cards for {expansion_id}: {response.status_code}")
-        return {"success": False, "error": f"API request failed with status code {response.status_code}"}
-    
-    cards = response.json().get("data", [])
+    if progress is not None:
+        progress(sets_done=0, sets_total=1, cards_written=0, errors=[])
+    try:
+        cards = get_api_client().get_cards(expansion_id)
+    except ApiError as e:
+        logger.error("❌ Failed to fetch cards for %s: %s", expansion_id, e)
+        return {"success": False, "error": str(e)}
+
     if not cards:
-        conn.close()
-        print(f"❌ No cards found for expansion {expansion_id}.")
+        logger.error("❌ No cards found for expansion %s.", expansion_id)
         return {"success": False, "error": "No cards found in API response."}
-    
-    cursor.executemany("""
-        INSERT OR IGNORE INTO cards (id, name, expansion_id, number, rarity, supertype, subtype, hp, types, evolves_from, image_url)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, [
-        (
-            card["id"], card["name"], card["set"]["id"], card["number"], card.get("rarity"),
-            card["supertype"], ",".join(card.get("subtypes", [])), card.get("hp"),
-            ",".join(card.get("types", [])), card.get("evolvesFrom"), card["images"]["small"]
-        ) for card in cards
-    ])
-    conn.commit()
-    conn.close()
-    print(f"✔ {len(cards)} cards added for expansion {expansion_id}")
-    return {"success": True, "message": f"{len(cards)} cards added for expansion {expansion_id}"}
 
-#Widget functions
-def get_total_cards_collection() -> int:
+    counts = _store_cards(expansion_id, cards)
+    if progress is not None:
+        progress(sets_done=1, sets_total=1, cards_written=len(cards), errors=[])
+    message = (f"{len(cards)} cards synced for expansion {expansion_id} "
+               f"({counts['inserted']} new, {counts['updated']} updated, {counts['removed']} removed)")
+    logger.info("✔ %s", message)
+    return {"success": True, "message": message, **counts}
+
+
+# Card rows per executemany batch in load_dump
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "10000"))
+
+
+def _load_dump(conn, path):
+    """Upsert every set and card of a local API dump (see app/ingest.py); call inside a write transaction."""
+    counts = {"sets": 0, "cards": 0, "skipped": 0, "prices": 0}
+    set_ids, batch = [], []
+
+    def flush():
+        conn.executemany(UPSERT_CARD_SQL, batch)
+        _write_card_attributes(conn, batch)
+        batch.clear()
+
+    with ingest.deferred_indexes(conn):
+        for exp, cards in ingest.iter_dump(path):
+            if not _valid_sets([exp]):
+                continue
+            rows, quotes, skipped = _card_rows(cards, exp["id"])
+            conn.execute(UPSERT_EXPANSION_SQL, _expansion_row(exp))
+            if rows:
+                # Same hash as a sync would store, so the next sync skips unchanged sets
+                conn.execute("""
+                    INSERT INTO sync_state (set_id, status, card_count, content_hash, error, updated_at)
+                    VALUES (?, 'done', ?, ?, NULL, datetime('now'))
+                    ON CONFLICT(set_id) DO UPDATE SET
+                        status = 'done', card_count = excluded.card_count, content_hash = excluded.content_hash,
+                        error = NULL, updated_at = excluded.updated_at
+                """, (exp["id"], len(rows), _content_hash(rows)))
+            set_ids.append(exp["id"])
+            counts["sets"] += 1
+            counts["cards"] += len(rows)
+            counts["skipped"] += skipped
+            counts["prices"] += prices.record(conn, quotes)
+            batch.extend(rows)
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+
+    _refresh_stats(conn, set_ids)
+    prices.downsample(conn)
+    return counts
+
+
+def load_dump(path, bulk=False, database_path=None):
+    """Load or refresh the catalogue from a local dump of the API, in one transaction.
+
+    Cards are upserted in BULK_BATCH_SIZE batches with the secondary card indexes
+    and full-text triggers dropped, and those are rebuilt once at the end; cards
+    missing from the dump are kept. ``bulk=True`` is for first-time seeding: the
+    load runs on a private connection without journal or fsyncs, so nothing else
+    may have the database open (including this process's pool).
+    Price points are appended to price_history as in a sync.
+    Returns {"sets": n, "cards": n, "skipped": n, "prices": n}.
+    """
+    if bulk:
+        if _pool is not None:
+            raise RuntimeError("Close the connection pool before a bulk load")
+        with ingest.bulk_connection(database_path or DATABASE_PATH) as conn:
+            conn.execute("BEGIN")
+            run_migrations(conn)
+            counts = _load_dump(conn, path)
+            conn.execute("COMMIT")
+    else:
+        migrate()
+        with write_connection() as conn:
+            counts = _load_dump(conn, path)
+            _catalogue_changed()
+    logger.info("✔ %d cards of %d expansions loaded from %s (%d malformed skipped)",
+                counts["cards"], counts["sets"], path, counts["skipped"])
+    return counts
+
+
+# Catalogue tables merged by apply_snapshot, with their columns
+SNAPSHOT_TABLES = {
+    "expansions": ("id", "name", "series", "printed_total", "total", "legal_unlimited", "legal_standard",
+                   "legal_expanded", "ptcgo_code", "release_date", "updated_at", "symbol_url", "logo_url"),
+    "cards": ("id", "name", "expansion_id", "number", "number_int", "rarity", "supertype", "subtype", "hp",
+              "types", "evolves_from", "image_url", "variants"),
+}
+
+
+def snapshot_version(path):
+    """The catalogue version (snapshot build time) of a database file, or None if it has none."""
+    try:
+        with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+            row = conn.execute("SELECT value FROM catalogue_info WHERE key = 'version'").fetchone()
+    except sqlite3.OperationalError:  # missing file, or a database from before snapshots
+        return None
+    return row[0] if row else None
+
+
+def build_snapshot(out_path, dump=None, source_db=None):
+    """Write a ready-to-ship catalogue database (like seed/pokemon.db) to ``out_path``.
+
+    The catalogue comes from a local API dump (``dump``), an existing database
+    (``source_db``, e.g. to re-package the seed after a migration) or, by default,
+    a full crawl of the API. The snapshot has no collection, fresh stats and
+    statistics, and is VACUUMed into a single file stamped with a catalogue
+    version (its build time). It is built beside ``out_path`` and moved into
+    place once complete. Returns the version.
+    """
+    if _pool is not None:
+        raise RuntimeError("Close the connection pool before building a snapshot")
+    building = out_path + ".building"
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(building + suffix):
+            os.remove(building + suffix)
+
+    if dump:
+        load_dump(dump, bulk=True, database_path=building)
+    elif source_db:
+        with closing(sqlite3.connect(f"file:{source_db}?mode=ro", uri=True)) as source, \
+                closing(sqlite3.connect(building)) as target:
+            source.backup(target)
+    else:
+        open_pool(building)
+        try:
+            result = sync_catalogue(delta=False)
+        finally:
+            close_pool()
+        if result["failed"]:
+            raise ApiError(f"{len(result['failed'])} expansions failed to sync; snapshot not written")
+
+    version = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    with closing(connect(building)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        run_migrations(conn)
+        # A snapshot carries the catalogue only
+        for table in ("collection", "collection_variants", "collection_stats", "jobs", "image_cache"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM owners WHERE id != ?", (DEFAULT_OWNER_ID,))
+        _refresh_stats(conn, [row[0] for row in conn.execute("SELECT id FROM expansions")])
+        conn.execute("INSERT OR REPLACE INTO catalogue_info (key, value) VALUES ('version', ?)", (version,))
+        conn.execute("COMMIT")
+
+        conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('optimize')")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute("VACUUM")
+        try:
+            conn.execute("INSERT INTO cards_fts (cards_fts, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError:
+            # VACUUM may renumber the rowids the full-text index is keyed by
+            conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')")
+        conn.execute("ANALYZE")
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if check != "ok":
+        raise RuntimeError(f"Snapshot failed its integrity check: {check}")
+    os.replace(building, out_path)
+    logger.info("✔ Snapshot %s written to %s", version, out_path)
+    return version
+
+
+def _upsert_changed(conn, table):
+    """Copy the rows of ``snapshot.<table>`` that differ from main's; returns the number written."""
+    columns = SNAPSHOT_TABLES[table]
+    names = ", ".join(columns)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+    return conn.execute(f"""
+        INSERT INTO main.{table} ({names})
+        SELECT {names} FROM (SELECT {names} FROM snapshot.{table} EXCEPT SELECT {names} FROM main.{table}) WHERE true
+        ON CONFLICT(id) DO UPDATE SET {updates}
+    """).rowcount
+
+
+def _merge_snapshot(conn):
+    counts = {"inserted": conn.execute("""
+        SELECT COUNT(*) FROM snapshot.cards s WHERE NOT EXISTS (SELECT 1 FROM main.cards c WHERE c.id = s.id)
+    """).fetchone()[0]}
+    _upsert_changed(conn, "expansions")
+    counts["updated"] = _upsert_changed(conn, "cards") - counts["inserted"]
+    # Like a sync: cards gone from the snapshot's expansions go too, unless collected
+    counts["removed"] = conn.execute("""
+        DELETE FROM main.cards
+        WHERE expansion_id IN (SELECT id FROM snapshot.expansions)
+          AND id NOT IN (SELECT id FROM snapshot.cards)
+          AND id NOT IN (SELECT card_id FROM main.collection)
+    """).rowcount
+    for table, column in (("card_types", "type"), ("card_subtypes", "subtype")):
+        conn.execute(f"DELETE FROM main.{table} WHERE card_id IN (SELECT id FROM snapshot.cards)")
+        conn.execute(f"INSERT OR IGNORE INTO main.{table} ({column}, card_id) SELECT {column}, card_id "
+                     f"FROM snapshot.{table}")
+    conn.execute("""
+        INSERT OR REPLACE INTO main.sync_state (set_id, status, card_count, content_hash, error, updated_at)
+        SELECT set_id, status, card_count, content_hash, error, updated_at FROM snapshot.sync_state
+    """)
+    conn.execute("INSERT OR REPLACE INTO main.catalogue_info (key, value) "
+                 "SELECT key, value FROM snapshot.catalogue_info")
+    # Price history is append-only, so points already here win
+    counts["prices"] = conn.execute("""
+        INSERT OR IGNORE INTO main.price_history (card_id, source, variant, day, price)
+        SELECT card_id, source, variant, day, price FROM snapshot.price_history
+        WHERE card_id IN (SELECT id FROM main.cards)
+    """).rowcount
+    _refresh_stats(conn, [row[0] for row in conn.execute("SELECT id FROM main.expansions")])
+    return counts
+
+
+def apply_snapshot(path, if_newer=False, database_path=None):
+    """Merge a snapshot's catalogue into the database, leaving the collection untouched.
+
+    Changed expansions and cards are upserted, card types and subtypes replaced,
+    and cards of the snapshot's expansions that it no longer has are removed
+    unless collected. sync_state comes along, so the next delta sync only fetches
+    what changed after the snapshot was built, and its price points are added.
+    With ``if_newer`` nothing happens unless the snapshot's catalogue version is
+    newer than the database's.
+    Returns {"applied": bool, "version": ..., "inserted": n, "updated": n, "removed": n, "prices": n}.
+    """
+    target = database_path or (_pool.path if _pool is not None else DATABASE_PATH)
+    version, current = snapshot_version(path), snapshot_version(target)
+    if if_newer and (version is None or (current is not None and current >= version)):
+        return {"applied": False, "version": current}
+
+    with closing(connect(target)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        run_migrations(conn)
+        conn.execute("COMMIT")
+        conn.execute("ATTACH DATABASE ? AS snapshot", (path,))
+        try:
+            schema = conn.execute("SELECT MAX(version) FROM snapshot.schema_version").fetchone()[0]
+            if schema != MIGRATIONS[-1][0]:
+                raise ValueError(f"Snapshot has schema version {schema}, this app needs {MIGRATIONS[-1][0]}; "
+                                 "rebuild it with build-snapshot")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                counts = _merge_snapshot(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE snapshot")
+
+    if _pool is not None:
+        # Written outside the pool, so drop what the pool's commit hooks would have
+        cache.responses.bump()
+        _refresh_expansion_tree()
+        _drop_facet_index()
+        _drop_price_histories()
+    logger.info("✔ Snapshot %s applied: %d cards new, %d updated, %d removed",
+                version, counts["inserted"], counts["updated"], counts["removed"])
+    return {"applied": True, "version": version, **counts}
+
+
+# Collection valuation (app/prices.py): all three price every owned copy in one vectorized pass
+def get_collection_value(owner_id=DEFAULT_OWNER_ID, source="tcgplayer", days=30):
+    """An owner's collection value today and ``days`` ago, at the source's market prices.
+
+    Copies of a variant without a price of their own are valued at the card's
+    first priced variant; copies of cards without any price are counted apart.
+    """
+    today = prices.day_number()
+    with read_connection() as conn:
+        history, holdings = _valuation_inputs(conn, source, owner_id)
+    current = prices.value(history, holdings, today)
+    before = prices.value(history, holdings, today - days)
+    return {
+        "source": source, "currency": prices.CURRENCIES[source], "as_of": prices.day_date(today),
+        **current,
+        "change": {"days": days, "value": before["value"], "delta": round(current["value"] - before["value"], 2)},
+    }
+
+
+def get_collection_value_by_expansion(owner_id=DEFAULT_OWNER_ID, source="tcgplayer"):
+    """An owner's collection value per expansion, most valuable first."""
+    today = prices.day_number()
+    with read_connection() as conn:
+        history, holdings = _valuation_inputs(conn, source, owner_id)
+    return {
+        "source": source, "currency": prices.CURRENCIES[source], "as_of": prices.day_date(today),
+        "expansions": prices.value_by_expansion(history, holdings, today),
+    }
+
+
+def get_collection_movers(owner_id=DEFAULT_OWNER_ID, source="tcgplayer", days=7, limit=10):
+    """The owned cards (by variant) whose holding value rose or fell the most over ``days``."""
+    today = prices.day_number()
+    with read_connection() as conn:
+        history, holdings = _valuation_inputs(conn, source, owner_id)
+        found = prices.movers(history, holdings, today, days, limit)
+        card_ids = [history.card_ids[holdings.rowids[i]] for entries in found.values() for i, *_ in entries]
+        names = {
+            row["id"]: row["name"] for row in conn.execute(
+                "SELECT id, name FROM cards WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(card_ids),)
+            )
+        }
+
+    def entry(i, then, now, change):
+        card_id = history.card_ids[holdings.rowids[i]]
+        return {
+            "card_id": card_id, "name": names.get(card_id), "variant": VARIANTS[holdings.variants[i]],
+            "quantity": int(holdings.quantities[i]), "price_then": round(then, 2), "price": round(now, 2),
+            "change": round(change, 2), "change_pct": round((now - then) / then * 100, 1),
+        }
+
+    return {
+        "source": source, "currency": prices.CURRENCIES[source], "as_of": prices.day_date(today), "days": days,
+        **{side: [entry(*item) for item in items] for side, items in found.items()},
+    }
+
+
+# Widget functions (all read the materialized collection_stats table)
+def get_total_cards_collection(owner_id: int = DEFAULT_OWNER_ID) -> int:
     """
-    Returns the total number of cards in the user's collection.
-    This sums up the "quantity" field in the collection table.
+    Returns the total number of cards in an owner's collection.
+    This sums up the "quantity" field of the collection stats.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(quantity) FROM collection")
-    result = cursor.fetchone()[0]
-    conn.close()
+    with read_connection() as conn:
+        result = conn.execute(
+            "SELECT SUM(quantity) FROM collection_stats WHERE owner_id = ?", (owner_id,)
+        ).fetchone()[0]
     # If there are no cards, return 0
     return result if result is not None else 0
 
-def get_total_expansions_collection() -> int:
+
+def get_total_expansions_collection(owner_id: int = DEFAULT_OWNER_ID) -> int:
     """
-    Returns the number of expansions in which the user has collected at least one card.
-    This counts distinct expansion_id values from the collection table where quantity > 0.
+    Returns the number of expansions in which an owner has collected at least one card.
+    This counts distinct expansions with collected cards in the collection stats.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(DISTINCT expansion_id) FROM collection WHERE quantity > 0")
-    result = cursor.fetchone()[0]
-    conn.close()
+    with read_connection() as conn:
+        result = conn.execute(
+            "SELECT COUNT(DISTINCT expansion_id) FROM collection_stats WHERE owner_id = ? AND collected_cards > 0",
+            (owner_id,),
+        ).fetchone()[0]
     return result if result is not None else 0
 
-def get_cards_by_expansion_collection() -> List[Dict[str, int]]:
+
+def get_cards_by_expansion_collection(owner_id: int = DEFAULT_OWNER_ID) -> List[Dict[str, int]]:
     """
     Returns a breakdown of the total cards collected grouped by expansion.
-    It joins the collection table with the expansions table to get the expansion names.
+    It joins the collection stats with the expansions table to get the expansion names.
     Output format: [{"expansionName": "Base Set", "cardCount": 42}, ...]
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT e.name AS expansionName, SUM(c.quantity) AS cardCount
-        FROM collection c
-        JOIN expansions e ON c.expansion_id = e.id
-        WHERE c.quantity > 0
-        GROUP BY c.expansion_id
-    """)
-    results = cursor.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        results = conn.execute("""
+            SELECT e.name AS expansionName, SUM(s.quantity) AS cardCount
+            FROM collection_stats s
+            JOIN expansions e ON s.expansion_id = e.id
+            WHERE s.owner_id = ? AND s.quantity > 0
+            GROUP BY s.expansion_id
+        """, (owner_id,)).fetchall()
     return [{"expansionName": row["expansionName"], "cardCount": row["cardCount"]} for row in results]
 
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or refresh the card database from PokémonTCG.io.")
+    parser.add_argument("--resume", action="store_true", help="skip sets already synced by an interrupted run")
+    parser.add_argument("--delta", action="store_true", help="only re-fetch sets whose upstream updatedAt changed")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("rebuild-stats", help="recompute the materialized collection stats")
+    import_parser = commands.add_parser("import-collection", help="import a CSV or JSON collection file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=collection_io.FORMATS, help="default: from the file extension")
+    import_parser.add_argument("--mode", choices=("set", "add"), default="set",
+                               help="set quantities (default) or add them to the current collection")
+    import_parser.add_argument("--owner", default=DEFAULT_OWNER, help="whose collection to import into")
+    export_parser = commands.add_parser("export-collection", help="export the collection as CSV or JSON")
+    export_parser.add_argument("file", nargs="?", help="default: standard output")
+    export_parser.add_argument("--format", choices=collection_io.FORMATS, default="csv")
+    export_parser.add_argument("--owner", default=DEFAULT_OWNER, help="whose collection to export")
+    commands.add_parser("prefetch-images", help="download every card and expansion image not cached yet")
+    dump_parser = commands.add_parser("load-dump", help="load the catalogue from a local pokemon-tcg-data checkout")
+    dump_parser.add_argument("path", help="directory holding sets/en.json and cards/en/<set_id>.json")
+    dump_parser.add_argument("--bulk", action="store_true",
+                             help="first-time seeding: no journal or fsyncs (the app must not be running)")
+    build_parser = commands.add_parser("build-snapshot", help="build a VACUUMed, ANALYZEd catalogue database")
+    build_parser.add_argument("file", help="where to write the snapshot, e.g. seed/pokemon.db")
+    source = build_parser.add_mutually_exclusive_group()
+    source.add_argument("--dump", help="build from a local pokemon-tcg-data checkout instead of the API")
+    source.add_argument("--from-db", help="re-package the catalogue of an existing database")
+    apply_parser = commands.add_parser("apply-snapshot", help="merge a snapshot's catalogue, keeping the collection")
+    apply_parser.add_argument("file")
+    apply_parser.add_argument("--if-newer", action="store_true",
+                              help="skip unless the snapshot is newer than the database's catalogue")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    owner_id = get_owner_id(args.owner) if getattr(args, "owner", None) else None
+    if getattr(args, "owner", None) and owner_id is None:
+        parser.error(f"unknown owner: {args.owner}")
+
+    if args.command == "rebuild-stats":
+        rebuild_stats()
+    elif args.command == "import-collection":
+        import sys
+        import time
+
+        fmt = args.format or ("json" if args.file.lower().endswith((".json", ".jsonl", ".ndjson")) else "csv")
+        started = time.monotonic()
+        with open(args.file, "rb") as f:
+            report = import_collection(f, fmt, args.mode, owner_id=owner_id)
+        print(f"✅ Imported {report['imported']}/{report['rows']} rows in {time.monotonic() - started:.1f}s")
+        for entry in report["unmatched"]:
+            print(f"❌ Line {entry['line']}: {entry['error']} {entry.get('card_id') or entry.get('set_id', '')} "
+                  f"{entry.get('number', '')}".rstrip(), file=sys.stderr)
+        if report["unmatched_count"] > len(report["unmatched"]):
+            more = report["unmatched_count"] - len(report["unmatched"])
+            print(f"❌ ... and {more} more unmatched rows", file=sys.stderr)
+    elif args.command == "load-dump":
+        import time
+
+        started = time.monotonic()
+        counts = load_dump(args.path, bulk=args.bulk)
+        print(f"✅ Loaded {counts['cards']} cards of {counts['sets']} expansions and {counts['prices']} price points "
+              f"in {time.monotonic() - started:.1f}s")
+    elif args.command == "build-snapshot":
+        version = build_snapshot(args.file, dump=args.dump, source_db=args.from_db)
+        print(f"✅ Snapshot {version} written to {args.file}")
+    elif args.command == "apply-snapshot":
+        report = apply_snapshot(args.file, if_newer=args.if_newer)
+        if report["applied"]:
+            print(f"✅ Snapshot {report['version']} applied: {report['inserted']} cards new, "
+                  f"{report['updated']} updated, {report['removed']} removed")
+        else:
+            print(f"Catalogue {report['version']} is up to date")
+    elif args.command == "prefetch-images":
+        from app import images
+
+        images.prefetch()
+    elif args.command == "export-collection":
+        import sys
+
+        out = open(args.file, "wb") if args.file else sys.stdout.buffer
+        try:
+            for chunk in export_collection(args.format, owner_id=owner_id):
+                out.write(chunk)
+        finally:
+            if args.file:
+                out.close()
+    elif args.delta:
+        report = sync_catalogue(delta=True)
+        print(f"Delta sync: {report['sets_changed']}/{report['sets_checked']} sets changed, "
+              f"{report['inserted']} cards inserted, {report['updated']} updated, {report['removed']} removed.")
+    else:
+        init_db()
+        fetch_and_store_cards(resume=args.resume)
+        print("Database initialized with expansions and cards from PokémonTCG.io.")
@@ -0,0 +1,49 @@
+"""Precomputed series -> expansion tree behind GET /expansions/.
+
+``build`` reads the catalogue once and returns an immutable ``Snapshot``:
+series ordered by their latest release, each with its expansions (newest
+first) annotated with card counts. app/database.py keeps
+the current snapshot and swaps in a new one after each catalogue write
+commits, so readers see either the old tree or the new one, never a mix.
+"""
+import hashlib
+
+
+class Snapshot:
+    """One version of the tree. Treat ``grouped`` and ``series`` as read-only."""
+
+    __slots__ = ("grouped", "series", "_encoded")
+
+    def __init__(self, grouped, series):
+        self.grouped = grouped
+        self.series = series
+        self._encoded = None
+
+    def encoded(self, dumps):
+        """``(body, etag)`` of the /expansions/ response, serialized once per snapshot."""
+        if self._encoded is None:
+            body = dumps({"expansions": self.grouped, "series": self.series})
+            self._encoded = (body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        return self._encoded
+
+
+def build(conn):
+    card_counts = dict(conn.execute("SELECT expansion_id, COUNT(*) FROM cards GROUP BY expansion_id").fetchall())
+    grouped = {}
+    for row in conn.execute("SELECT * FROM expansions ORDER BY release_date DESC, id"):
+        expansion = dict(row)
+        expansion["card_count"] = card_counts.get(row["id"], 0)
+        grouped.setdefault(row["series"], []).append(expansion)
+
+    # Expansions arrive newest first, so each group's first entry is its latest release
+    order = sorted(grouped, key=lambda name: (grouped[name][0]["release_date"], name), reverse=True)
+    series = [
+        {
+            "name": name,
+            "latest_release": grouped[name][0]["release_date"],
+            "expansion_count": len(grouped[name]),
+            "card_count": sum(expansion["card_count"] for expansion in grouped[name]),
+        }
+        for name in order
+    ]
+    return Snapshot({name: grouped[name] for name in order}, series)
@@ -0,0 +1,118 @@
+"""Facet counts for the search and collection filter UIs, from an in-memory bitmap index.
+
+Every facet value (a rarity, a type, a series, ...) maps to the set of cards
+having it, stored as a bitset over ``cards.rowid`` in a Python int. Counting
+how many of the current results carry each value is then one AND plus
+``bit_count()`` per value, so all facets come out of a single pass however many
+options the UI lists. Counts are disjunctive: a facet's own selection is left
+out when counting that facet, so the UI can show what picking another value
+would give. app/database.py builds the index lazily and drops it after writes
+commit.
+"""
+
+# Facets served from the index; "owned" (owned/missing) comes from the collection
+FACETS = ("rarity", "type", "supertype", "series")
+
+
+class Index:
+    """Catalogue bitsets. Treat as read-only; a catalogue write replaces the whole index."""
+
+    __slots__ = ("all", "values")
+
+    def __init__(self, all_cards, values):
+        self.all = all_cards
+        self.values = values  # facet -> {value: bitset}
+
+
+def _set_bit(bits, rowid):
+    bits[rowid >> 3] |= 1 << (rowid & 7)
+
+
+def bitset(rowids, size=None):
+    """Bitset of an iterable of rowids (``size`` in bytes, or grown as needed)."""
+    bits = bytearray(size or 0)
+    for rowid in rowids:
+        if rowid >> 3 >= len(bits):
+            bits.extend(bytes((rowid >> 3) - len(bits) + 1))
+        _set_bit(bits, rowid)
+    return int.from_bytes(bits, "little")
+
+
+def build(conn):
+    size = ((conn.execute("SELECT MAX(rowid) FROM cards").fetchone()[0] or 0) >> 3) + 1
+    everything = bytearray(size)
+    builders = {facet: {} for facet in FACETS}
+
+    def add(facet, value, rowid):
+        if value:
+            bits = builders[facet].get(value)
+            if bits is None:
+                bits = builders[facet][value] = bytearray(size)
+            _set_bit(bits, rowid)
+
+    for rowid, rarity, supertype, series in conn.execute("""
+        SELECT c.rowid, c.rarity, c.supertype, e.series FROM cards c LEFT JOIN expansions e ON e.id = c.expansion_id
+    """):
+        _set_bit(everything, rowid)
+        add("rarity", rarity, rowid)
+        add("supertype", supertype, rowid)
+        add("series", series, rowid)
+    for rowid, type_ in conn.execute("SELECT c.rowid, t.type FROM card_types t JOIN cards c ON c.id = t.card_id"):
+        add("type", type_, rowid)
+
+    values = {
+        facet: {value: int.from_bytes(bits, "little") for value, bits in by_value.items()}
+        for facet, by_value in builders.items()
+    }
+    return Index(int.from_bytes(everything, "little"), values)
+
+
+def build_owned(conn, owner_id):
+    return bitset(row[0] for row in conn.execute("""
+        SELECT c.rowid FROM collection col JOIN cards c ON c.id = col.card_id
+        WHERE col.owner_id = ? AND col.quantity > 0
+    """, (owner_id,)))
+
+
+def _selection(index, facet, selected):
+    """Bitset of the cards matching any selected value of ``facet`` (case-insensitive), or None."""
+    if not selected:
+        return None
+    wanted = {value.lower() for value in selected}
+    bits = 0
+    for value, value_bits in index.values[facet].items():
+        if value.lower() in wanted:
+            bits |= value_bits
+    return bits
+
+
+def count(index, owned, base=None, selected=None):
+    """Facet counts over ``base`` (a bitset of candidate cards; None means the whole catalogue).
+
+    ``selected`` maps facet names to the values filtered on, plus ``"owned"`` to
+    True/False. Returns {"rarity": {"Common": 120, ...}, ..., "owned": {"owned": n, "missing": n}},
+    each facet ordered by count, without values that count zero.
+    """
+    selected = selected or {}
+    base = index.all if base is None else base & index.all
+    filters = {facet: _selection(index, facet, selected.get(facet)) for facet in FACETS}
+    owned_filter = selected.get("owned")
+    if owned_filter is not None:
+        filters["owned"] = owned if owned_filter else index.all & ~owned
+
+    def narrowed(skip):
+        bits = base
+        for facet, facet_bits in filters.items():
+            if facet != skip and facet_bits is not None:
+                bits &= facet_bits
+        return bits
+
+    result = {}
+    for facet in FACETS:
+        bits = narrowed(facet)
+        counts = ((value, (bits & value_bits).bit_count()) for value, value_bits in index.values[facet].items())
+        result[facet] = dict(sorted(((v, n) for v, n in counts if n), key=lambda item: (-item[1], item[0])))
+    bits = narrowed("owned")
+    owned_count = (bits & owned).bit_count()
+    result["owned"] = {"owned": owned_count, "missing": bits.bit_count() - owned_count}
+    return result
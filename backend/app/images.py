@@ -0,0 +1,405 @@
+"""Local cache of card and expansion images.
+
+Originals are downloaded from the upstream CDN into a content-addressed store
+on the data volume (``originals/ab/<sha256>.png`` under IMAGE_CACHE_DIR), and
+thumbnails are generated next to them (``thumbs/<size>/ab/<sha256>.webp``)
+when Pillow is installed. The ``image_cache`` table maps each card id, or
+``<set_id>/symbol`` / ``<set_id>/logo``, to its file. The total size is capped
+at IMAGE_CACHE_MB by evicting the least recently served images, after a
+prefetch and whenever on-demand downloads would take the cache past it.
+Images being served are pinned, and eviction leaves their files alone.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import app.database as db
+from app import metrics
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - thumbnails are optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(db.DATABASE_PATH)), "images"
+)
+IMAGE_CACHE_MB = float(os.getenv("IMAGE_CACHE_MB", "2048"))
+IMAGE_PREFETCH = os.getenv("IMAGE_PREFETCH", "1") != "0"
+IMAGE_PREFETCH_WORKERS = int(os.getenv("IMAGE_PREFETCH_WORKERS", "8"))
+IMAGE_TIMEOUT = (5, 30)
+
+# Thumbnail widths in pixels; "original" is the downloaded file itself
+SIZES = {"thumb": 120, "medium": 200}
+EXPANSION_IMAGES = ("symbol", "logo")
+# last_access is written back at most this often per image (seconds)
+TOUCH_INTERVAL = 3600
+# Eviction frees space down to this fraction of the quota, so it does not run on every fetch
+EVICT_TARGET = 0.9
+
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+
+_session = None
+_session_lock = threading.Lock()
+_touches = {}
+_touches_lock = threading.Lock()
+# Bytes the cache held after its last quota check, plus downloads since; None until the first check
+_cache_bytes = None
+_quota_lock = threading.Lock()
+# sha256 -> number of responses currently serving that file
+_pinned = Counter()
+_pinned_lock = threading.Lock()
+
+
+class ImageError(Exception):
+    pass
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(IMAGE_PREFETCH_WORKERS, 1))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def original_path(image):
+    sha = image["sha256"]
+    return os.path.join(IMAGE_CACHE_DIR, "originals", sha[:2], f"{sha}.{image['ext']}")
+
+
+def thumb_path(image, size):
+    sha = image["sha256"]
+    return os.path.join(IMAGE_CACHE_DIR, "thumbs", size, sha[:2], f"{sha}.webp")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _make_thumb(image, size):
+    """Render one thumbnail. Returns its size in bytes, or 0 without Pillow."""
+    if Image is None:
+        return 0
+    path = thumb_path(image, size)
+    width = SIZES[size]
+    with Image.open(original_path(image)) as img:
+        img = img.convert("RGBA")
+        img.thumbnail((width, width * 2))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            img.save(tmp, "WEBP", quality=80, method=4)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return os.path.getsize(path)
+
+
+def download(key, url):
+    """Download one image into the store and render its thumbnails. Returns the image_cache row."""
+    started = time.perf_counter()
+    try:
+        response = _get_session().get(url, timeout=IMAGE_TIMEOUT)
+    except requests.RequestException as e:
+        metrics.upstream_request_seconds.observe(time.perf_counter() - started, "images")
+        metrics.upstream_errors.inc("images")
+        raise ImageError(f"Failed to download {url}: {e}")
+    metrics.upstream_request_seconds.observe(time.perf_counter() - started, "images")
+    metrics.upstream_responses.inc("images", str(response.status_code))
+    if response.status_code != 200 or not response.headers.get("content-type", "image/").startswith("image/"):
+        raise ImageError(f"Failed to download {url}: status {response.status_code}")
+
+    data = response.content
+    ext = os.path.splitext(urlparse(url).path)[1].lstrip(".").lower()
+    image = {"sha256": hashlib.sha256(data).hexdigest(), "ext": ext if ext in MEDIA_TYPES else "png"}
+    path = original_path(image)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    total = len(data)
+    for size in SIZES:
+        try:
+            total += _make_thumb(image, size)
+        except OSError as e:
+            logger.error("❌ Could not render %s thumbnail for %s: %s", size, key, e)
+    return {
+        "key": key, "url": url, **image, "bytes": total,
+        "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "last_access": int(time.time()),
+    }
+
+
+def _record(images):
+    with db.write_connection() as conn:
+        conn.executemany("""
+            INSERT INTO image_cache (key, url, sha256, ext, bytes, fetched_at, last_access)
+            VALUES (:key, :url, :sha256, :ext, :bytes, :fetched_at, :last_access)
+            ON CONFLICT(key) DO UPDATE SET
+                url = excluded.url, sha256 = excluded.sha256, ext = excluded.ext, bytes = excluded.bytes,
+                fetched_at = excluded.fetched_at, last_access = excluded.last_access
+        """, images)
+
+
+def source_url(key):
+    """Upstream URL of a card image or expansion symbol/logo, or None if unknown."""
+    with db.read_connection() as conn:
+        if "/" in key:
+            set_id, kind = key.rsplit("/", 1)
+            if kind not in EXPANSION_IMAGES:
+                return None
+            row = conn.execute(f"SELECT {kind}_url FROM expansions WHERE id = ?", (set_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT image_url FROM cards WHERE id = ?", (key,)).fetchone()
+    return row[0] if row and row[0] else None
+
+
+def lookup(key):
+    with db.read_connection() as conn:
+        row = conn.execute("SELECT * FROM image_cache WHERE key = ?", (key,)).fetchone()
+    return dict(row) if row else None
+
+
+def fetch(key):
+    """Download and record a single image on demand, keeping the cache within its quota.
+
+    Returns the row pinned (see checkout), or None if the key is unknown.
+    """
+    url = source_url(key)
+    if url is None:
+        return None
+    image = download(key, url)
+    _record([image])
+    pin(image)
+    _note_written(image["bytes"])
+    return image
+
+
+def checkout(key):
+    """The cached row of ``key``, pinned so eviction keeps its files until release(); None if not cached."""
+    image = lookup(key)
+    if image is None:
+        return None
+    pin(image)
+    if os.path.exists(original_path(image)):
+        return image
+    release(image)
+    return None
+
+
+def pin(image):
+    with _pinned_lock:
+        _pinned[image["sha256"]] += 1
+
+
+def release(image):
+    """Unpin an image returned by checkout() or fetch(). Does no I/O, so it is safe on the event loop."""
+    with _pinned_lock:
+        _pinned[image["sha256"]] -= 1
+        if _pinned[image["sha256"]] <= 0:
+            del _pinned[image["sha256"]]
+
+
+def _note_written(nbytes):
+    """Count an on-demand download; evict once the cache may have outgrown its quota.
+
+    A running total saves a quota check on every download: eviction frees down
+    to EVICT_TARGET, so checks run about once per tenth of the quota downloaded.
+    """
+    global _cache_bytes
+    with _quota_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += nbytes
+            if _cache_bytes <= IMAGE_CACHE_MB * 1024 * 1024:
+                return
+    enforce_quota()
+
+
+def file_for(image, size):
+    """Path and media type to serve for ``size``, rendering a missing thumbnail on the way."""
+    if size in SIZES and Image is not None:
+        path = thumb_path(image, size)
+        if not os.path.exists(path):
+            try:
+                _make_thumb(image, size)
+            except OSError:
+                path = None
+        if path and os.path.exists(path):
+            return path, "image/webp"
+    return original_path(image), MEDIA_TYPES.get(image["ext"], "application/octet-stream")
+
+
+def touch(image):
+    """Note that an image was served; last_access is written back in batches.
+
+    Does no I/O itself, so it is safe to call on the event loop. Returns
+    True once a batch is pending; the caller should then run flush_touches()
+    off the loop.
+    """
+    now = int(time.time())
+    if now - image["last_access"] < TOUCH_INTERVAL:
+        return False
+    with _touches_lock:
+        _touches[image["key"]] = now
+        image["last_access"] = now
+        return len(_touches) >= 256
+
+
+def flush_touches():
+    with _touches_lock:
+        pending = list(_touches.items())
+        _touches.clear()
+    if pending:
+        with db.write_connection() as conn:
+            conn.executemany("UPDATE image_cache SET last_access = ? WHERE key = ?",
+                             [(ts, key) for key, ts in pending])
+
+
+def _pending(set_ids=None):
+    """(key, url) of every card and expansion image not cached yet."""
+    where, params = "", []
+    if set_ids:
+        placeholders = ", ".join("?" for _ in set_ids)
+        where = f"AND {{column}} IN ({placeholders})"
+        params = list(set_ids)
+    with db.read_connection() as conn:
+        items = [tuple(row) for row in conn.execute(f"""
+            SELECT c.id, c.image_url FROM cards c
+            WHERE c.image_url IS NOT NULL AND c.image_url != '' {where.format(column='c.expansion_id')}
+              AND NOT EXISTS (SELECT 1 FROM image_cache i WHERE i.key = c.id)
+        """, params)]
+        for kind in EXPANSION_IMAGES:
+            items += [tuple(row) for row in conn.execute(f"""
+                SELECT e.id || '/{kind}', e.{kind}_url FROM expansions e
+                WHERE e.{kind}_url IS NOT NULL AND e.{kind}_url != '' {where.format(column='e.id')}
+                  AND NOT EXISTS (SELECT 1 FROM image_cache i WHERE i.key = e.id || '/{kind}')
+            """, params)]
+    return items
+
+
+def prefetch(set_ids=None, progress=None):
+    """Download every missing image (of ``set_ids``, or of the whole catalogue) with bounded concurrency.
+
+    ``progress`` is called with images_done / images_total / images_failed and may
+    raise to stop early (a cancelled job); downloads not started yet are dropped.
+    """
+    items = _pending(set_ids)
+    report = {"images_fetched": 0, "images_failed": 0}
+    if not items:
+        return report
+
+    pool = ThreadPoolExecutor(max_workers=max(IMAGE_PREFETCH_WORKERS, 1), thread_name_prefix="images")
+    futures = [pool.submit(download, key, url) for key, url in items]
+    fetched = []
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                fetched.append(future.result())
+            except ImageError as e:
+                report["images_failed"] += 1
+                logger.error("❌ %s", e)
+            if len(fetched) >= 200:
+                _record(fetched)
+                report["images_fetched"] += len(fetched)
+                fetched = []
+            if progress is not None and (done % 50 == 0 or done == len(futures)):
+                progress(images_done=done, images_total=len(futures), images_failed=report["images_failed"])
+    finally:
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=True)
+        if fetched:
+            _record(fetched)
+            report["images_fetched"] += len(fetched)
+        enforce_quota()
+    logger.info("✔ Cached %d images (%d failed)", report["images_fetched"], report["images_failed"])
+    return report
+
+
+def _total_bytes(conn):
+    # Identical files are stored once, so count each hash once
+    return conn.execute("""
+        SELECT COALESCE(SUM(bytes), 0) FROM (SELECT MAX(bytes) AS bytes FROM image_cache GROUP BY sha256)
+    """).fetchone()[0]
+
+
+def _remove_files(image):
+    paths = [original_path(image)] + [thumb_path(image, size) for size in SIZES]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def enforce_quota(max_bytes=None):
+    """Evict least recently served images until the cache fits its quota. Returns the number evicted.
+
+    Pinned images (being served) are skipped.
+    """
+    global _cache_bytes
+    max_bytes = max_bytes if max_bytes is not None else IMAGE_CACHE_MB * 1024 * 1024
+    flush_touches()
+    evicted = 0
+    with db.write_connection() as conn:
+        total = _total_bytes(conn)
+        if total <= max_bytes:
+            with _quota_lock:
+                _cache_bytes = total
+            return 0
+        target = max_bytes * EVICT_TARGET
+        with _pinned_lock:
+            pinned = set(_pinned)
+        orphaned = []
+        for row in conn.execute("SELECT * FROM image_cache ORDER BY last_access").fetchall():
+            if total <= target:
+                break
+            if row["sha256"] in pinned:
+                continue
+            conn.execute("DELETE FROM image_cache WHERE key = ?", (row["key"],))
+            evicted += 1
+            if conn.execute("SELECT 1 FROM image_cache WHERE sha256 = ?", (row["sha256"],)).fetchone() is None:
+                total -= row["bytes"]
+                orphaned.append(dict(row))
+    with _quota_lock:
+        _cache_bytes = total
+    # Files go only after the rows are committed, and not while pinned (fetching the key again re-records them)
+    with _pinned_lock:
+        for image in orphaned:
+            if image["sha256"] not in _pinned:
+                _remove_files(image)
+    logger.info("✔ Evicted %d images from the image cache", evicted)
+    return evicted
+
+
+def stats():
+    with db.read_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM image_cache").fetchone()[0]
+        total = _total_bytes(conn)
+    return {"images": count, "bytes": total, "quota_bytes": int(IMAGE_CACHE_MB * 1024 * 1024),
+            "thumbnails": Image is not None}
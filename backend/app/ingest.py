@@ -0,0 +1,116 @@
+"""Bulk catalogue ingestion from a local dump of the PokémonTCG API.
+
+The dump uses the layout of the PokemonTCG/pokemon-tcg-data repository:
+``sets/<lang>.json`` holds every set object and ``cards/<lang>/<set_id>.json``
+the cards of one set, each exactly as the API returns them. Files are decoded
+one object at a time and a set's cards are handed over as they are parsed, so
+memory stays flat however large the catalogue or a single set file is.
+app/database.py maps and writes the rows (``load_dump``); this module holds the
+file reading and the SQLite tuning around a bulk write.
+"""
+import logging
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+
+from app.collection_io import iter_json
+from app.pool import connect
+
+logger = logging.getLogger(__name__)
+
+# Page cache for bulk loads (KiB), so index and FTS builds stay in memory
+BULK_CACHE_SIZE_KB = int(os.getenv("BULK_CACHE_SIZE_KB", str(512 * 1024)))
+# Tables whose secondary indexes are dropped during a bulk load and rebuilt at the end
+DEFERRED_INDEX_TABLES = ("cards",)
+
+
+def _iter_file(path):
+    """Stream the objects of one dump file. Raises ValueError naming the file if it is malformed."""
+    with open(path, "rb") as f:
+        try:
+            for _, record in iter_json(f):
+                yield record
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+
+
+def iter_dump(path, language="en"):
+    """Yield ``(set, cards)`` for every set of the dump at ``path``, in release order.
+
+    ``cards`` is a one-shot iterator that parses the set's file as it is
+    consumed; finish it before moving on to the next set. Sets without a
+    cards file yield an empty list.
+    """
+    sets = list(_iter_file(os.path.join(path, "sets", f"{language}.json")))
+    sets.sort(key=lambda exp: (exp.get("releaseDate") or "", exp.get("id") or ""))
+    cards_dir = os.path.join(path, "cards", language)
+    for exp in sets:
+        cards_path = os.path.join(cards_dir, f"{exp.get('id')}.json")
+        yield exp, _iter_file(cards_path) if os.path.exists(cards_path) else []
+
+
+@contextmanager
+def deferred_indexes(conn):
+    """Drop the full-text triggers and secondary card indexes for the block, then rebuild them.
+
+    Must run inside a write transaction: if the block fails, rolling back
+    restores the dropped schema along with everything else.
+    """
+    saved = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND tbl_name IN ({", ".join("?" for _ in DEFERRED_INDEX_TABLES)})
+          AND (type = 'index' OR (type = 'trigger' AND name LIKE 'cards_fts%'))
+    """, DEFERRED_INDEX_TABLES).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f"DROP {kind.upper()} {name}")
+
+    yield
+
+    for _, _, sql in saved:
+        conn.execute(sql)
+    # The triggers were off, so the external-content index is rebuilt from cards in one pass
+    conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')")
+    conn.execute("ANALYZE")
+
+
+def _remove_database(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+@contextmanager
+def bulk_connection(path):
+    """A private connection tuned for first-time seeding; nothing else may have ``path`` open.
+
+    Skips the rollback journal and fsyncs for the duration, so the load goes
+    to a copy next to ``path`` (``<path>.loading``) that replaces it only once
+    the block completes. If the block fails, the copy is deleted and ``path``
+    is left as it was; a copy left behind by a crash is discarded by the next
+    load. WAL is restored on the finished database.
+    """
+    building = path + ".loading"
+    _remove_database(building)
+    if os.path.exists(path):
+        with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(building)) as target:
+            source.backup(target)
+    conn = connect(building)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+        conn.execute(f"PRAGMA cache_size = {-BULK_CACHE_SIZE_KB}")
+        yield conn
+        conn.execute("PRAGMA locking_mode = NORMAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+    except BaseException:
+        conn.close()
+        _remove_database(building)
+        logger.error("❌ Bulk load into %s failed; the database was left unchanged", path)
+        raise
+    conn.close()
+    # The old database's WAL must not be replayed onto the new file
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(building, path)
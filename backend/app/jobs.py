@@ -0,0 +1,262 @@
+"""In-process background jobs for long-running syncs.
+
+Jobs are persisted in the ``jobs`` table and executed by a small worker pool
+fed from a bounded queue, so HTTP handlers can return a job ID immediately.
+Submitting a job identical to one already queued or running returns the
+existing job instead of starting a second sync.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import app.database as db
+from app import images
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+# Finished jobs older than this are deleted (0 keeps them forever)
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_handlers = {}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now(delta=None):
+    now = datetime.now(timezone.utc)
+    return (now - delta if delta else now).isoformat(timespec="seconds")
+
+
+def _row_to_job(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    del job["dedupe_key"]
+    return job
+
+
+def handler(kind):
+    """Register a function ``fn(job, **params)`` as the runner for a job kind."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+class Job:
+    """Handle passed to job handlers for reporting progress and honouring cancellation."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self._progress = {}
+
+    def is_cancelled(self):
+        with db.read_connection() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def progress(self, **fields):
+        """Merge ``fields`` into the job's progress. Raises JobCancelled if cancellation was requested."""
+        self._progress.update(fields)
+        with db.write_connection() as conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(self._progress), self.id))
+        if self.is_cancelled():
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, retention_days=JOB_RETENTION_DAYS):
+        self.workers = workers
+        self.retention_days = retention_days
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        """Start the workers. Jobs left queued or running by a previous process are marked failed."""
+        with db.write_connection() as conn:
+            conn.execute(f"""
+                UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', finished_at = ?
+                WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})
+            """, (_now(), *ACTIVE_STATUSES))
+        self.prune()
+        # Drop what a previous stop() left behind: wake-ups and jobs just marked failed
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Ask running jobs to cancel and wait up to ``timeout`` seconds in all for the workers to exit.
+
+        Jobs still queued are left for start() to mark as interrupted.
+        """
+        if not self._threads:
+            return
+        with db.write_connection() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE status IN ('queued', 'running')")
+        self._stopping.set()
+        # Wake idle workers; when the queue is full none is idle, and busy ones see the event instead
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self._threads = []
+
+    def submit(self, kind, params=None):
+        """Queue a job, or return the identical job already queued or running.
+
+        Returns ``(job, created)``. Raises JobQueueFull when the queue is at capacity.
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = params or {}
+        dedupe_key = kind + ":" + json.dumps(params, sort_keys=True)
+
+        with self._submit_lock:
+            with db.read_connection() as conn:
+                existing = conn.execute(f"""
+                    SELECT * FROM jobs WHERE dedupe_key = ? AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})
+                    ORDER BY created_at LIMIT 1
+                """, (dedupe_key, *ACTIVE_STATUSES)).fetchone()
+            if existing is not None:
+                return _row_to_job(existing), False
+
+            job_id = uuid.uuid4().hex
+            with db.write_connection() as conn:
+                conn.execute("""
+                    INSERT INTO jobs (id, kind, params, dedupe_key, status, progress, created_at)
+                    VALUES (?, ?, ?, ?, 'queued', '{}', ?)
+                """, (job_id, kind, json.dumps(params), dedupe_key, _now()))
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                with db.write_connection() as conn:
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                raise JobQueueFull("Too many jobs queued; try again later")
+        return self.get(job_id), True
+
+    def prune(self):
+        """Delete finished jobs older than ``retention_days``. Returns how many were removed."""
+        if not self.retention_days:
+            return 0
+        with db.write_connection() as conn:
+            removed = conn.execute(f"""
+                DELETE FROM jobs WHERE status NOT IN ({', '.join('?' for _ in ACTIVE_STATUSES)}) AND finished_at < ?
+            """, (*ACTIVE_STATUSES, _now(timedelta(days=self.retention_days)))).rowcount
+        if removed:
+            logger.info("✔ Removed %d finished job(s) older than %d days", removed, self.retention_days)
+        return removed
+
+    def get(self, job_id):
+        with db.read_connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, status=None, limit=50):
+        sql = "SELECT * FROM jobs"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with db.read_connection() as conn:
+            return [_row_to_job(row) for row in conn.execute(sql, params)]
+
+    def cancel(self, job_id):
+        """Request cancellation. Queued jobs are cancelled at once; running ones stop after the current set."""
+        with db.write_connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,)
+            )
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                         (_now(), job_id))
+        return self.get(job_id)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job_id = self._queue.get()
+            if job_id is None or self._stopping.is_set():
+                self._queue.task_done()
+                return
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        with db.write_connection() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (_now(), job_id),
+            ).rowcount
+        if not claimed:
+            return  # cancelled while queued
+
+        job = self.get(job_id)
+        status, result, error = "succeeded", None, None
+        try:
+            result = _handlers[job["kind"]](Job(job_id), **job["params"])
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error("❌ Job %s (%s) failed: %s", job_id, job["kind"], e)
+
+        with db.write_connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, _now(), job_id),
+            )
+        self.prune()
+
+
+runner = JobRunner()
+
+
+@handler("sync_expansions")
+def _sync_expansions(job):
+    result = db.update_expansions(progress=job.progress)
+    if images.IMAGE_PREFETCH:
+        result.update(images.prefetch(progress=job.progress))
+    return result
+
+
+@handler("sync_expansion_cards")
+def _sync_expansion_cards(job, set_id):
+    result = db.fetch_cards_for_expansion(set_id, progress=job.progress)
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", "Failed to fetch cards."))
+    if images.IMAGE_PREFETCH:
+        result.update(images.prefetch(set_ids=[set_id], progress=job.progress))
+    return result
@@ -0,0 +1,212 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+A deliberately small registry (counters and histograms with labels) so the
+app needs no extra dependency. ``render()`` produces the body served at
+``/metrics``. ``MetricsMiddleware`` times every HTTP request by route
+template; app/pool.py, app/sync.py and app/images.py record database and
+upstream timings into the metrics defined here.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged with their query plan; 0 disables the log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_collectors = []
+# Seconds spent in SQLite (queries + waiting for a connection) by the current request
+_db_time = contextvars.ContextVar("db_time", default=None)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, series):
+                cumulative += bucket
+                labels = _format_labels(self.labels, label_values, [("le", _format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            plain = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{plain} {_format_value(float(series[-2]))}"
+            yield f"{self.name}_count{plain} {series[-1]}"
+
+
+def collector(fn):
+    """Register ``fn() -> [(name, type, help, value), ...]`` to report gauges computed at scrape time."""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            samples = fn()
+        except Exception as e:  # a broken collector must not break the scrape
+            logger.warning("Metrics collector %s failed: %s", fn.__name__, e)
+            continue
+        for name, kind, documentation, value in samples:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time each request spent in SQLite, by route template", ("method", "route"))
+
+# Database
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "SQLite statement execution time", ("operation", "table"))
+db_rows = Counter("db_rows_total", "Rows returned (SELECT) or changed (writes) by SQLite statements",
+                  ("operation", "table"))
+db_acquire_seconds = Histogram(
+    "db_connection_acquire_seconds", "Time spent waiting for a pooled connection", ("kind",))
+db_slow_queries = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("operation", "table"))
+
+# Upstream API
+upstream_request_seconds = Histogram(
+    "upstream_request_duration_seconds", "PokémonTCG API / image CDN request latency", ("endpoint",))
+upstream_responses = Counter(
+    "upstream_responses_total", "Upstream responses by status code (429 = rate limited)", ("endpoint", "status"))
+upstream_errors = Counter("upstream_errors_total", "Upstream requests that failed without a response", ("endpoint",))
+upstream_retries = Counter("upstream_retries_total", "Upstream requests retried after a transient failure",
+                           ("endpoint",))
+
+
+_STATEMENT_RE = re.compile(
+    r"^\s*(?:WITH\b.*?\)\s*)?(SELECT|INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|PRAGMA|BEGIN|COMMIT|ROLLBACK"
+    r"|SAVEPOINT|RELEASE|ANALYZE|VACUUM|EXPLAIN)\b", re.IGNORECASE | re.DOTALL)
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|JOIN)\s+(?:OR\s+\w+\s+)?([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_labels_cache = {}
+
+
+def statement_labels(sql):
+    """(operation, table) labels for a statement, e.g. ("SELECT", "cards"); memoized per SQL text."""
+    labels = _labels_cache.get(sql)
+    if labels is None:
+        match = _STATEMENT_RE.match(sql)
+        operation = match.group(1).upper() if match else "OTHER"
+        table = _TABLE_RE.search(sql)
+        labels = (operation, table.group(1).lower() if table else "")
+        if len(_labels_cache) < 4096:
+            _labels_cache[sql] = labels
+    return labels
+
+
+def record_db_time(seconds):
+    """Add to the running request's DB time; a no-op outside a request."""
+    total = _db_time.get()
+    if total is not None:
+        total[0] += seconds
+
+
+class MetricsMiddleware:
+    """Records http_request_duration_seconds for every request, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        # A mutable cell, so DB threads running with a copy of this context add to it
+        db_time = [0.0]
+        token = _db_time.set(db_time)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], path, str(status))
+            http_request_db_seconds.observe(db_time[0], scope["method"], path)
+            _db_time.reset(token)
@@ -0,0 +1,520 @@
+"""Versioned schema migrations.
+
+Each migration is a ``(version, description, step)`` tuple. ``step`` receives an
+open connection and must be idempotent, so a half-applied database (or one
+created by an older build with the ad-hoc ``CREATE TABLE IF NOT EXISTS``
+statements) can always be brought forward. Applied versions are recorded in
+``schema_version``.
+"""
+import logging
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn, table, column, decl):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _m001_base_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS expansions (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        series TEXT NOT NULL,
+        printed_total INTEGER,
+        total INTEGER,
+        legal_unlimited TEXT,
+        legal_standard TEXT,
+        legal_expanded TEXT,
+        ptcgo_code TEXT,
+        release_date TEXT NOT NULL,
+        updated_at TEXT,
+        symbol_url TEXT,
+        logo_url TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cards (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        expansion_id TEXT NOT NULL,
+        number TEXT NOT NULL,
+        rarity TEXT,
+        supertype TEXT,
+        subtype TEXT,
+        hp TEXT,
+        types TEXT,
+        evolves_from TEXT,
+        image_url TEXT,
+        FOREIGN KEY(expansion_id) REFERENCES expansions(id)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS collection (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        expansion_id TEXT NOT NULL,
+        number TEXT NOT NULL,
+        rarity TEXT,
+        supertype TEXT,
+        hp TEXT,
+        types TEXT,
+        evolves_from TEXT,
+        image_url TEXT,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        collection_number INTEGER DEFAULT 0,
+        FOREIGN KEY(expansion_id) REFERENCES expansions(id)
+    )
+    """)
+    # Very old databases predate collection_number
+    _add_column(conn, "collection", "collection_number", "INTEGER DEFAULT 0")
+
+
+def _m002_hot_path_indexes(conn):
+    # Stored integer card number: CAST(number AS INTEGER) is what every view sorts by,
+    # and an expression in ORDER BY can never use an index
+    _add_column(conn, "cards", "number_int", "INTEGER")
+    conn.execute("UPDATE cards SET number_int = CAST(number AS INTEGER) WHERE number_int IS NULL")
+
+    # get_cards_by_expansion / get_collection_by_expansion: seek + ordered scan, no temp b-tree.
+    # Also covers "does this expansion have cards" probes in fetch_missing_cards.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_expansion_number ON cards(expansion_id, number_int)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_collection_expansion ON collection(expansion_id)")
+    # get_expansions orders by series, release_date
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expansions_series_release ON expansions(series, release_date)")
+    conn.execute("ANALYZE")
+
+
+def _card_search_triggers(conn):
+    # Keep cards_fts in step with every write to cards
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS cards_fts_ai AFTER INSERT ON cards BEGIN
+        INSERT INTO cards_fts (rowid, name, rarity, types, subtype, evolves_from)
+        VALUES (new.rowid, new.name, new.rarity, new.types, new.subtype, new.evolves_from);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS cards_fts_ad AFTER DELETE ON cards BEGIN
+        INSERT INTO cards_fts (cards_fts, rowid, name, rarity, types, subtype, evolves_from)
+        VALUES ('delete', old.rowid, old.name, old.rarity, old.types, old.subtype, old.evolves_from);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS cards_fts_au AFTER UPDATE OF name, rarity, types, subtype, evolves_from ON cards BEGIN
+        INSERT INTO cards_fts (cards_fts, rowid, name, rarity, types, subtype, evolves_from)
+        VALUES ('delete', old.rowid, old.name, old.rarity, old.types, old.subtype, old.evolves_from);
+        INSERT INTO cards_fts (rowid, name, rarity, types, subtype, evolves_from)
+        VALUES (new.rowid, new.name, new.rarity, new.types, new.subtype, new.evolves_from);
+    END
+    """)
+
+
+def _m003_card_search_index(conn):
+    # External-content FTS5 index over the searchable card text. Triggers keep it in
+    # step with every write to cards, so the ingestion functions need no extra code.
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+        name, rarity, types, subtype, evolves_from,
+        content='cards', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    """)
+    _card_search_triggers(conn)
+    # Name hits dominate; evolves_from ("Evolves from Pikachu") comes next
+    conn.execute("INSERT INTO cards_fts (cards_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 1.0, 1.0, 3.0)')")
+    conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('optimize')")
+
+
+def _m004_sync_state(conn):
+    # Per-set progress of catalogue syncs, so an interrupted run can resume
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        set_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        card_count INTEGER,
+        error TEXT,
+        updated_at TEXT
+    )
+    """)
+    # Sets whose cards are already present count as synced
+    conn.execute("""
+    INSERT OR IGNORE INTO sync_state (set_id, status, card_count, updated_at)
+    SELECT expansion_id, 'done', COUNT(*), datetime('now') FROM cards GROUP BY expansion_id
+    """)
+
+
+def _m005_delta_sync(conn):
+    # Hash of each set's card rows as last stored, so an unchanged set is never rewritten
+    _add_column(conn, "sync_state", "content_hash", "TEXT")
+    # Sets stored before pagination was followed were cut off at one API page;
+    # flag every set holding fewer cards than its upstream total for a re-fetch
+    conn.execute("""
+    UPDATE sync_state SET status = 'pending'
+    WHERE card_count < (SELECT total FROM expansions WHERE expansions.id = sync_state.set_id)
+    """)
+
+
+def _m006_jobs(conn):
+    # Background job records (app/jobs.py); progress and result are JSON documents
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        dedupe_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, dedupe_key)")
+
+
+def _m007_collection_stats(conn):
+    # Collection progress per (expansion, rarity), kept current by every collection
+    # and catalogue write so stats and dashboard widgets never aggregate the collection
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS collection_stats (
+        expansion_id TEXT NOT NULL,
+        rarity TEXT NOT NULL,
+        sort_key INTEGER,
+        total_cards INTEGER NOT NULL DEFAULT 0,
+        collected_cards INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (expansion_id, rarity)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM collection_stats")
+    conn.execute("""
+    INSERT INTO collection_stats (expansion_id, rarity, sort_key, total_cards, collected_cards, quantity)
+    SELECT c.expansion_id, COALESCE(c.rarity, 'Unknown'), MIN(c.number_int), COUNT(*),
+           COUNT(CASE WHEN col.quantity > 0 THEN 1 END), COALESCE(SUM(col.quantity), 0)
+    FROM cards c
+    LEFT JOIN collection col ON col.card_id = c.id
+    GROUP BY c.expansion_id, COALESCE(c.rarity, 'Unknown')
+    """)
+
+
+def _m008_collection_listing_index(conn):
+    # Keyset pages of /collection/ in its default order (name, then card_id as tie-breaker)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_collection_name ON collection(name, card_id)")
+
+
+def _m009_image_cache(conn):
+    # Locally cached card and expansion images (app/images.py). Files are stored
+    # by content hash; ``bytes`` covers the original plus its thumbnails.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS image_cache (
+        key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        ext TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        fetched_at TEXT NOT NULL,
+        last_access INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_access ON image_cache(last_access)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_sha ON image_cache(sha256)")
+
+
+def _m010_card_attributes(conn):
+    # Types and subtypes get junction tables, so a type/subtype filter is a primary-key
+    # lookup instead of a scan over comma-joined text; hp becomes an INTEGER that
+    # HP ranges can seek. types/subtype stay on cards for display and full-text search.
+    if {row[1]: row[2] for row in conn.execute("PRAGMA table_info(cards)")}.get("hp") != "INTEGER":
+        # SQLite cannot retype a column, so rebuild cards. rowids are copied, so
+        # cards_fts (keyed by rowid) stays valid; the triggers go with the old table.
+        conn.execute("""
+        CREATE TABLE cards_new (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            expansion_id TEXT NOT NULL,
+            number TEXT NOT NULL,
+            number_int INTEGER,
+            rarity TEXT,
+            supertype TEXT,
+            subtype TEXT,
+            hp INTEGER,
+            types TEXT,
+            evolves_from TEXT,
+            image_url TEXT,
+            FOREIGN KEY(expansion_id) REFERENCES expansions(id)
+        )
+        """)
+        conn.execute("""
+        INSERT INTO cards_new (rowid, id, name, expansion_id, number, number_int, rarity, supertype, subtype,
+                               hp, types, evolves_from, image_url)
+        SELECT rowid, id, name, expansion_id, number, number_int, rarity, supertype, subtype,
+               CASE WHEN hp GLOB '[0-9]*' THEN CAST(hp AS INTEGER) END, types, evolves_from, image_url
+        FROM cards
+        """)
+        conn.execute("DROP TABLE cards")
+        conn.execute("ALTER TABLE cards_new RENAME TO cards")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_expansion_number ON cards(expansion_id, number_int)")
+        _card_search_triggers(conn)
+
+    for table, column in (("card_types", "type"), ("card_subtypes", "subtype")):
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {column} TEXT NOT NULL COLLATE NOCASE,
+            card_id TEXT NOT NULL,
+            PRIMARY KEY ({column}, card_id)
+        ) WITHOUT ROWID
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_card ON {table}(card_id)")
+        conn.execute(f"DELETE FROM {table}")
+        source = "types" if table == "card_types" else "subtype"
+        conn.executemany(f"INSERT OR IGNORE INTO {table} ({column}, card_id) VALUES (?, ?)", [
+            (value, card_id)
+            for card_id, values in conn.execute(f"SELECT id, {source} FROM cards WHERE {source} != ''").fetchall()
+            for value in values.split(",") if value
+        ])
+        # Junction rows of deleted cards go with them (inserts are written by app/database.py)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON cards BEGIN
+            DELETE FROM {table} WHERE card_id = old.id;
+        END
+        """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_hp ON cards(hp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_rarity ON cards(rarity COLLATE NOCASE)")
+    conn.execute("ANALYZE")
+
+
+def _m011_compact_collection(conn):
+    # The collection keeps only what is the user's own (quantity, collection number,
+    # variant); everything about the card is joined from cards, so rows stay small and
+    # never go stale when the catalogue changes. A NULL collection_number means the
+    # card's own number.
+    if "name" in {row[1] for row in conn.execute("PRAGMA table_info(collection)")}:
+        conn.execute("""
+        CREATE TABLE collection_new (
+            card_id TEXT PRIMARY KEY,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            collection_number INTEGER,
+            variant INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """)
+        conn.execute("""
+        INSERT INTO collection_new (card_id, quantity, collection_number)
+        SELECT col.card_id, col.quantity, NULLIF(NULLIF(col.collection_number, 0), c.number_int)
+        FROM collection col
+        LEFT JOIN cards c ON c.id = col.card_id
+        """)
+        conn.execute("DROP TABLE collection")  # takes idx_collection_expansion and idx_collection_name along
+        conn.execute("ALTER TABLE collection_new RENAME TO collection")
+
+    # /collection/ pages in name order walk cards by name and probe the collection
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_name ON cards(name, id)")
+    conn.execute("ANALYZE")
+
+
+def _m012_catalogue_info(conn):
+    # Facts about the catalogue as a whole; "version" is the build time of the
+    # snapshot it came from (see build_snapshot / apply_snapshot in app/database.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalogue_info (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID
+    """)
+
+
+def _m013_collection_owners(conn):
+    # Many collectors share one catalogue: collection rows and their stats are keyed by
+    # owner first, so every per-owner read is a primary-key range. Existing data
+    # belongs to owner 1, "default". Card totals per (expansion, rarity) are the same
+    # for everyone and move to catalogue_stats.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS owners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        created_at TEXT NOT NULL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO owners (id, name, created_at) VALUES (1, 'default', datetime('now'))")
+
+    if "owner_id" not in {row[1] for row in conn.execute("PRAGMA table_info(collection)")}:
+        conn.execute("""
+        CREATE TABLE collection_new (
+            owner_id INTEGER NOT NULL,
+            card_id TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            collection_number INTEGER,
+            variant INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (owner_id, card_id)
+        ) WITHOUT ROWID
+        """)
+        conn.execute("""
+        INSERT INTO collection_new (owner_id, card_id, quantity, collection_number, variant)
+        SELECT 1, card_id, quantity, collection_number, variant FROM collection
+        """)
+        conn.execute("DROP TABLE collection")
+        conn.execute("ALTER TABLE collection_new RENAME TO collection")
+    # "Is this card collected by anyone" (card removal) and per-expansion stats refreshes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_collection_card ON collection(card_id)")
+
+    if "owner_id" not in {row[1] for row in conn.execute("PRAGMA table_info(collection_stats)")}:
+        conn.execute("DROP TABLE collection_stats")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalogue_stats (
+        expansion_id TEXT NOT NULL,
+        rarity TEXT NOT NULL,
+        sort_key INTEGER,
+        total_cards INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (expansion_id, rarity)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS collection_stats (
+        owner_id INTEGER NOT NULL,
+        expansion_id TEXT NOT NULL,
+        rarity TEXT NOT NULL,
+        collected_cards INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (owner_id, expansion_id, rarity)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_collection_stats_expansion ON collection_stats(expansion_id)")
+    conn.execute("DELETE FROM catalogue_stats")
+    conn.execute("""
+    INSERT INTO catalogue_stats (expansion_id, rarity, sort_key, total_cards)
+    SELECT expansion_id, COALESCE(rarity, 'Unknown'), MIN(number_int), COUNT(*)
+    FROM cards
+    GROUP BY expansion_id, COALESCE(rarity, 'Unknown')
+    """)
+    conn.execute("DELETE FROM collection_stats")
+    conn.execute("""
+    INSERT INTO collection_stats (owner_id, expansion_id, rarity, collected_cards, quantity)
+    SELECT col.owner_id, c.expansion_id, COALESCE(c.rarity, 'Unknown'),
+           COUNT(CASE WHEN col.quantity > 0 THEN 1 END), SUM(col.quantity)
+    FROM collection col
+    JOIN cards c ON c.id = col.card_id
+    GROUP BY col.owner_id, c.expansion_id, COALESCE(c.rarity, 'Unknown')
+    """)
+    conn.execute("ANALYZE")
+
+
+def _m014_collection_variants(conn):
+    # Quantities per printing (normal, holofoil, reverse holo, 1st edition, ...). Variants
+    # are small integer codes (app.database.VARIANTS). collection.quantity stays the
+    # card's total, so totals, stats and facets never look at variants; only copies
+    # recorded with an explicit variant get a collection_variants row, and the rest
+    # of the total is "unspecified". cards.variants is a bitmask of the variants the
+    # API lists prices for (0 = not known).
+    if "variants" not in {row[1] for row in conn.execute("PRAGMA table_info(cards)")}:
+        conn.execute("ALTER TABLE cards ADD COLUMN variants INTEGER NOT NULL DEFAULT 0")
+    if "variant" in {row[1] for row in conn.execute("PRAGMA table_info(collection)")}:
+        conn.execute("ALTER TABLE collection DROP COLUMN variant")  # never written
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS collection_variants (
+        owner_id INTEGER NOT NULL,
+        card_id TEXT NOT NULL,
+        variant INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (owner_id, card_id, variant)
+    ) WITHOUT ROWID
+    """)
+
+
+def _m015_price_history(conn):
+    # Append-only market prices (app/prices.py): one row per price change of a card's
+    # variant at one source, in integer cents on an integer day (days since 1970-01-01).
+    # Keyed by card first, so finding each card's latest point during a sync is a range scan.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS price_history (
+        card_id TEXT NOT NULL,
+        source INTEGER NOT NULL,
+        variant INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        price INTEGER NOT NULL,
+        PRIMARY KEY (card_id, source, variant, day)
+    ) WITHOUT ROWID
+    """)
+
+
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "integer card numbers and hot-path indexes", _m002_hot_path_indexes),
+    (3, "full-text card search index", _m003_card_search_index),
+    (4, "per-set sync progress", _m004_sync_state),
+    (5, "delta sync content hashes", _m005_delta_sync),
+    (6, "background job records", _m006_jobs),
+    (7, "materialized collection stats", _m007_collection_stats),
+    (8, "collection listing index", _m008_collection_listing_index),
+    (9, "local image cache", _m009_image_cache),
+    (10, "normalized card types, subtypes and integer hp", _m010_card_attributes),
+    (11, "compact collection table", _m011_compact_collection),
+    (12, "catalogue snapshot info", _m012_catalogue_info),
+    (13, "collection owners", _m013_collection_owners),
+    (14, "per-variant collection quantities", _m014_collection_variants),
+    (15, "card price history", _m015_price_history),
+]
+
+
+def current_version(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    """Apply every pending migration in order. Returns the versions applied.
+
+    Each step runs inside its own SAVEPOINT, which works both on an autocommit
+    connection and inside a transaction already opened by the caller.
+    """
+    applied = []
+    version = current_version(conn)
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute(f"SAVEPOINT migration_{number}")
+        try:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (number, description, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+            )
+        except BaseException:
+            conn.execute(f"ROLLBACK TO migration_{number}")
+            conn.execute(f"RELEASE migration_{number}")
+            raise
+        conn.execute(f"RELEASE migration_{number}")
+        applied.append(number)
+        logger.info("✔ Applied migration %d: %s", number, description)
+    return applied
+
+
+if __name__ == "__main__":
+    # Upgrade a database file in place, e.g. the shipped seed:
+    #   python -m app.migrations seed/pokemon.db
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for path in sys.argv[1:]:
+        conn = sqlite3.connect(path, isolation_level=None)
+        run_migrations(conn)
+        conn.close()
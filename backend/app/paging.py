@@ -0,0 +1,119 @@
+"""Keyset pagination, sort keys and field projection for list endpoints.
+
+A listing declares which columns may be returned (``fields``) and which
+expressions it may be sorted by (``sorts``), each as a name -> SQL expression
+map. Pages are cut with a keyset condition on the sort expressions plus a
+unique tie-breaker, so fetching page N costs the same as fetching page 1.
+"""
+from app.search import cursor_keys, decode_cursor, encode_cursor
+
+
+def parse_fields(value, allowed, default):
+    """Turn ``"id,name,rarity"`` into a list of known field names (``default`` when empty)."""
+    if not value:
+        return list(default)
+    fields = []
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise ValueError(f"Unknown field: {name}")
+        if name not in fields:
+            fields.append(name)
+    return fields or list(default)
+
+
+def parse_sort(value, allowed, default):
+    """Turn ``"-quantity,name"`` into ``[("quantity", True), ("name", False)]``; ``-`` means descending."""
+    keys = []
+    for name in (value or default).split(","):
+        name = name.strip()
+        descending = name.startswith("-")
+        name = name.lstrip("-+")
+        if not name:
+            continue
+        if name not in allowed:
+            raise ValueError(f"Unknown sort key: {name}")
+        if name not in (key for key, _ in keys):
+            keys.append((name, descending))
+    return keys
+
+
+def keyset_condition(exprs, descending, values):
+    """SQL condition selecting rows strictly after ``values`` in the given ordering."""
+    if len(set(descending)) == 1:
+        # One direction: a row-value comparison, which SQLite can answer from an index
+        op = "<" if descending[0] else ">"
+        return f"({', '.join(exprs)}) {op} ({', '.join('?' for _ in exprs)})", list(values)
+
+    clauses, params = [], []
+    for i, (expr, desc) in enumerate(zip(exprs, descending)):
+        equal = [f"{e} = ?" for e in exprs[:i]]
+        clauses.append("(" + " AND ".join(equal + [f"{expr} {'<' if desc else '>'} ?"]) + ")")
+        params.extend(values[:i] + [values[i]])
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+class Page:
+    """One page of ``SELECT <fields> FROM <source> WHERE <where>`` in a chosen order.
+
+    ``columns`` and ``sorts`` map public names to SQL expressions; ``tiebreaker``
+    is a unique expression appended to every ordering. Invalid fields, sort
+    keys or cursors raise ValueError.
+    """
+
+    def __init__(self, source, where, params, columns, sorts, tiebreaker, fields=None, sort=None,
+                 default_fields=None, default_sort="", limit=100, cursor=None):
+        self.fields = parse_fields(fields, columns, default_fields or list(columns))
+        keys = parse_sort(sort, sorts, default_sort)
+        self.sort_spec = ",".join(("-" if desc else "") + name for name, desc in keys)
+        self.limit = limit
+        self.next_cursor = None
+
+        exprs = [sorts[name] for name, _ in keys] + [tiebreaker]
+        descending = [desc for _, desc in keys] + [keys[-1][1] if keys else False]
+
+        where, params = list(where), list(params)
+        if cursor:
+            state = decode_cursor(cursor)
+            if state.get("sort") != self.sort_spec:
+                raise ValueError("Invalid cursor")
+            values = cursor_keys(state, len(exprs))
+            condition, condition_params = keyset_condition(exprs, descending, values)
+            where.append(condition)
+            params.extend(condition_params)
+
+        select = [f"{columns[name]} AS {name}" for name in self.fields]
+        select += [f"{expr} AS _k{i}" for i, expr in enumerate(exprs)]
+        order = [f"{expr} {'DESC' if desc else 'ASC'}" for expr, desc in zip(exprs, descending)]
+        self.sql = (
+            f"SELECT {', '.join(select)} FROM {source}"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" ORDER BY {', '.join(order)} LIMIT ?"
+        )
+        self.params = params + [limit + 1]
+
+    def records(self, rows):
+        """Yield the page's rows (``sql`` results) as dicts of the requested fields.
+
+        Once exhausted, ``next_cursor`` points at the following page, or is None on the last one.
+        """
+        for values in self.values(rows):
+            yield dict(zip(self.fields, values))
+
+    def values(self, rows):
+        """Like ``records`` but yields bare tuples in ``fields`` order (for columnar responses)."""
+        count = len(self.fields)
+        last = None
+        try:
+            for n, row in enumerate(rows):
+                if n == self.limit:
+                    self.next_cursor = encode_cursor({"sort": self.sort_spec, "after": list(last[count:])})
+                    return
+                last = row
+                yield row[:count]
+        finally:
+            close = getattr(rows, "close", None)
+            if close:
+                close()
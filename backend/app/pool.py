@@ -0,0 +1,379 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tuning knobs, all overridable from the environment
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "16"))
+STREAM_POOL_SIZE = int(os.getenv("DB_STREAM_POOL_SIZE", "8"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(64 * 1024)))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "256"))
+# Seconds to wait for a streaming connection before giving up with PoolTimeout
+STREAM_TIMEOUT = float(os.getenv("DB_STREAM_TIMEOUT", "5"))
+# Time every statement into app.metrics (DB_TRACE=0 turns it off)
+DB_TRACE = os.getenv("DB_TRACE", "1") != "0"
+
+# Threads whose reads bypass the shared read slots (see dedicate_thread)
+_dedicated = threading.local()
+
+
+class PoolTimeout(Exception):
+    """No connection of the kind asked for became free in time."""
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's duration and row count to app.metrics.
+
+    A statement's time covers execute() plus every fetch, and is recorded once
+    its rows are exhausted, the cursor runs another statement, or it is dropped.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._start(sql, parameters)
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+        if self.rowcount > 0:
+            self._rows += self.rowcount
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._start(sql, None)
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+        if self.rowcount > 0:
+            self._rows += self.rowcount
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        self._start(sql_script, None)
+        started = time.perf_counter()
+        try:
+            super().executescript(sql_script)
+        finally:
+            self._elapsed += time.perf_counter() - started
+        self._finish()
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        if len(rows) < (self.arraysize if size is None else size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - started
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _start(self, sql, parameters):
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        labels = metrics.statement_labels(sql)
+        metrics.db_query_seconds.observe(self._elapsed, *labels)
+        metrics.record_db_time(self._elapsed)
+        if self._rows:
+            metrics.db_rows.inc(*labels, amount=self._rows)
+        if metrics.SLOW_QUERY_MS and self._elapsed * 1000 >= metrics.SLOW_QUERY_MS:
+            metrics.db_slow_queries.inc(*labels)
+            _log_slow_query(self.connection, sql, self._parameters, labels[0], self._elapsed, self._rows)
+
+
+def _log_slow_query(conn, sql, parameters, operation, elapsed, rows):
+    plan = ""
+    if parameters is not None and operation in ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE"):
+        try:
+            # Plain sqlite3 cursor, so explaining is not traced itself
+            steps = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            plan = "\n".join(f"  {'  ' * min(step[1], 8)}{step[3]}" for step in steps)
+        except sqlite3.Error as e:
+            plan = f"  (no plan: {e})"
+    logger.warning("Slow query (%.1f ms, %d rows): %s\n%s", elapsed * 1000, rows, " ".join(sql.split()), plan)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are TracedCursors."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(path, readonly=False):
+    """Open a tuned SQLite connection.
+
+    Connections run in autocommit mode (isolation_level=None); transactions are
+    opened explicitly by the pool's writer so that DDL and DML share one
+    BEGIN IMMEDIATE ... COMMIT block.
+    """
+    conn = sqlite3.connect(
+        path,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        factory=TracedConnection if DB_TRACE else sqlite3.Connection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KB}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def dedicate_thread():
+    """Let the calling thread read without taking one of a pool's shared read slots.
+
+    For long-lived worker threads of a fixed-size pool (app/async_database.py's
+    reader executor): each keeps its own connection, so the worker count, not
+    the slots, bounds them, and other readers cannot make them wait.
+    """
+    _dedicated.on = True
+
+
+def _record_wait(kind, started):
+    waited = time.perf_counter() - started
+    metrics.db_acquire_seconds.observe(waited, kind)
+    metrics.record_db_time(waited)
+
+
+class ConnectionPool:
+    """Thread-bound read connections, streaming read connections and one serialized writer.
+
+    Every thread that reads gets its own connection, opened lazily and reused
+    for the lifetime of the pool; at most ``read_size`` threads may hold a
+    read connection concurrently, not counting threads set up with
+    dedicate_thread(). Streamed results, which may be stepped from
+    any thread, borrow one of ``stream_size`` connections instead
+    (acquire_stream/release_stream). All writes
+    go through a single connection guarded by a re-entrant lock, so concurrent
+    writers queue up in Python instead of failing with ``database is locked``.
+    """
+
+    def __init__(self, path, read_size=READ_POOL_SIZE, stream_size=STREAM_POOL_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self._read_slots = threading.BoundedSemaphore(read_size)
+        self._stream_slots = threading.BoundedSemaphore(stream_size)
+        self._idle_streams = []
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = None
+        self._after_commit = []
+        self._closed = False
+
+    def _reader_for_thread(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path, readonly=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Yield this thread's read connection."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        # Re-entrant reads on the same thread reuse the slot already held; dedicated threads need none
+        depth = getattr(self._local, "depth", 0)
+        if depth or getattr(_dedicated, "on", False):
+            self._local.depth = depth + 1
+            try:
+                yield self._reader_for_thread()
+            finally:
+                self._local.depth = depth
+            return
+
+        started = time.perf_counter()
+        with self._read_slots:
+            _record_wait("read", started)
+            self._local.depth = 1
+            try:
+                yield self._reader_for_thread()
+            finally:
+                self._local.depth = 0
+
+    def acquire_stream(self, timeout=None):
+        """Take a read connection that is not bound to a thread, for results consumed piecemeal.
+
+        It may be used from any thread and must be handed back with
+        release_stream(). Waits at most ``timeout`` seconds for one of the
+        streaming slots (default STREAM_TIMEOUT), then raises PoolTimeout: a wait without a bound could
+        park a thread that the streams holding the slots need to finish.
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        started = time.perf_counter()
+        if not self._stream_slots.acquire(timeout=STREAM_TIMEOUT if timeout is None else timeout):
+            _record_wait("stream", started)
+            raise PoolTimeout("No streaming connection became free in time")
+        _record_wait("stream", started)
+        try:
+            with self._readers_lock:
+                conn = self._idle_streams.pop() if self._idle_streams else None
+            if conn is None:
+                conn = connect(self.path, readonly=True)
+                with self._readers_lock:
+                    self._readers.append(conn)
+        except BaseException:
+            self._stream_slots.release()
+            raise
+        return conn
+
+    def release_stream(self, conn):
+        """Return a connection taken with acquire_stream() to the pool."""
+        with self._readers_lock:
+            self._idle_streams.append(conn)
+        self._stream_slots.release()
+
+    @contextmanager
+    def writer(self):
+        """Yield the writer connection inside a transaction.
+
+        Nested ``writer()`` blocks on the same thread join the outer
+        transaction; the outermost block commits, or rolls back on error.
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        started = time.perf_counter()
+        with self._write_lock:
+            outermost = self._write_depth == 0
+            if outermost:
+                _record_wait("write", started)
+            if self._writer is None:
+                self._writer = connect(self.path)
+            conn = self._writer
+            if outermost:
+                conn.execute("BEGIN IMMEDIATE")
+            self._write_depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self._write_depth -= 1
+                if outermost:
+                    self._after_commit.clear()
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                raise
+            self._write_depth -= 1
+            if outermost:
+                if conn.in_transaction:
+                    try:
+                        conn.execute("COMMIT")
+                    except BaseException:
+                        # A failed COMMIT (busy, I/O, deferred constraint) can leave the
+                        # transaction open on the shared connection; end it here
+                        self._after_commit.clear()
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        raise
+                callbacks, self._after_commit = self._after_commit, []
+                for callback in callbacks:
+                    callback()
+
+    def after_commit(self, callback):
+        """Run ``callback()`` once the current write transaction commits (dropped on rollback).
+
+        Must be called inside a ``writer()`` block. The same callback is queued only once.
+        """
+        if callback not in self._after_commit:
+            self._after_commit.append(callback)
+
+    def close(self):
+        """Close every connection the pool has handed out."""
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                try:
+                    self._writer.execute("PRAGMA optimize")
+                finally:
+                    self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            self._idle_streams.clear()
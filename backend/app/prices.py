@@ -0,0 +1,284 @@
+"""Card price history and vectorized collection valuation.
+
+Syncs record the market prices the API sends with every card (TCGplayer in USD,
+per variant; Cardmarket trend prices in EUR) into ``price_history`` as change
+points: a row is only written when a price differs from the card's previous
+point, dated by the day the API says the price was updated. ``downsample``
+thins older history to one point per week, then one per month, so storage
+stays bounded however long the app runs.
+
+Valuations load one source's history once into sorted NumPy arrays
+(``History``) and price every owned copy with a single ``searchsorted``, so no
+Python loop walks the collection. app/database.py caches the histories and
+each owner's ``Holdings`` and drops them after writes commit.
+"""
+import itertools
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+# Price sources -> code stored in price_history.source, and the currency of their prices
+SOURCES = {"tcgplayer": 0, "cardmarket": 1}
+CURRENCIES = {"tcgplayer": "USD", "cardmarket": "EUR"}
+# Points older than these many days are thinned to one per week, then one per month
+PRICE_HISTORY_DAILY_DAYS = int(os.getenv("PRICE_HISTORY_DAILY_DAYS", "90"))
+PRICE_HISTORY_WEEKLY_DAYS = int(os.getenv("PRICE_HISTORY_WEEKLY_DAYS", "730"))
+
+# History keys are rowid * _VARIANT_SLOTS + variant, combined with the day as key * _DAY_SPAN + day
+_VARIANT_SLOTS = 16
+_DAY_SPAN = 1 << 20
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(value=None):
+    """Days since 1970-01-01 of an API ``updatedAt`` ("2025/01/15") or a date; today (UTC) by default."""
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value[:10].replace("-", "/"), "%Y/%m/%d").date()
+        except ValueError:
+            value = None
+    if value is None:
+        value = datetime.now(timezone.utc).date()
+    return (value - _EPOCH).days
+
+
+def day_date(day):
+    return (_EPOCH + timedelta(days=int(day))).isoformat()
+
+
+def _cents(value):
+    if isinstance(value, (int, float)) and value > 0:
+        return round(value * 100)
+    return None
+
+
+def extract(card, variant_codes):
+    """``(card_id, source, variant, day, cents)`` rows for the prices of one API card.
+
+    TCGplayer prices are per variant (``market``, else ``mid``); Cardmarket's
+    ``trendPrice`` counts as variant 0 and ``reverseHoloTrend`` as the reverse holo.
+    ``variant_codes`` maps lower-cased variant names to their codes.
+    """
+    rows = []
+    tcgplayer = card.get("tcgplayer") or {}
+    day = day_number(tcgplayer.get("updatedAt"))
+    for name, quotes in (tcgplayer.get("prices") or {}).items():
+        code = variant_codes.get(str(name).lower())
+        cents = _cents((quotes or {}).get("market")) or _cents((quotes or {}).get("mid"))
+        if code and cents:
+            rows.append((card["id"], SOURCES["tcgplayer"], code, day, cents))
+
+    cardmarket = card.get("cardmarket") or {}
+    quotes = cardmarket.get("prices") or {}
+    day = day_number(cardmarket.get("updatedAt"))
+    for code, field in ((0, "trendPrice"), (variant_codes["reverseholofoil"], "reverseHoloTrend")):
+        cents = _cents(quotes.get(field))
+        if cents:
+            rows.append((card["id"], SOURCES["cardmarket"], code, day, cents))
+    return rows
+
+
+def record(conn, rows):
+    """Append the price points of ``rows`` (see ``extract``) that change a card's latest price.
+
+    Call inside a write transaction. A point older than the latest one is
+    ignored; a new price for the latest day replaces it. Returns the number
+    of rows written.
+    """
+    latest = {}
+    card_ids = list({row[0] for row in rows})
+    for start in range(0, len(card_ids), 500):
+        chunk = card_ids[start:start + 500]
+        for card_id, source, variant, price, day in conn.execute(f"""
+            SELECT card_id, source, variant, price, MAX(day) FROM price_history
+            WHERE card_id IN ({", ".join("?" for _ in chunk)})
+            GROUP BY card_id, source, variant
+        """, chunk):
+            latest[(card_id, source, variant)] = (day, price)
+
+    changed = []
+    for card_id, source, variant, day, cents in rows:
+        last_day, last_price = latest.get((card_id, source, variant), (None, None))
+        if last_day is None or (day >= last_day and cents != last_price):
+            changed.append((card_id, source, variant, day, cents))
+    conn.executemany("""
+        INSERT INTO price_history (card_id, source, variant, day, price) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(card_id, source, variant, day) DO UPDATE SET price = excluded.price
+    """, changed)
+    return len(changed)
+
+
+def downsample(conn, today=None):
+    """Thin old history to the last point per week, then per month; drop points of deleted cards.
+
+    Call inside a write transaction. Returns the number of rows removed.
+    """
+    today = day_number() if today is None else today
+    removed = conn.execute("DELETE FROM price_history WHERE card_id NOT IN (SELECT id FROM cards)").rowcount
+    for age, bucket in ((PRICE_HISTORY_DAILY_DAYS, 7), (PRICE_HISTORY_WEEKLY_DAYS, 30)):
+        cutoff = today - age
+        removed += conn.execute("""
+            DELETE FROM price_history
+            WHERE day < :cutoff AND (card_id, source, variant, day) NOT IN (
+                SELECT card_id, source, variant, MAX(day) FROM price_history
+                WHERE day < :cutoff
+                GROUP BY card_id, source, variant, day / :bucket
+            )
+        """, {"cutoff": cutoff, "bucket": bucket}).rowcount
+    return removed
+
+
+class History:
+    """One source's price points as sorted arrays, plus the card and expansion of each rowid.
+
+    Treat as read-only; a price or catalogue write replaces the whole object.
+    """
+
+    __slots__ = ("points", "prices", "defaults", "card_ids", "expansion_of", "expansions")
+
+    def __init__(self, points, prices, defaults, card_ids, expansion_of, expansions):
+        self.points = points  # sorted key * _DAY_SPAN + day
+        self.prices = prices  # price of each point, in currency units
+        self.defaults = defaults  # rowid -> key of the card's first priced variant (-1: none)
+        self.card_ids = card_ids  # rowid -> card id
+        self.expansion_of = expansion_of  # rowid -> index into expansions (-1: none)
+        self.expansions = expansions  # [(expansion_id, name)]
+
+    def lookup(self, keys, day):
+        """Price of every key as of ``day`` (its latest point up to then), NaN where there is none."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(self.points):
+            return np.full(len(keys), np.nan)
+        idx = np.searchsorted(self.points, keys * _DAY_SPAN + day, side="right") - 1
+        found = (idx >= 0) & (keys >= 0)
+        found &= self.points[np.maximum(idx, 0)] // _DAY_SPAN == keys
+        return np.where(found, self.prices[np.maximum(idx, 0)], np.nan)
+
+
+def build(conn, source):
+    """Load one source's whole price history, and the catalogue's rowids, into a History."""
+    cards = conn.execute("SELECT rowid, id, expansion_id FROM cards").fetchall()
+    size = max((row[0] for row in cards), default=0) + 1
+    expansions = [tuple(row) for row in conn.execute("SELECT id, name FROM expansions ORDER BY release_date, id")]
+    expansion_index = {expansion_id: i for i, (expansion_id, _) in enumerate(expansions)}
+    card_ids = np.empty(size, dtype=object)
+    expansion_of = np.full(size, -1, dtype=np.int32)
+    for rowid, card_id, expansion_id in cards:
+        card_ids[rowid] = card_id
+        expansion_of[rowid] = expansion_index.get(expansion_id, -1)
+
+    # Streamed straight from the cursor into one flat array of (point, price) pairs
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT (c.rowid * ? + p.variant) * ? + p.day, p.price
+        FROM price_history p JOIN cards c ON c.id = p.card_id
+        WHERE p.source = ?
+    """, (_VARIANT_SLOTS, _DAY_SPAN, SOURCES[source]))
+    data = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2)
+    order = np.argsort(data[:, 0])
+    points, prices = data[order, 0], data[order, 1] / 100
+    keys = points // _DAY_SPAN
+
+    # Copies without a priced variant of their own take the card's lowest priced variant code
+    # (normal before holofoil before reverse holo ...; Cardmarket's trend price is variant 0)
+    defaults = np.full(size, -1, dtype=np.int64)
+    unique_keys = np.unique(keys)
+    rowids, first = np.unique(unique_keys // _VARIANT_SLOTS, return_index=True)
+    defaults[rowids] = unique_keys[first]
+    return History(points, prices, defaults, card_ids, expansion_of, expansions)
+
+
+class Holdings:
+    """An owner's collection as parallel arrays of rowid, variant and quantity (read-only)."""
+
+    __slots__ = ("rowids", "variants", "quantities")
+
+    def __init__(self, rowids, variants, quantities):
+        self.rowids, self.variants, self.quantities = rowids, variants, quantities
+
+
+def build_holdings(conn, owner_id):
+    """Every owned copy, by variant; copies recorded without one count as variant 0."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute("""
+        SELECT c.rowid, v.variant, v.quantity FROM collection_variants v JOIN cards c ON c.id = v.card_id
+        WHERE v.owner_id = :owner
+        UNION ALL
+        SELECT c.rowid, 0, col.quantity - COALESCE((
+            SELECT SUM(v.quantity) FROM collection_variants v
+            WHERE v.owner_id = col.owner_id AND v.card_id = col.card_id
+        ), 0)
+        FROM collection col JOIN cards c ON c.id = col.card_id
+        WHERE col.owner_id = :owner
+    """, {"owner": owner_id}).fetchall()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    data = data[data[:, 2] > 0]
+    return Holdings(data[:, 0], data[:, 1], data[:, 2])
+
+
+def _per_card(values, rowids, fill):
+    """``values[rowids]``, with ``fill`` for cards newer than the history."""
+    inside = rowids < len(values)
+    return np.where(inside, values[np.where(inside, rowids, 0)], fill)
+
+
+def unit_prices(history, holdings, day):
+    """Price of one copy of every holding as of ``day`` (NaN when the card has no price)."""
+    prices = history.lookup(holdings.rowids * _VARIANT_SLOTS + holdings.variants, day)
+    missing = np.isnan(prices)
+    if missing.any():
+        prices[missing] = history.lookup(_per_card(history.defaults, holdings.rowids[missing], -1), day)
+    return prices
+
+
+def value(history, holdings, day):
+    """Total value and priced / unpriced copy counts of the holdings as of ``day``."""
+    prices = unit_prices(history, holdings, day)
+    priced = ~np.isnan(prices)
+    return {
+        "value": round(float(np.dot(prices[priced], holdings.quantities[priced])), 2),
+        "priced_quantity": int(holdings.quantities[priced].sum()),
+        "unpriced_quantity": int(holdings.quantities[~priced].sum()),
+    }
+
+
+def value_by_expansion(history, holdings, day):
+    """Value and copy count per expansion, most valuable first."""
+    prices = unit_prices(history, holdings, day)
+    values = np.nan_to_num(prices) * holdings.quantities
+    expansion = _per_card(history.expansion_of, holdings.rowids, -1)
+    known = expansion >= 0
+    count = len(history.expansions)
+    totals = np.bincount(expansion[known], weights=values[known], minlength=count)
+    quantities = np.bincount(expansion[known], weights=holdings.quantities[known], minlength=count)
+    return [
+        {"expansion_id": history.expansions[i][0], "name": history.expansions[i][1],
+         "value": round(float(totals[i]), 2), "quantity": int(quantities[i])}
+        for i in np.argsort(-totals, kind="stable") if quantities[i]
+    ]
+
+
+def movers(history, holdings, day, days, limit):
+    """The holdings whose value changed most over the last ``days``: {"gainers": [...], "losers": [...]}.
+
+    Each entry is (index into holdings, price then, price now, value change);
+    only holdings priced at both ends count.
+    """
+    now = unit_prices(history, holdings, day)
+    then = unit_prices(history, holdings, day - days)
+    change = (now - then) * holdings.quantities
+    valid = np.flatnonzero(~np.isnan(change) & (change != 0))
+
+    def top(candidates, sign):
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-sign * change[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-sign * change[candidates], kind="stable")]
+        return [(int(i), float(then[i]), float(now[i]), float(change[i])) for i in candidates]
+
+    return {
+        "gainers": top(valid[change[valid] > 0], 1),
+        "losers": top(valid[change[valid] < 0], -1),
+    }
@@ -0,0 +1,66 @@
+"""Helpers for turning user input into FTS5 queries and opaque page cursors."""
+import base64
+import json
+import re
+
+# Same notion of a "word" as the unicode61 tokenizer: runs of letters and digits
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def split_terms(value):
+    """Split a filter value like "Fire,Water" or ["Fire", "Water"] into clean terms."""
+    if not value:
+        return []
+    values = value if isinstance(value, (list, tuple)) else [value]
+    terms = []
+    for item in values:
+        for part in str(item).split(","):
+            part = part.strip()
+            if part and part.lower() not in {t.lower() for t in terms}:
+                terms.append(part)
+    return terms
+
+
+def build_match_query(query):
+    """Build an FTS5 MATCH expression, or None if the query has nothing searchable.
+
+    Every word of ``query`` becomes a prefix term ("char" finds Charizard), and all
+    words must match.
+    """
+    tokens = _TOKEN_RE.findall(query or "")
+    if not tokens:
+        return None
+    return " ".join(f"{_quote(token)}*" for token in tokens)
+
+
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def cursor_keys(state, count):
+    """The ``after`` keyset of a decoded cursor: ``count`` scalars, bound as-is into the next page's query.
+
+    Raises ValueError for anything else, so a tampered cursor is rejected rather than reaching SQLite.
+    """
+    values = state.get("after")
+    if (not isinstance(values, list) or len(values) != count
+            or not all(value is None or isinstance(value, (str, int, float)) for value in values)):
+        raise ValueError("Invalid cursor")
+    return values
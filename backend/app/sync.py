@@ -0,0 +1,163 @@
+"""HTTP client for the PokémonTCG.io API.
+
+One pooled ``requests.Session`` is shared by every sync. Calls go through a
+token-bucket rate limiter, carry a timeout, retry 429/5xx responses and
+connection errors with jittered exponential backoff, and follow the API's
+pagination. The base URL is configurable so the whole sync can be pointed at
+a local stub server.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import metrics
+
+API_BASE_URL = os.getenv("POKEMON_TCG_API_BASE_URL", "https://api.pokemontcg.io/v2").rstrip("/")
+API_KEY = os.getenv("POKEMON_TCG_API_KEY")
+PAGE_SIZE = int(os.getenv("POKEMON_TCG_API_PAGE_SIZE", "250"))
+# Requests per second. The API allows far more with a key than without one (30/min).
+RATE_WITH_KEY = float(os.getenv("POKEMON_TCG_API_RATE", "8"))
+RATE_WITHOUT_KEY = float(os.getenv("POKEMON_TCG_API_RATE_ANONYMOUS", "0.5"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "6"))
+MAX_RETRIES = int(os.getenv("POKEMON_TCG_API_MAX_RETRIES", "5"))
+TIMEOUT = (5, float(os.getenv("POKEMON_TCG_API_TIMEOUT", "60")))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Only the fields the ingestion code stores; keeps page payloads small
+CARD_FIELDS = "id,name,number,rarity,supertype,subtypes,hp,types,evolvesFrom,images,tcgplayer,cardmarket"
+
+
+class ApiError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ApiClient:
+    def __init__(self, base_url=API_BASE_URL, api_key=API_KEY, rate=None, workers=SYNC_WORKERS,
+                 max_retries=MAX_RETRIES, timeout=TIMEOUT, page_size=PAGE_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.page_size = page_size
+        if rate is None:
+            rate = RATE_WITH_KEY if api_key else RATE_WITHOUT_KEY
+        self.bucket = TokenBucket(rate)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["X-Api-Key"] = api_key
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter, capped; never shorter than what the server asked for
+        delay = random.uniform(0, min(60.0, 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def get(self, path, params=None):
+        """GET a JSON document, retrying transient failures. Raises ApiError when it gives up."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        endpoint = path.strip("/").split("/", 1)[0]
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.upstream_request_seconds.observe(time.perf_counter() - started, endpoint)
+                metrics.upstream_errors.inc(endpoint)
+                if attempt == self.max_retries:
+                    raise ApiError(f"Request to {url} failed: {e}")
+                metrics.upstream_retries.inc(endpoint)
+                self._backoff(attempt)
+                continue
+            metrics.upstream_request_seconds.observe(time.perf_counter() - started, endpoint)
+            metrics.upstream_responses.inc(endpoint, str(response.status_code))
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                metrics.upstream_retries.inc(endpoint)
+                self._backoff(attempt, response.headers.get("Retry-After"))
+                continue
+            raise ApiError(f"API request failed with status code {response.status_code}", response.status_code)
+
+    def iter_pages(self, path, params=None):
+        """Yield the ``data`` list of every page of a paginated endpoint."""
+        page = 1
+        while True:
+            payload = self.get(path, {**(params or {}), "page": page, "pageSize": self.page_size})
+            data = payload.get("data", [])
+            yield data
+            total = payload.get("totalCount", 0)
+            if not data or page * self.page_size >= total:
+                return
+            page += 1
+
+    def get_sets(self):
+        return [exp for page in self.iter_pages("sets") for exp in page]
+
+    def get_cards(self, set_id):
+        params = {"q": f"set.id:{set_id}", "select": CARD_FIELDS}
+        return [card for page in self.iter_pages("cards", params) for card in page]
+
+    def map_sets(self, set_ids, fn):
+        """Run ``fn(set_id)`` for every set with bounded concurrency.
+
+        Yields ``(set_id, result, error)`` as each set finishes; a failure in one
+        set never stops the others. Closing the generator cancels pending sets.
+        """
+        pool = ThreadPoolExecutor(max_workers=max(self.workers, 1), thread_name_prefix="sync")
+        futures = {pool.submit(fn, set_id): set_id for set_id in set_ids}
+        try:
+            for future in as_completed(futures):
+                set_id = futures[future]
+                try:
+                    yield set_id, future.result(), None
+                except Exception as e:
+                    yield set_id, None, e
+        finally:
+            # If the caller stops early (e.g. a cancelled job), drop the sets not started yet
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    def close(self):
+        self.session.close()
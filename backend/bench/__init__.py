@@ -0,0 +1,7 @@
+"""Benchmark suite for the backend.
+
+Builds synthetic catalogues and collections at a multiple of the seed
+database, serves them from a local stub of the PokémonTCG.io API, and times
+app/database.py and the FastAPI app (in-process) against them. See
+bench/run.py for usage; results are JSON files that bench/compare.py diffs.
+"""
@@ -0,0 +1,77 @@
+"""Synthetic catalogues in the PokémonTCG.io API shape, scaled up from the seed database.
+
+Scale ``n`` repeats every seed expansion ``n`` times: copy 0 keeps the real
+set IDs, copy ``k`` gets ``<set_id>x<k>`` (cards ``<set_id>x<k>-<number>``).
+Cards are generated on demand per set, so even the 100x catalogue stays small
+in memory.
+"""
+import os
+import sqlite3
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "seed", "pokemon.db")
+
+
+def _split(value):
+    return [part for part in (value or "").split(",") if part]
+
+
+def _api_set(row):
+    return {
+        "id": row["id"], "name": row["name"], "series": row["series"],
+        "printedTotal": row["printed_total"], "total": row["total"],
+        "legalities": {"unlimited": row["legal_unlimited"], "standard": row["legal_standard"],
+                       "expanded": row["legal_expanded"]},
+        "ptcgoCode": row["ptcgo_code"], "releaseDate": row["release_date"], "updatedAt": row["updated_at"],
+        "images": {"symbol": row["symbol_url"], "logo": row["logo_url"]},
+    }
+
+
+def _api_card(row):
+    return {
+        "id": row["id"], "name": row["name"], "number": row["number"], "rarity": row["rarity"],
+        "supertype": row["supertype"], "subtypes": _split(row["subtype"]), "hp": row["hp"],
+        "types": _split(row["types"]), "evolvesFrom": row["evolves_from"],
+        "images": {"small": row["image_url"]},
+    }
+
+
+class Catalogue:
+    def __init__(self, scale=1, seed_path=SEED_PATH):
+        self.scale = scale
+        conn = sqlite3.connect(f"file:{seed_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            self._sets = [_api_set(row) for row in conn.execute("SELECT * FROM expansions ORDER BY release_date, id")]
+            self._cards = {}
+            for row in conn.execute("SELECT * FROM cards ORDER BY expansion_id, number_int, id"):
+                self._cards.setdefault(row["expansion_id"], []).append(_api_card(row))
+        finally:
+            conn.close()
+        # Only sets that have cards are worth copying
+        self._sets = [exp for exp in self._sets if exp["id"] in self._cards]
+        self._copies = {}
+        for k in range(scale):
+            for exp in self._sets:
+                self._copies[exp["id"] if k == 0 else f"{exp['id']}x{k}"] = (exp, k)
+
+    def set_ids(self):
+        return list(self._copies)
+
+    def card_count(self):
+        return self.scale * sum(len(cards) for cards in self._cards.values())
+
+    def get_set(self, set_id):
+        exp, k = self._copies[set_id]
+        if k == 0:
+            return exp
+        return {**exp, "id": set_id, "name": f"{exp['name']} {k}"}
+
+    def sets(self):
+        return [self.get_set(set_id) for set_id in self._copies]
+
+    def cards(self, set_id):
+        exp, k = self._copies[set_id]
+        cards = self._cards[exp["id"]]
+        if k == 0:
+            return cards
+        return [{**card, "id": f"{set_id}-{card['number']}"} for card in cards]
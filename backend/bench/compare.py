@@ -0,0 +1,66 @@
+"""Compare two bench/run.py result files and flag regressions.
+
+    python -m bench.compare baseline.json current.json [--threshold 0.2]
+
+Latency scenarios compare p50_ms and p99_ms; sync scenarios compare seconds.
+A metric regresses when it is more than ``threshold`` (relative) slower and
+also slower by at least ``--min-ms`` (so sub-millisecond noise is ignored).
+Exits with status 1 if anything regressed.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p99_ms")
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.2, min_ms=0.5):
+    """Yield ``(run, scenario, metric, old, new, regressed)`` for every metric present in both files."""
+    for run, current_run in current["runs"].items():
+        baseline_run = baseline["runs"].get(run)
+        if baseline_run is None:
+            continue
+        for scenario, result in current_run["results"].items():
+            old_result = baseline_run["results"].get(scenario)
+            if old_result is None:
+                continue
+            if "seconds" in result:
+                pairs = [("seconds", old_result.get("seconds"), result["seconds"], 1000)]
+            else:
+                pairs = [(metric, old_result.get(metric), result.get(metric), 1) for metric in METRICS]
+            for metric, old, new, to_ms in pairs:
+                if old is None or new is None:
+                    continue
+                regressed = new > old * (1 + threshold) and (new - old) * to_ms >= min_ms
+                yield run, scenario, metric, old, new, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this (default 0.5)")
+    args = parser.parse_args()
+
+    baseline, current = _load(args.baseline), _load(args.current)
+    print(f"baseline {baseline['meta'].get('git_commit')}  current {current['meta'].get('git_commit')}")
+    regressions = 0
+    for run, scenario, metric, old, new, regressed in compare(baseline, current, args.threshold, args.min_ms):
+        change = (new - old) / old * 100 if old else 0.0
+        marker = "❌" if regressed else "  "
+        print(f"{marker} {run:>5} {scenario:<34} {metric:<8} {old:>10.3f} -> {new:>10.3f}  {change:+7.1f}%")
+        regressions += regressed
+    if regressions:
+        print(f"❌ {regressions} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+    print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
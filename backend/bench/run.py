@@ -0,0 +1,301 @@
+"""Run the benchmark suite and write the results as JSON.
+
+    cd backend
+    python -m bench.run --scale 1 --scale 10 --output bench-results.json
+    python -m bench.compare baseline.json bench-results.json
+
+For each scale the synthetic database is built once and cached under
+bench/data/ (rebuilt when the schema changes or with --rebuild); every run
+works on a fresh copy, so updates never leak between runs. Scenarios:
+
+* ``direct.*``: app.database functions called on this thread
+* ``http.*``: the FastAPI app in-process through TestClient (response cache
+  off unless --response-cache, so repeated inputs still reach SQLite)
+* ``ingest.set``: storing one new set via _store_cards
+* ``sync.*``: whole syncs against bench/stub_api.py over HTTP
+
+Each result has n, ops_per_s, mean_ms, p50_ms, p99_ms and max_ms; sync
+results report seconds and cards_per_s instead.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+
+
+def summarize(timings, elapsed):
+    ordered = sorted(timings)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))] * 1000
+
+    return {
+        "n": len(ordered),
+        "ops_per_s": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50), 3),
+        "p99_ms": round(percentile(99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(fn, inputs, warmup=5):
+    """Call ``fn(*args)`` for every tuple in ``inputs`` (after a few warm-up calls) and summarize."""
+    for args in inputs[:warmup]:
+        fn(*args)
+    timings = []
+    started = time.perf_counter()
+    for args in inputs:
+        call_started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - call_started)
+    return summarize(timings, time.perf_counter() - started)
+
+
+class Workload:
+    """Random but reproducible inputs drawn from the database under test."""
+
+    def __init__(self, path, iterations, seed):
+        rng = random.Random(seed)
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            names = [row[0] for row in conn.execute("SELECT DISTINCT name FROM cards")]
+            types = [row[0] for row in conn.execute("SELECT DISTINCT types FROM cards WHERE types != ''")]
+            set_ids = [row[0] for row in conn.execute("SELECT DISTINCT expansion_id FROM cards")]
+            owned_set_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT c.expansion_id FROM collection col JOIN cards c ON c.id = col.card_id")]
+            card_ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id")]
+        finally:
+            conn.close()
+
+        self.searches = []
+        for _ in range(iterations):
+            word = rng.choice(names).split()[0].lower()
+            query = word[:rng.randint(3, 6)]
+            type_ = rng.choice(types).split(",")[0] if rng.random() < 0.2 else None
+            self.searches.append((query, type_))
+        self.set_ids = [(rng.choice(set_ids),) for _ in range(iterations)]
+        self.owned_set_ids = [(rng.choice(owned_set_ids or set_ids),) for _ in range(iterations)]
+        # +1 then -1 on the same card, so the collection ends where it started
+        self.updates = [(card_id, change) for card_id in rng.sample(card_ids, iterations // 2) for change in (1, -1)]
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=BENCH_DIR)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, cwd=BENCH_DIR)
+        return commit.stdout.strip() or None, bool(dirty.stdout.strip())
+    except OSError:
+        return None, None
+
+
+def run_direct(workload, iterations):
+    import app.database as db
+
+    def consume(result):
+        _, records = result
+        for _ in records:
+            pass
+
+    return {
+        "direct.search": measure(lambda q, t: db.get_cards_by_name(q, type_=t), workload.searches),
+        "direct.expansion_cards": measure(lambda s: consume(db.get_cards_by_expansion(s)), workload.set_ids),
+        "direct.collection_expansion": measure(db.get_collection_by_expansion, workload.owned_set_ids),
+        "direct.collection_page": measure(lambda: consume(db.get_collection(limit=500)), [()] * iterations),
+        "direct.expansions": measure(db.get_expansions, [()] * iterations),
+        "direct.widget_total_cards": measure(db.get_total_cards_collection, [()] * iterations),
+        "direct.widget_total_expansions": measure(db.get_total_expansions_collection, [()] * iterations),
+        "direct.widget_cards_by_expansion": measure(db.get_cards_by_expansion_collection, [()] * iterations),
+        "direct.update_quantity": measure(db.update_card_quantity, workload.updates),
+    }
+
+
+def run_http(workload, iterations):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    results = {}
+    with TestClient(main.app) as client:
+        def get(path, **params):
+            response = client.get(path, params=params)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} -> {response.status_code}: {response.text[:200]}")
+
+        def update(card_id, change):
+            response = client.post("/api/collection/update/", params={"card_id": card_id, "change": change})
+            if response.status_code != 200:
+                raise RuntimeError(f"update {card_id} -> {response.status_code}: {response.text[:200]}")
+
+        results["http.search"] = measure(
+            lambda q, t: get("/api/search/cards/", q=q, **({"type_": t} if t else {})), workload.searches)
+        results["http.expansion_cards"] = measure(lambda s: get(f"/api/expansion/{s}/cards"), workload.set_ids)
+        results["http.collection_expansion"] = measure(lambda s: get(f"/api/collection/{s}/"), workload.owned_set_ids)
+        results["http.collection_page"] = measure(lambda: get("/api/collection/", limit=500), [()] * iterations)
+        results["http.expansions"] = measure(lambda: get("/api/expansions/"), [()] * iterations)
+        for name, path in (("total_cards", "totalCards"), ("total_expansions", "totalExpansions"),
+                           ("cards_by_expansion", "cardsByExpansion")):
+            results[f"http.widget_{name}"] = measure(lambda p=path: get(f"/api/widgets/{p}"), [()] * iterations)
+        results["http.update_quantity"] = measure(update, workload.updates)
+    return results
+
+
+def run_ingest(catalogue, iterations, seed):
+    """Time storing brand-new sets (copies of random seed sets under fresh IDs)."""
+    import app.database as db
+
+    rng = random.Random(seed)
+    base_ids = catalogue.set_ids()[:len(catalogue.set_ids()) // catalogue.scale]
+    inputs = []
+    for i in range(max(iterations // 10, 5)):
+        base = catalogue.get_set(rng.choice(base_ids))
+        set_id = f"{base['id']}bench{i}"
+        cards = [{**card, "id": f"{set_id}-{card['number']}"} for card in catalogue.cards(base["id"])]
+        inputs.append((set_id, cards, {**base, "id": set_id}))
+    return {"ingest.set": measure(db._store_cards, inputs, warmup=0)}
+
+
+def run_sync(stub, catalogue, path, sync_sets):
+    """Full sync of ``sync_sets`` sets into an empty database, then an unchanged delta and full re-sync."""
+    import app.database as db
+
+    set_ids = catalogue.set_ids()[:sync_sets]
+    stub.serve(catalogue, set_ids)
+    db.open_pool(path)
+    results = {}
+    try:
+        for name, delta in (("sync.full", False), ("sync.delta_unchanged", True), ("sync.full_unchanged", False)):
+            stub.serve(catalogue, set_ids)
+            started = time.perf_counter()
+            report = db.sync_catalogue(delta=delta)
+            seconds = time.perf_counter() - started
+            if report["failed"]:
+                raise RuntimeError(f"{name}: {len(report['failed'])} sets failed: {list(report['failed'].items())[:3]}")
+            results[name] = {
+                "seconds": round(seconds, 3), "sets": report["sets_changed"], "cards": report["cards"],
+                "cards_per_s": round(report["cards"] / seconds, 1), "requests": stub.requests,
+                "rate_limited": stub.rate_limited,
+            }
+    finally:
+        db.close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search, expansion views, widgets, updates and syncs.")
+    parser.add_argument(
+        "--scale", type=int, action="append", help="catalogue multiple of the seed (repeatable; default 1)"
+    )
+    parser.add_argument("--owned", type=int, default=100_000, help="distinct cards in the collection (default 100000)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per scenario (default 200)")
+    parser.add_argument("--sync-sets", type=int, default=100, help="sets fetched by the sync scenarios (default 100)")
+    parser.add_argument("--stub-429-every", type=int, default=0, help="answer every Nth stub request with a 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", action="append", choices=("direct", "http", "ingest", "sync"),
+                        help="run only these groups (repeatable)")
+    parser.add_argument("--response-cache", action="store_true", help="keep the response cache on for http.*")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild cached synthetic databases")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", "-o", help="JSON output file (default: standard output)")
+    args = parser.parse_args()
+    scales = args.scale or [1]
+    groups = set(args.only or ("direct", "http", "ingest", "sync"))
+
+    from bench.catalogue import Catalogue
+    from bench.stub_api import StubApi
+
+    stub = StubApi(rate_limit_every=args.stub_429_every).start()
+    # Configure the app before it is imported: its modules read the environment at import time
+    os.environ["POKEMON_TCG_API_BASE_URL"] = stub.url
+    os.environ["POKEMON_TCG_API_KEY"] = "bench"
+    os.environ["POKEMON_TCG_API_RATE"] = "100000"
+    os.environ["IMAGE_PREFETCH"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.response_cache:
+        os.environ["RESPONSE_CACHE_ENTRIES"] = "0"
+
+    import logging
+
+    logging.basicConfig(level=os.environ["LOG_LEVEL"], format="%(message)s")
+    import app.database as db
+    from bench.synth import build_database, is_current, remove_database
+
+    commit, dirty = _git_commit()
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": commit, "git_dirty": dirty,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+            "iterations": args.iterations, "owned": args.owned, "seed": args.seed,
+            "response_cache": args.response_cache,
+        },
+        "runs": {},
+    }
+    os.makedirs(args.data_dir, exist_ok=True)
+    try:
+        for scale in scales:
+            catalogue = Catalogue(scale)
+            cached = os.path.join(args.data_dir, f"x{scale}-owned{args.owned}-seed{args.seed}.db")
+            if args.rebuild or not is_current(cached):
+                print(f"⏳ Building the x{scale} database...", file=sys.stderr)
+                started = time.perf_counter()
+                build_database(cached, catalogue, args.owned, args.seed)
+                print(f"✔ Built in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+            work = os.path.join(args.data_dir, f"work-x{scale}.db")
+            remove_database(work)  # a stale -wal next to the fresh copy would corrupt it
+            shutil.copyfile(cached, work)
+            workload = Workload(work, args.iterations, args.seed)
+            with sqlite3.connect(f"file:{work}?mode=ro", uri=True) as conn:
+                dataset = {
+                    "expansions": conn.execute("SELECT COUNT(*) FROM expansions").fetchone()[0],
+                    "cards": conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0],
+                    "owned": conn.execute("SELECT COUNT(*) FROM collection WHERE quantity > 0").fetchone()[0],
+                    "bytes": os.path.getsize(work),
+                }
+            results = {}
+            db.open_pool(work)
+            try:
+                if "direct" in groups:
+                    print(f"⏳ x{scale}: direct", file=sys.stderr)
+                    results.update(run_direct(workload, args.iterations))
+                if "http" in groups:
+                    print(f"⏳ x{scale}: http", file=sys.stderr)
+                    results.update(run_http(workload, args.iterations))
+                    db.open_pool(work)  # the app's lifespan closed it
+                if "ingest" in groups:
+                    print(f"⏳ x{scale}: ingest", file=sys.stderr)
+                    results.update(run_ingest(catalogue, args.iterations, args.seed))
+            finally:
+                db.close_pool()
+            if "sync" in groups:
+                print(f"⏳ x{scale}: sync", file=sys.stderr)
+                sync_path = os.path.join(args.data_dir, f"sync-x{scale}.db")
+                remove_database(sync_path)
+                results.update(run_sync(stub, catalogue, sync_path, args.sync_sets))
+            output["runs"][f"x{scale}"] = {"scale": scale, "dataset": dataset, "results": results}
+    finally:
+        stub.stop()
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"✅ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
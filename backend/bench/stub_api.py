@@ -0,0 +1,106 @@
+"""Local stand-in for the PokémonTCG.io API, serving a bench.catalogue.Catalogue.
+
+Implements what app/sync.py uses: paginated ``/sets`` and
+``/cards?q=set.id:<id>``. It can inject a 429 every ``rate_limit_every``
+requests to exercise the client's retry path.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        if stub.count_request():
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+        page_size = int(query.get("pageSize", ["250"])[0])
+        if url.path.rstrip("/").endswith("/sets"):
+            items = stub.sets()
+        elif url.path.rstrip("/").endswith("/cards"):
+            set_id = query.get("q", [""])[0].partition("set.id:")[2]
+            items = stub.cards(set_id)
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps({
+            "data": items[(page - 1) * page_size:page * page_size],
+            "page": page, "pageSize": page_size, "count": 0, "totalCount": len(items),
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubApi:
+    def __init__(self, catalogue=None, set_ids=None, rate_limit_every=0):
+        self.catalogue = catalogue
+        self.set_ids = set_ids
+        self._allowed = set(set_ids or ())
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v2"
+
+    def serve(self, catalogue, set_ids=None):
+        """Switch to another catalogue (optionally only some of its sets) and reset the counters."""
+        with self._lock:
+            self.catalogue, self.set_ids = catalogue, set_ids
+            self._allowed = set(set_ids or ())
+            self.requests = self.rate_limited = 0
+
+    def count_request(self):
+        """Count a request; True when it should be answered with a 429."""
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return True
+        return False
+
+    def sets(self):
+        if self.set_ids is None:
+            return self.catalogue.sets()
+        return [self.catalogue.get_set(set_id) for set_id in self.set_ids]
+
+    def cards(self, set_id):
+        if self.set_ids is not None and set_id not in self._allowed:
+            return []
+        try:
+            return self.catalogue.cards(set_id)
+        except KeyError:
+            return []
+
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        threading.Thread(target=self._server.serve_forever, name="stub-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,64 @@
+"""Build synthetic benchmark databases through the app's own ingestion path.
+
+Cards are stored with app.database._store_cards (what a sync does after each
+API fetch) and the collection is loaded with import_collection, so the files
+always match the current schema and migrations.
+"""
+import io
+import logging
+import os
+import random
+import sqlite3
+
+import app.database as db
+from app.migrations import MIGRATIONS
+
+logger = logging.getLogger(__name__)
+
+# Sets stored per transaction, so after-commit work (expansion tree rebuild) runs once per batch
+SETS_PER_TRANSACTION = 200
+
+
+def remove_database(path):
+    """Delete a database file together with its -wal and -shm files."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def is_current(path):
+    """Does ``path`` exist and carry the latest schema version?"""
+    if not os.path.exists(path):
+        return False
+    conn = db.connect(path, readonly=True)
+    try:
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+    return version == MIGRATIONS[-1][0]
+
+
+def build_database(path, catalogue, owned=100_000, seed=1):
+    """Create ``path`` holding ``catalogue`` and a random collection of ``owned`` distinct cards."""
+    remove_database(path)
+    db.open_pool(path)
+    try:
+        set_ids = catalogue.set_ids()
+        for start in range(0, len(set_ids), SETS_PER_TRANSACTION):
+            with db.write_connection():
+                for set_id in set_ids[start:start + SETS_PER_TRANSACTION]:
+                    db._store_cards(set_id, catalogue.cards(set_id), catalogue.get_set(set_id))
+            logger.info("⏳ Stored %d/%d sets", min(start + SETS_PER_TRANSACTION, len(set_ids)), len(set_ids))
+
+        with db.read_connection() as conn:
+            card_ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id")]
+        rng = random.Random(seed)
+        chosen = rng.sample(card_ids, min(owned, len(card_ids)))
+        lines = ["card_id,quantity"] + [f"{card_id},{rng.choice((1, 1, 1, 2, 2, 3, 4))}" for card_id in chosen]
+        report = db.import_collection(io.BytesIO("\n".join(lines).encode()), "csv", "set")
+        logger.info("✔ Built %s: %d cards, %d owned", path, len(card_ids), report["imported"])
+    finally:
+        db.close_pool()
+    return path
@@ -7,6 +7,9 @@ mkdir -p /app/data
 if [ ! -f /app/data/app.db ]; then
   cp /app/seed/pokemon.db /app/data/app.db
   echo "[seed] Copied seed DB to /app/data/app.db"
+else
+  # A newer image brings a newer seed: merge its catalogue, keeping the collection
+  DATABASE_PATH=/app/data/app.db python -m app.database apply-snapshot --if-newer /app/seed/pokemon.db
 fi
 
 exec uvicorn main:app --host 0.0.0.0 --port 8000
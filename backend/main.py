@@ -1,8 +1,50 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from app.api.compression import CompressionMiddleware
+from app.api.responses import FastJSONResponse
 from app.api.routes import router as api_router
+import app.async_database as adb
+import app.database as db
+import app.jobs as jobs
+from app import cache, images, metrics
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared SQLite pool once; every request borrows from it
+    db.open_pool()
+    jobs.runner.start()
+    yield
+    jobs.runner.stop()
+    adb.shutdown()
+    images.flush_touches()
+    db.close_pool()
+
 
-app = FastAPI()
+@metrics.collector
+def response_cache_metrics():
+    stats = cache.responses.stats()
+    return [
+        ("response_cache_entries", "gauge", "Responses held in the response cache", stats["entries"]),
+        ("response_cache_bytes", "gauge", "Bytes held in the response cache", stats["bytes"]),
+        ("response_cache_hits_total", "counter", "Response cache hits", stats["hits"]),
+        ("response_cache_misses_total", "counter", "Response cache misses", stats["misses"]),
+    ]
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,5 +53,15 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
 )
-print("Registering router...")
-app.include_router(api_router, prefix="/api")
\ No newline at end of file
+# Outermost, so the recorded latency includes compression
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+logger.info("Registering router...")
+app.include_router(api_router, prefix="/api")
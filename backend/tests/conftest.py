@@ -0,0 +1,80 @@
+import copy
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.database as db
+from app.sync import ApiClient
+from bench.catalogue import Catalogue
+from bench.stub_api import StubApi
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "seed", "pokemon.db")
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A private copy of the seed catalogue (empty collection) as the app's database."""
+    path = str(tmp_path / "pokemon.db")
+    shutil.copyfile(SEED_PATH, path)
+    monkeypatch.setattr(db, "DATABASE_PATH", path)
+    monkeypatch.setenv("IMAGE_PREFETCH", "0")
+    db.close_pool()
+    yield path
+    db.close_pool()
+
+
+@pytest.fixture
+def empty_database(tmp_path, monkeypatch):
+    """A database file with the current schema and nothing in it."""
+    path = str(tmp_path / "empty.db")
+    monkeypatch.setattr(db, "DATABASE_PATH", path)
+    db.close_pool()
+    yield path
+    db.close_pool()
+
+
+@pytest.fixture
+def client(database):
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+class EditableCatalogue:
+    """A few seed sets in API shape that a test can change between syncs."""
+
+    def __init__(self, set_ids):
+        seed = Catalogue()
+        self.set_objects = {set_id: copy.deepcopy(seed.get_set(set_id)) for set_id in set_ids}
+        self.set_cards = {set_id: copy.deepcopy(seed.cards(set_id)) for set_id in set_ids}
+
+    def sets(self):
+        return list(self.set_objects.values())
+
+    def get_set(self, set_id):
+        return self.set_objects[set_id]
+
+    def cards(self, set_id):
+        return self.set_cards[set_id]
+
+    def card_count(self):
+        return sum(len(cards) for cards in self.set_cards.values())
+
+
+@pytest.fixture
+def catalogue():
+    return EditableCatalogue(["base1", "base2", "base3", "base4", "base5"])
+
+
+@pytest.fixture
+def stub(catalogue, monkeypatch):
+    """A local stand-in for the PokémonTCG.io API serving ``catalogue``, used by every sync."""
+    stub = StubApi(catalogue).start()
+    client = ApiClient(base_url=stub.url, rate=1000, workers=3, page_size=50)
+    monkeypatch.setattr(db, "_api_client", client)
+    yield stub
+    client.close()
+    stub.stop()
@@ -0,0 +1,78 @@
+import pytest
+
+import app.database as db
+
+CARDS = "/api/expansion/base1/cards"
+
+
+def _split(value):
+    return {part for part in (value or "").split(",") if part}
+
+
+def _reference(where):
+    """base1 card ids matching a condition written against the comma-joined columns."""
+    with db.read_connection() as conn:
+        rows = conn.execute("SELECT id, types, subtype, hp FROM cards WHERE expansion_id = 'base1'").fetchall()
+    return sorted(row["id"] for row in rows if where(row))
+
+
+def _ids(client, **params):
+    response = client.get(CARDS, params={"fields": "id", "sort": "id", **params})
+    assert response.status_code == 200
+    return [card["id"] for card in response.json()["cards"]]
+
+
+def test_junction_rows_match_the_display_columns(database):
+    with db.read_connection() as conn:
+        cards = conn.execute("SELECT id, types, subtype, typeof(hp) AS hp_type FROM cards").fetchall()
+        types, subtypes = {}, {}
+        for card_id, value in conn.execute("SELECT card_id, type FROM card_types"):
+            types.setdefault(card_id, set()).add(value)
+        for card_id, value in conn.execute("SELECT card_id, subtype FROM card_subtypes"):
+            subtypes.setdefault(card_id, set()).add(value)
+    for card in cards:
+        assert types.get(card["id"], set()) == _split(card["types"])
+        assert subtypes.get(card["id"], set()) == _split(card["subtype"])
+        assert card["hp_type"] in ("integer", "null")
+
+
+@pytest.mark.parametrize("params, where", [
+    ({"type_": "Fire"}, lambda row: "Fire" in _split(row["types"])),
+    ({"type_": "fire,WATER"}, lambda row: _split(row["types"]) & {"Fire", "Water"}),
+    ({"type_": ["Fire", "Psychic"]}, lambda row: _split(row["types"]) & {"Fire", "Psychic"}),
+    ({"subtype": "Stage 2"}, lambda row: "Stage 2" in _split(row["subtype"])),
+    ({"type_": "Water", "subtype": "Basic"}, lambda row: "Water" in _split(row["types"])
+     and "Basic" in _split(row["subtype"])),
+    # Compared as integers: "90" < "100" would not hold as text
+    ({"hp_min": 90, "hp_max": 100}, lambda row: row["hp"] is not None and 90 <= row["hp"] <= 100),
+    ({"hp_min": 100}, lambda row: row["hp"] is not None and row["hp"] >= 100),
+])
+def test_attribute_filters(client, params, where):
+    expected = _reference(where)
+    assert expected
+    assert _ids(client, **params) == expected
+
+
+def test_hp_sorts_numerically(client):
+    response = client.get(CARDS, params={"fields": "id,hp", "sort": "-hp", "hp_min": 1})
+    hps = [card["hp"] for card in response.json()["cards"]]
+    assert hps == sorted(hps, reverse=True) and all(isinstance(hp, int) for hp in hps)
+
+
+def test_syncs_rewrite_and_deletes_remove_junction_rows(database, catalogue, stub):
+    cards = catalogue.set_cards["base1"]
+    charizard = next(card for card in cards if card["id"] == "base1-4")
+    charizard.update(types=["Water", "Dragon"], subtypes=["Basic"], hp="90")
+    catalogue.set_cards["base1"] = [card for card in cards if card["id"] != "base1-5"]
+    assert not db.sync_cards(["base1"])["failed"]
+
+    with db.read_connection() as conn:
+        def attributes(card_id):
+            return (
+                {row[0] for row in conn.execute("SELECT type FROM card_types WHERE card_id = ?", (card_id,))},
+                {row[0] for row in conn.execute("SELECT subtype FROM card_subtypes WHERE card_id = ?", (card_id,))},
+            )
+
+        assert attributes("base1-4") == ({"Water", "Dragon"}, {"Basic"})
+        assert conn.execute("SELECT hp FROM cards WHERE id = 'base1-4'").fetchone()[0] == 90
+        assert attributes("base1-5") == (set(), set())
@@ -0,0 +1,51 @@
+import pytest
+
+import app.database as db
+
+
+def _collection():
+    with db.read_connection() as conn:
+        return dict(conn.execute("SELECT card_id, quantity FROM collection WHERE owner_id = ?", (db.DEFAULT_OWNER_ID,)))
+
+
+def test_batch_applies_items_in_order(client):
+    response = client.post("/api/collection/batch", json={"items": [
+        {"card_id": "base1-4", "change": 2},
+        {"card_id": "base1-4", "change": 1},
+        {"card_id": "base1-1", "quantity": 3},
+        {"card_id": "no-such-card", "change": 1},
+        {"card_id": "base1-2", "change": -5},
+        {"card_id": "base1-1", "change": -1},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [(result["card_id"], result["ok"], result.get("quantity")) for result in body["results"]] == [
+        ("base1-4", True, 2), ("base1-4", True, 3), ("base1-1", True, 3),
+        ("no-such-card", False, None), ("base1-2", True, 0), ("base1-1", True, 2),
+    ]
+    assert body["results"][3]["error"] == "Unknown card"
+    assert body["stats"]["base1"]["total"] == "2/102"
+    assert body["totals"] == {"totalCards": 5, "totalExpansions": 1}
+    assert _collection() == {"base1-4": 3, "base1-1": 2}
+
+
+def test_an_invalid_item_rejects_the_whole_batch(client):
+    response = client.post("/api/collection/batch", json={"items": [
+        {"card_id": "base1-4", "change": 2},
+        {"card_id": "base1-1", "change": 1, "quantity": 3},
+    ]})
+    assert response.status_code == 422
+    assert _collection() == {}
+
+
+def test_a_failing_batch_writes_nothing(database, monkeypatch):
+    db.apply_collection_changes([{"card_id": "base1-4", "quantity": 1}])
+
+    def fail(*args):
+        raise RuntimeError("stats failed")
+
+    monkeypatch.setattr(db, "_expansion_stats", fail)
+    with pytest.raises(RuntimeError):
+        db.apply_collection_changes([{"card_id": "base1-4", "change": 2}, {"card_id": "base1-1", "quantity": 3}])
+    assert _collection() == {"base1-4": 1}
+    assert db.get_total_cards_collection() == 1
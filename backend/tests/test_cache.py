@@ -0,0 +1,62 @@
+import app.database as db
+from app import cache
+
+CARDS = "/api/expansion/base1/cards"
+
+
+def test_repeated_gets_are_served_from_the_cache(client):
+    first = client.get(CARDS, params={"fields": "id,name", "limit": 5})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    hits = cache.responses.stats()["hits"]
+
+    # Same query in another parameter order
+    again = client.get(CARDS, params={"limit": 5, "fields": "id,name"})
+    assert (again.content, again.headers["ETag"]) == (first.content, etag)
+    assert cache.responses.stats()["hits"] == hits + 1
+
+    other = client.get(CARDS, params={"fields": "id", "limit": 5})
+    assert other.headers["ETag"] != etag
+
+
+def test_if_none_match_gets_a_bodiless_304(client):
+    gzip = {"Accept-Encoding": "gzip"}
+    etag = client.get(CARDS, params={"limit": 5}, headers=gzip).headers["ETag"]
+    # The client accepts gzip, so the tag is that of the compressed representation
+    assert etag.endswith('-gzip"')
+    plain = etag.replace("-gzip", "")
+    # A 304 echoes the tag of the representation the client holds
+    for header, echoed in ((etag, etag), (f"W/{etag}", etag), (f'"other", {etag}', etag), (plain, plain),
+                           ("*", plain)):
+        response = client.get(CARDS, params={"limit": 5}, headers={**gzip, "If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.content == b""
+        assert response.headers["ETag"] == echoed
+    assert client.get(CARDS, params={"limit": 5}, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_a_committed_write_bumps_the_generation(client, catalogue, stub):
+    etag = client.get(CARDS, params={"limit": 5}).headers["ETag"]
+    generation = cache.responses.generation
+
+    # A collection write drops the entries but leaves the catalogue's bytes, and so the ETag, alone
+    db.update_card_quantity("base1-4", 1)
+    assert cache.responses.generation > generation
+    assert cache.responses.stats()["entries"] == 0
+    assert client.get(CARDS, params={"limit": 5}).headers["ETag"] == etag
+
+    catalogue.set_cards["base1"][0]["name"] = "Alakazam Prime"
+    db.sync_cards(["base1"])
+    response = client.get(CARDS, params={"limit": 5}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["cards"][0]["name"] == "Alakazam Prime"
+
+
+def test_a_body_built_before_a_bump_is_not_stored():
+    responses = cache.ResponseCache()
+    generation = responses.generation
+    responses.bump()
+    body, etag = responses.put("/key", generation, b"{}")
+    assert etag == cache.make_etag(b"{}")
+    assert responses.get("/key") is None
@@ -0,0 +1,63 @@
+import copy
+
+import pytest
+
+import app.database as db
+
+
+def test_tree_groups_expansions_by_series(client):
+    body = client.get("/api/expansions/").json()
+    grouped, series = body["expansions"], body["series"]
+    assert [entry["name"] for entry in series] == list(grouped)
+
+    latest = [entry["latest_release"] for entry in series]
+    assert latest == sorted(latest, reverse=True)
+    with db.read_connection() as conn:
+        counts = dict(conn.execute("SELECT expansion_id, COUNT(*) FROM cards GROUP BY expansion_id").fetchall())
+        assert sum(len(expansions) for expansions in grouped.values()) == \
+            conn.execute("SELECT COUNT(*) FROM expansions").fetchone()[0]
+    for entry in series:
+        expansions = grouped[entry["name"]]
+        dates = [expansion["release_date"] for expansion in expansions]
+        assert dates == sorted(dates, reverse=True) and entry["latest_release"] == dates[0]
+        assert entry["expansion_count"] == len(expansions)
+        assert entry["card_count"] == sum(counts.get(expansion["id"], 0) for expansion in expansions)
+        assert all(expansion["card_count"] == counts.get(expansion["id"], 0) for expansion in expansions)
+    assert grouped["Base"][-1]["id"] == "base1"
+
+
+def test_a_catalogue_sync_swaps_in_a_new_tree(client, catalogue, stub):
+    before = client.get("/api/expansions/")
+    etag = before.headers["ETag"]
+    assert client.get("/api/expansions/", headers={"If-None-Match": etag}).status_code == 304
+
+    tree = db.get_expansion_tree()
+    db.update_card_quantity("base1-4", 1)
+    assert db.get_expansion_tree() is tree  # collection writes keep it
+
+    new_set = {**copy.deepcopy(catalogue.get_set("base1")), "id": "promo1", "name": "Test Promos",
+               "series": "Test Series", "releaseDate": "2099/01/01", "updatedAt": "2099/01/01 00:00:00"}
+    catalogue.set_objects["promo1"] = new_set
+    catalogue.set_cards["promo1"] = [
+        {**card, "id": f"promo1-{card['number']}"} for card in catalogue.cards("base1")[:3]
+    ]
+    assert not db.sync_catalogue(delta=False)["failed"]
+
+    assert db.get_expansion_tree() is not tree
+    after = client.get("/api/expansions/", headers={"If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["ETag"] != etag
+    body = after.json()
+    assert body["series"][0] == {"name": "Test Series", "latest_release": "2099/01/01", "expansion_count": 1,
+                                 "card_count": 3}
+    assert [expansion["id"] for expansion in body["expansions"]["Test Series"]] == ["promo1"]
+
+
+def test_a_rolled_back_write_keeps_the_tree(database):
+    tree = db.get_expansion_tree()
+    with pytest.raises(RuntimeError):
+        with db.write_connection() as conn:
+            conn.execute("UPDATE expansions SET name = 'Renamed' WHERE id = 'base1'")
+            db._catalogue_changed()
+            raise RuntimeError("abort")
+    assert db.get_expansion_tree() is tree
+    assert tree.grouped["Base"][-1]["name"] == "Base"
@@ -0,0 +1,82 @@
+import app.database as db
+
+SEARCH = "/api/search/cards/"
+
+
+def _reference(where="1", params=()):
+    """Facet counts worked out in SQL over the cards matching ``where``."""
+    source = "cards c LEFT JOIN expansions e ON e.id = c.expansion_id"
+    counts = {}
+    with db.read_connection() as conn:
+        for facet, column in (("rarity", "c.rarity"), ("supertype", "c.supertype"), ("series", "e.series")):
+            rows = conn.execute(f"""
+                SELECT {column}, COUNT(*) FROM {source} WHERE ({where}) AND {column} IS NOT NULL AND {column} != ''
+                GROUP BY {column}
+            """, params)
+            counts[facet] = dict(rows.fetchall())
+        rows = conn.execute(f"""
+            SELECT t.type, COUNT(*) FROM {source} JOIN card_types t ON t.card_id = c.id WHERE {where} GROUP BY t.type
+        """, params)
+        counts["type"] = dict(rows.fetchall())
+        owned, total = conn.execute(f"""
+            SELECT COUNT(col.card_id), COUNT(*) FROM {source}
+            LEFT JOIN collection col ON col.card_id = c.id AND col.owner_id = 1 AND col.quantity > 0
+            WHERE {where}
+        """, params).fetchone()
+    counts["owned"] = {"owned": owned, "missing": total - owned}
+    return counts
+
+
+def _facets(client, path, **params):
+    response = client.get(path, params={"facets": "true", **params})
+    assert response.status_code == 200
+    return response.json()["facets"]
+
+
+def test_search_facets_count_every_matching_card(client):
+    db.apply_collection_changes([{"card_id": "base1-4", "quantity": 1}, {"card_id": "base2-1", "quantity": 2}])
+    # A one-card page still counts all matches
+    facets = _facets(client, SEARCH, series="Base", limit=1)
+    expected = _reference("e.series = 'Base'")
+    # Disjunctive: the series facet counts without the series filter
+    expected["series"] = _reference()["series"]
+    assert facets == expected
+    counts = list(facets["rarity"].values())
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_a_facet_leaves_out_its_own_selection(client):
+    facets = _facets(client, SEARCH, series="Base", rarity="rare holo", limit=1)
+    series = "e.series = 'Base'"
+    rare_holo = "e.series = 'Base' AND c.rarity = 'Rare Holo'"
+    assert facets["rarity"] == _reference(series)["rarity"]
+    assert facets["type"] == _reference(rare_holo)["type"]
+    assert facets["series"] == _reference("c.rarity = 'Rare Holo'")["series"]
+
+    # Non-facet filters narrow every facet
+    facets = _facets(client, SEARCH, series="Base", hp_min=100, limit=1)
+    assert facets["rarity"] == _reference(f"{series} AND c.hp >= 100")["rarity"]
+
+
+def test_collection_facets_follow_collection_writes(client):
+    path = "/api/collection/base1/"
+    assert _facets(client, path)["owned"] == {"owned": 0, "missing": 102}
+    db.apply_collection_changes([{"card_id": "base1-4", "quantity": 1}, {"card_id": "base1-5", "quantity": 3}])
+    facets = _facets(client, path)
+    assert facets == _reference("c.expansion_id = 'base1'")
+    assert facets["owned"] == {"owned": 2, "missing": 100}
+
+    owned = _facets(client, SEARCH, series="Base", owned="true", limit=1)
+    assert sum(owned["rarity"].values()) == 2
+    assert owned["owned"] == _reference("e.series = 'Base'")["owned"]
+
+
+def test_a_catalogue_sync_rebuilds_the_index(client, catalogue, stub):
+    before = _facets(client, SEARCH, series="Base", limit=1)
+    for card in catalogue.set_cards["base1"]:
+        if card["id"] in ("base1-1", "base1-2"):
+            card["rarity"] = "Promo"
+    assert not db.sync_cards(["base1"])["failed"]
+    after = _facets(client, SEARCH, series="Base", limit=1)
+    assert after["rarity"]["Promo"] == before["rarity"].get("Promo", 0) + 2
+    assert after["rarity"] == _reference("e.series = 'Base'")["rarity"]
@@ -0,0 +1,102 @@
+import io
+import os
+import random
+
+import pytest
+from PIL import Image
+
+import app.database as db
+from app import images
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {"content-type": "image/png"}
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeCdn:
+    """Answers every image URL with a distinct noisy PNG of about 12 KB."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, timeout=None):
+        self.requests += 1
+        rng = random.Random(url)
+        img = Image.frombytes("RGB", (64, 64), bytes(rng.getrandbits(8) for _ in range(64 * 64 * 3)))
+        out = io.BytesIO()
+        img.save(out, "PNG")
+        return FakeResponse(out.getvalue())
+
+
+@pytest.fixture
+def cdn(client, tmp_path, monkeypatch):
+    cdn = FakeCdn()
+    monkeypatch.setattr(images, "IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(images, "_get_session", lambda: cdn)
+    monkeypatch.setattr(images, "_cache_bytes", None)
+    return cdn
+
+
+def _card_ids(count):
+    with db.read_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id LIMIT ?", (count,))]
+
+
+def _bytes_on_disk(root):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+
+def test_on_demand_fetches_stay_under_the_quota(client, cdn, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_CACHE_MB", 0.25)
+    quota = 0.25 * 1024 * 1024
+    for card_id in _card_ids(60):
+        response = client.get(f"/api/images/{card_id}")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert images.stats()["bytes"] <= quota
+    assert cdn.requests == 60
+    assert _bytes_on_disk(images.IMAGE_CACHE_DIR) <= quota
+    assert 0 < images.stats()["images"] < 60
+
+
+def test_eviction_leaves_images_being_served(client, cdn):
+    served, idle = _card_ids(2)
+    for card_id in (served, idle):
+        assert client.get(f"/api/images/{card_id}").status_code == 200
+
+    image = images.checkout(served)
+    try:
+        assert images.enforce_quota(max_bytes=0) == 1
+        assert os.path.exists(images.original_path(image))
+        assert images.lookup(idle) is None
+    finally:
+        images.release(image)
+    assert images.enforce_quota(max_bytes=0) == 1
+    assert not os.path.exists(images.original_path(image))
+    assert images.checkout(served) is None
+
+    # An evicted image is simply downloaded again
+    assert client.get(f"/api/images/{served}", params={"size": "original"}).status_code == 200
+    assert cdn.requests == 3
+
+
+def test_a_replaced_image_is_revalidated(client, cdn):
+    card_id = _card_ids(1)[0]
+    first = client.get(f"/api/images/{card_id}")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert client.get(f"/api/images/{card_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    # Upstream moves the card to a new picture, which a later download stores under the same key
+    with db.write_connection() as conn:
+        conn.execute("UPDATE cards SET image_url = image_url || '?v=2' WHERE id = ?", (card_id,))
+    images.release(images.fetch(card_id))
+
+    second = client.get(f"/api/images/{card_id}", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != etag
+    assert second.content != first.content
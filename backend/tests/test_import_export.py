@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+
+import app.database as db
+from app import collection_io
+
+
+def _collection():
+    """Each collected card's quantity and the collection number it is listed under."""
+    with db.read_connection() as conn:
+        return {
+            card_id: (quantity, number)
+            for card_id, quantity, number in conn.execute("""
+                SELECT col.card_id, col.quantity, COALESCE(col.collection_number, c.number_int)
+                FROM collection col JOIN cards c ON c.id = col.card_id
+                WHERE col.owner_id = ?
+            """, (db.DEFAULT_OWNER_ID,))
+        }
+
+
+def _export(fmt):
+    return b"".join(db.export_collection(fmt, batch_size=7))
+
+
+@pytest.fixture
+def collected(database):
+    with db.read_connection() as conn:
+        card_ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id LIMIT 40")]
+    db.apply_collection_changes(
+        [{"card_id": card_id, "quantity": i % 5 + 1} for i, card_id in enumerate(card_ids)]
+        + [{"card_id": card_ids[0], "change": 0, "collection_number": 901}]
+    )
+    return _collection()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json"])
+def test_export_imports_back_unchanged(collected, fmt):
+    exported = _export(fmt)
+    db.apply_collection_changes([{"card_id": card_id, "quantity": 0} for card_id in collected])
+    assert _collection() == {}
+
+    report = db.import_collection(io.BytesIO(exported), fmt, "set")
+    assert report["rows"] == report["imported"] == len(collected)
+    assert report["unmatched_count"] == 0
+    assert _collection() == collected
+    assert _export(fmt) == exported
+
+
+def test_export_formats_agree(collected):
+    rows = json.loads(_export("json"))
+    lines = _export("csv").decode().splitlines()
+    assert len(rows) == len(lines) - 1 == len(collected)
+    assert {row["card_id"]: row["quantity"] for row in rows} == {
+        card_id: quantity for card_id, (quantity, _) in collected.items()
+    }
+
+
+def test_add_mode_adds_to_the_collection(collected):
+    db.import_collection(io.BytesIO(_export("csv")), "csv", "add")
+    assert _collection() == {card_id: (quantity * 2, number) for card_id, (quantity, number) in collected.items()}
+
+
+def test_rows_by_set_and_number_and_unmatched_rows(database):
+    data = (
+        "set,number,qty\n"
+        "base1,4,2\n"
+        "base1,9999,1\n"
+        "nope,1,1\n"
+        ",,3\n"
+        "base1,58,-1\n"
+    ).encode()
+    report = db.import_collection(io.BytesIO(data), "csv", "set")
+    assert report["rows"] == 5
+    assert report["imported"] == 1
+    assert report["unmatched_count"] == 4
+    assert [entry["line"] for entry in report["unmatched"]] == [3, 4, 5, 6]
+    assert _collection() == {"base1-4": (2, 4)}
+
+
+def test_json_lines_import(database):
+    data = b'{"card_id": "base1-4", "quantity": 2}\n{"id": "base1-58"}\n'
+    report = db.import_collection(io.BytesIO(data), "json", "set")
+    assert report["imported"] == 2
+    assert _collection() == {"base1-4": (2, 4), "base1-58": (1, 58)}
+
+
+class _CountingStream(io.BytesIO):
+    """An upload that records how many bytes were read from it."""
+
+    consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = super().read1(size)
+        self.consumed += len(data)
+        return data
+
+
+def test_an_oversized_record_fails_without_reading_the_rest(database, monkeypatch):
+    monkeypatch.setattr(collection_io, "MAX_JSON_RECORD_KB", 64)
+    # An unterminated string never decodes, however much more is read
+    stream = _CountingStream(b'[{"card_id": "base1-4"}, {"card_id": "' + b"x" * (8 * 1024 * 1024))
+    with pytest.raises(ValueError, match="record 2: record is over 64 KB"):
+        db.import_collection(stream, "json", "set")
+    assert 0 < stream.consumed < 1024 * 1024
+    assert _collection() == {}
+
+    # Records under the limit still decode across reads
+    monkeypatch.setattr(collection_io, "_READ_SIZE", 16)
+    records = [{"card_id": f"base1-{n}", "quantity": n, "variant": "x" * 1000} for n in range(1, 4)]
+    assert list(collection_io.iter_json(io.BytesIO(json.dumps(records).encode()))) == list(enumerate(records, 1))
+
+
+def test_import_and_export_endpoints(client):
+    response = client.post("/api/collection/import?format=csv", content=b"card_id,quantity\nbase1-4,3\n")
+    assert response.status_code == 200
+    assert response.json()["imported"] == 1
+
+    exported = client.get("/api/collection/export", params={"format": "csv"})
+    assert exported.status_code == 200
+    assert exported.text.splitlines()[1].startswith("base1-4,base1,4,Charizard,")
+
+    response = client.post("/api/collection/import?format=json", content=b'[{"card_id": "base1-4",')
+    assert response.status_code == 400
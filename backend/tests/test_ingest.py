@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import app.database as db
+
+
+def _write_dump(root, catalogue, broken=None):
+    """Lay ``catalogue`` out as a pokemon-tcg-data dump; ``broken`` names a set whose cards file is cut short."""
+    os.makedirs(root / "sets")
+    os.makedirs(root / "cards" / "en")
+    (root / "sets" / "en.json").write_text(json.dumps(catalogue.sets()))
+    for set_id, cards in catalogue.set_cards.items():
+        text = json.dumps(cards)
+        (root / "cards" / "en" / f"{set_id}.json").write_text(text[:len(text) // 2] if set_id == broken else text)
+    return str(root)
+
+
+def _rename_all(catalogue):
+    for cards in catalogue.set_cards.values():
+        for card in cards:
+            card["name"] = f"{card['name']} (dump)"
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _state(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return (
+            conn.execute("SELECT COUNT(*) FROM cards WHERE name LIKE '%(dump)'").fetchone()[0],
+            conn.execute("SELECT name FROM cards WHERE id = 'base1-4'").fetchone()[0],
+            conn.execute("SELECT SUM(quantity) FROM collection").fetchone()[0],
+        )
+
+
+def test_a_bulk_load_replaces_the_database(database, catalogue, tmp_path):
+    db.update_card_quantity("base1-4", 2)
+    db.close_pool()
+    _rename_all(catalogue)
+
+    counts = db.load_dump(_write_dump(tmp_path / "dump", catalogue), bulk=True)
+    assert (counts["sets"], counts["cards"]) == (5, catalogue.card_count())
+    assert not os.path.exists(database + ".loading")
+    assert _state(database) == (catalogue.card_count(), "Charizard (dump)", 2)
+    with closing(sqlite3.connect(database)) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.get_cards_by_name("charizard dump")["cards"][0]["id"] == "base1-4"
+
+
+def test_a_failed_bulk_load_leaves_the_database_untouched(database, catalogue, tmp_path):
+    db.update_card_quantity("base1-4", 2)
+    db.close_pool()
+    _rename_all(catalogue)
+    # Sets load in release order, so base1-4 are written before base5's file fails to parse
+    dump = _write_dump(tmp_path / "dump", catalogue, broken="base5")
+    digest, state = _digest(database), _state(database)
+
+    with pytest.raises(ValueError, match="base5.json"):
+        db.load_dump(dump, bulk=True)
+
+    assert _digest(database) == digest
+    assert _state(database) == state == (0, "Charizard", 2)
+    assert not [name for name in os.listdir(tmp_path) if ".loading" in name]
+
+
+def test_a_copy_left_by_a_crashed_load_is_discarded(database, catalogue, tmp_path):
+    db.close_pool()
+    with open(database + ".loading", "wb") as f:
+        f.write(b"not a database")
+    db.load_dump(_write_dump(tmp_path / "dump", catalogue), bulk=True)
+    assert not os.path.exists(database + ".loading")
+    assert _state(database)[1] == "Charizard"
+
+
+def test_a_bulk_load_needs_the_pool_closed(database, catalogue, tmp_path):
+    db.open_pool()
+    with pytest.raises(RuntimeError, match="Close the connection pool"):
+        db.load_dump(_write_dump(tmp_path / "dump", catalogue), bulk=True)
+    assert not os.path.exists(database + ".loading")
+
+
+def test_a_failed_load_through_the_pool_rolls_back(database, catalogue, tmp_path):
+    _rename_all(catalogue)
+    dump = _write_dump(tmp_path / "dump", catalogue, broken="base5")
+    with db.read_connection() as conn:
+        schema = conn.execute("SELECT type, name FROM sqlite_master ORDER BY name").fetchall()
+
+    with pytest.raises(ValueError, match="base5.json"):
+        db.load_dump(dump)
+
+    with db.read_connection() as conn:
+        # The dropped indexes and full-text triggers come back with the rollback
+        assert conn.execute("SELECT type, name FROM sqlite_master ORDER BY name").fetchall() == schema
+    assert _state(database)[:2] == (0, "Charizard")
+    assert db.get_cards_by_name("dump")["cards"] == []
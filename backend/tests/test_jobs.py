@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+import app.jobs as jobs
+
+release = threading.Event()
+
+
+@jobs.handler("test_wait")
+def _wait(job, n):
+    release.wait(5)
+    return {"n": n}
+
+
+@pytest.fixture
+def runner(database):
+    release.clear()
+    runner = jobs.JobRunner(workers=1, queue_size=2)
+    runner.start()
+    yield runner
+    release.set()
+    runner.stop(timeout=5)
+
+
+def _wait_for(runner, job_id, status):
+    for _ in range(200):
+        if runner.get(job_id)["status"] == status:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+
+def test_stop_does_not_hang_on_a_full_queue(runner):
+    running, _ = runner.submit("test_wait", {"n": 0})
+    _wait_for(runner, running["id"], "running")
+    queued = [runner.submit("test_wait", {"n": n})[0] for n in (1, 2)]
+    with pytest.raises(jobs.JobQueueFull):
+        runner.submit("test_wait", {"n": 3})
+
+    stopper = threading.Thread(target=runner.stop, kwargs={"timeout": 5})
+    stopper.start()
+    for _ in range(200):
+        if runner.get(running["id"])["cancel_requested"]:
+            break
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    stopper.join(2)
+    assert not stopper.is_alive()
+    assert runner.get(running["id"])["status"] == "succeeded"
+    # Left for the next start to mark as interrupted, not run during shutdown
+    assert [runner.get(job["id"])["status"] for job in queued] == ["queued", "queued"]
+
+    runner.start()
+    assert [runner.get(job["id"])["status"] for job in queued] == ["failed", "failed"]
+    job, created = runner.submit("test_wait", {"n": 4})
+    assert created
+    _wait_for(runner, job["id"], "succeeded")
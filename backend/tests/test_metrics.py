@@ -0,0 +1,91 @@
+import logging
+import re
+
+import pytest
+
+import app.database as db
+from app import metrics
+
+
+def _sample(body, name, **labels):
+    """Value of one sample line of a /metrics body (0 when absent)."""
+    for line in body.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if match and match.group(1) == name:
+            found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+            if found == {key: str(value) for key, value in labels.items()}:
+                return float(match.group(3))
+    return 0
+
+
+@pytest.mark.parametrize("sql, labels", [
+    ("SELECT id FROM cards WHERE id = ?", ("SELECT", "cards")),
+    ("  insert or replace into collection_stats (owner_id) VALUES (?)", ("INSERT", "collection_stats")),
+    ("WITH owned AS (SELECT card_id FROM collection) SELECT * FROM owned", ("SELECT", "collection")),
+    ("UPDATE jobs SET status = ?", ("UPDATE", "jobs")),
+    ("BEGIN IMMEDIATE", ("BEGIN", "")),
+    ("frobnicate", ("OTHER", "")),
+])
+def test_statement_labels(sql, labels):
+    assert metrics.statement_labels(sql) == labels
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("test_seconds", "A test histogram", ("route",), buckets=(0.1, 1))
+    metrics._registry.remove(histogram)
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, '/say "hi"')
+    assert list(histogram.render()) == [
+        "# HELP test_seconds A test histogram",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/say \\"hi\\"",le="0.1"} 1',
+        'test_seconds_bucket{route="/say \\"hi\\"",le="1.0"} 3',
+        'test_seconds_bucket{route="/say \\"hi\\"",le="+Inf"} 4',
+        'test_seconds_sum{route="/say \\"hi\\""} 4.05',
+        'test_seconds_count{route="/say \\"hi\\""} 4',
+    ]
+
+
+def test_requests_and_queries_are_recorded(client):
+    before = client.get("/metrics").text
+    route = {"method": "GET", "route": "/api/expansion/{set_id}/cards"}
+    for set_id in ("base1", "base2"):
+        assert client.get(f"/api/expansion/{set_id}/cards", params={"fields": "id"}).status_code == 200
+    assert client.get("/api/expansion/nope/cards").status_code == 404
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = response.text
+
+    def delta(name, **labels):
+        return _sample(after, name, **labels) - _sample(before, name, **labels)
+
+    assert delta("http_request_duration_seconds_count", **route, status=200) == 2
+    assert delta("http_request_duration_seconds_count", **route, status=404) == 1
+    assert delta("http_request_db_seconds_count", **route) == 3
+    assert delta("http_request_db_seconds_sum", **route) > 0
+    assert delta("db_query_duration_seconds_count", operation="SELECT", table="cards") >= 2
+    assert delta("db_rows_total", operation="SELECT", table="cards") >= 102
+    assert "# TYPE response_cache_entries gauge" in after
+
+
+def test_slow_queries_are_logged_with_their_plan(database, monkeypatch, caplog):
+    db.open_pool()  # its startup queries are not what this test counts
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 1e-6)
+    labels = ("SELECT", "cards")
+    slow = metrics.db_slow_queries.value(*labels)
+    with caplog.at_level(logging.WARNING, logger="app.pool"):
+        with db.read_connection() as conn:
+            conn.execute("SELECT id FROM cards WHERE expansion_id = ?", ("base1",)).fetchall()
+    assert metrics.db_slow_queries.value(*labels) == slow + 1
+    message = next(record.getMessage() for record in caplog.records
+                   if "SELECT id FROM cards WHERE expansion_id = ?" in record.getMessage())
+    assert re.search(r"Slow query \(\d+\.\d ms, 102 rows\)", message)
+    assert "idx" in message or "SEARCH" in message
+
+
+def test_a_zero_threshold_turns_the_slow_query_log_off(database, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="app.pool"):
+        with db.read_connection() as conn:
+            conn.execute("SELECT COUNT(*) FROM cards").fetchone()
+    assert not [record for record in caplog.records if "Slow query" in record.getMessage()]
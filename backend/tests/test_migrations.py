@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from app.migrations import MIGRATIONS, _m001_base_tables, current_version, run_migrations
+
+LATEST = MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database as the app created it before migrations existed, with a small collection."""
+    conn = sqlite3.connect(tmp_path / "legacy.db", isolation_level=None)
+    _m001_base_tables(conn)
+    conn.executemany("INSERT INTO expansions (id, name, series, release_date) VALUES (?, ?, ?, ?)", [
+        ("base1", "Base", "Base", "1999/01/09"),
+        ("jungle", "Jungle", "Base", "1999/06/16"),
+    ])
+    conn.executemany("""
+        INSERT INTO cards (id, name, expansion_id, number, rarity, supertype, subtype, hp, types)
+        VALUES (?, ?, ?, ?, ?, 'Pokémon', ?, ?, ?)
+    """, [
+        ("base1-4", "Charizard", "base1", "4", "Rare Holo", "Stage 2", "120", "Fire"),
+        ("base1-58", "Pikachu", "base1", "58", "Common", "Basic", "40", "Lightning"),
+        ("jungle-60", "Pikachu", "jungle", "60", "Common", "Basic", "50", "Lightning,Colorless"),
+    ])
+    conn.executemany("""
+        INSERT INTO collection (card_id, name, expansion_id, number, rarity, quantity, collection_number)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [
+        ("base1-4", "Charizard", "base1", "4", "Rare Holo", 2, 4),
+        ("jungle-60", "Pikachu", "jungle", "60", "Common", 3, 160),
+    ])
+    yield conn
+    conn.close()
+
+
+def test_legacy_database_is_brought_to_the_latest_version(legacy_db):
+    assert run_migrations(legacy_db) == [number for number, _, _ in MIGRATIONS]
+    assert current_version(legacy_db) == LATEST
+    assert legacy_db.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+    # The collection keeps its quantities and numbers, now owned by the default owner; a
+    # collection number equal to the card's own number is stored as NULL
+    rows = legacy_db.execute("""
+        SELECT o.name, col.card_id, col.quantity, col.collection_number
+        FROM collection col JOIN owners o ON o.id = col.owner_id ORDER BY col.card_id
+    """).fetchall()
+    assert rows == [("default", "base1-4", 2, None), ("default", "jungle-60", 3, 160)]
+    stats = legacy_db.execute(
+        "SELECT expansion_id, rarity, collected_cards, quantity FROM collection_stats ORDER BY expansion_id"
+    ).fetchall()
+    assert stats == [("base1", "Rare Holo", 1, 2), ("jungle", "Common", 1, 3)]
+
+    # Card attributes are normalized and searchable
+    assert legacy_db.execute("SELECT hp, number_int FROM cards WHERE id = 'base1-4'").fetchone() == (120, 4)
+    types = legacy_db.execute("SELECT type FROM card_types WHERE card_id = 'jungle-60' ORDER BY type").fetchall()
+    assert types == [("Colorless",), ("Lightning",)]
+    matches = legacy_db.execute("""
+        SELECT c.id FROM cards_fts JOIN cards c ON c.rowid = cards_fts.rowid
+        WHERE cards_fts MATCH 'pika*' ORDER BY c.id
+    """).fetchall()
+    assert matches == [("base1-58",), ("jungle-60",)]
+
+
+def test_migrations_run_once(legacy_db):
+    run_migrations(legacy_db)
+    assert run_migrations(legacy_db) == []
+    versions = [row[0] for row in legacy_db.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == list(range(1, LATEST + 1))
+
+
+def test_seed_is_at_the_latest_version(database):
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        assert current_version(conn) == LATEST
+        assert run_migrations(conn) == []
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0] > 0
+        # The seed ships without a collection
+        assert conn.execute("SELECT COUNT(*) FROM collection").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_empty_database_gets_the_full_schema(empty_database):
+    import app.database as db
+
+    with db.read_connection() as conn:
+        assert current_version(conn) == LATEST
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_cards_expansion_number", "idx_cards_name"} <= indexes
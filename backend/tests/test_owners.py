@@ -0,0 +1,84 @@
+import app.database as db
+
+
+def _add(client, card_id, change, owner=None, variant=None):
+    params = {"card_id": card_id, "change": change}
+    if owner:
+        params["owner"] = owner
+    if variant:
+        params["variant"] = variant
+    response = client.post("/api/collection/update/", params=params)
+    assert response.status_code == 200
+
+
+def _cards(client, owner=None):
+    params = {"fields": "card_id,quantity", "sort": "card_id"}
+    if owner:
+        params["owner"] = owner
+    cards = client.get("/api/collection/", params=params).json()["collection"]
+    return {card["card_id"]: card["quantity"] for card in cards}
+
+
+def _widgets(client, owner):
+    params = {"owner": owner}
+    return (
+        client.get("/api/widgets/totalCards", params=params).json()["totalCards"],
+        client.get("/api/widgets/totalExpansions", params=params).json()["totalExpansions"],
+    )
+
+
+def test_owners_have_separate_collections(client):
+    assert client.post("/api/owners/", params={"name": "ash"}).status_code == 201
+    _add(client, "base1-4", 2)
+    _add(client, "base1-4", 1, owner="ash")
+    _add(client, "base1-58", 3, owner="ash", variant="holofoil")
+
+    assert _cards(client) == {"base1-4": 2}
+    assert _cards(client, "ash") == {"base1-4": 1, "base1-58": 3}
+    assert _widgets(client, "default") == (2, 1)
+    assert _widgets(client, "ash") == (4, 1)
+    owners = {owner["name"]: owner["total_cards"] for owner in client.get("/api/owners/").json()}
+    assert owners == {"default": 2, "ash": 4}
+
+    owned = client.get("/api/search/cards/", params={"rarity": "Common", "owned": True, "owner": "ash"}).json()
+    assert [card["id"] for card in owned["cards"]] == ["base1-58"]
+    owned = client.get("/api/search/cards/", params={"rarity": "Common", "owned": True}).json()
+    assert owned["cards"] == []
+
+
+def test_batch_and_export_are_per_owner(client):
+    client.post("/api/owners/", params={"name": "misty"})
+    response = client.post("/api/collection/batch", params={"owner": "misty"},
+                           json={"items": [{"card_id": "base1-4", "quantity": 5}]})
+    assert response.status_code == 200
+    assert _cards(client) == {}
+    export = client.get("/api/collection/export", params={"format": "json", "owner": "misty"}).json()
+    assert [(row["card_id"], row["quantity"]) for row in export] == [("base1-4", 5)]
+    assert client.get("/api/collection/export", params={"format": "json"}).json() == []
+
+
+def test_deleting_an_owner_removes_their_collection(client):
+    client.post("/api/owners/", params={"name": "brock"})
+    _add(client, "base1-4", 2, owner="brock", variant="holofoil")
+    _add(client, "base1-4", 1)
+
+    assert client.delete("/api/owners/brock").status_code == 200
+    assert client.get("/api/collection/", params={"owner": "brock"}).status_code == 404
+    with db.read_connection() as conn:
+        for table in ("collection", "collection_variants", "collection_stats"):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table} WHERE owner_id != ?",
+                                (db.DEFAULT_OWNER_ID,)).fetchone()[0] == 0
+
+    # A new owner under the same name starts empty
+    client.post("/api/owners/", params={"name": "brock"})
+    assert _cards(client, "brock") == {}
+    assert _cards(client) == {"base1-4": 1}
+
+
+def test_owner_validation(client):
+    assert client.get("/api/collection/", params={"owner": "nobody"}).status_code == 404
+    assert client.post("/api/owners/", params={"name": "bad name"}).status_code == 400
+    client.post("/api/owners/", params={"name": "gary"})
+    assert client.post("/api/owners/", params={"name": "gary"}).status_code == 400
+    assert client.delete("/api/owners/default").status_code == 400
+    assert client.delete("/api/owners/nobody").status_code == 404
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from app.pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"))
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+        conn.execute("""
+            CREATE TABLE children (
+                id INTEGER PRIMARY KEY,
+                parent_id INTEGER REFERENCES parents (id) DEFERRABLE INITIALLY DEFERRED
+            )
+        """)
+    # A no-op inside a transaction, so switched on for the writer connection afterwards
+    conn.execute("PRAGMA foreign_keys = ON")
+    yield pool
+    pool.close()
+
+
+def test_a_failed_commit_leaves_the_writer_usable(pool):
+    ran = []
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.writer() as conn:
+            # The deferred foreign key is only checked, and fails, at COMMIT
+            conn.execute("INSERT INTO children (id, parent_id) VALUES (1, 99)")
+            pool.after_commit(lambda: ran.append("stale"))
+
+    with pool.writer() as conn:
+        assert not conn.execute("SELECT COUNT(*) FROM children").fetchone()[0]
+        conn.execute("INSERT INTO parents (id) VALUES (1)")
+        pool.after_commit(lambda: ran.append("fresh"))
+    assert ran == ["fresh"]
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0] == 1
@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import zlib
+
+import brotli
+import pytest
+
+import app.database as db
+from app.api import compression
+
+CARDS = "/api/expansion/base1/cards"
+
+
+@pytest.mark.parametrize("header, brotli_installed, expected", [
+    ("gzip, deflate, br", True, "br"),
+    ("gzip, deflate, br", False, "gzip"),
+    ("br;q=0, gzip", True, "gzip"),
+    ("gzip;q=0", False, None),
+    ("*", False, "gzip"),
+    ("identity", True, None),
+    ("", True, None),
+])
+def test_negotiate(monkeypatch, header, brotli_installed, expected):
+    monkeypatch.setattr(compression, "brotli", object() if brotli_installed else None)
+    assert compression.negotiate(header) == expected
+
+
+def test_large_bodies_are_gzipped_and_small_ones_left_alone(client):
+    plain = client.get(CARDS, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    # Read the raw bytes, so the gzip stream itself is checked
+    with client.stream("GET", CARDS, headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    assert int(response.headers["content-length"]) == len(raw) < len(plain.content)
+    assert gzip.decompress(raw) == plain.content
+
+    small = client.get("/api/widgets/totalCards", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk(client):
+    db.apply_collection_changes([{"card_id": card["id"], "quantity": 1}
+                                 for card in client.get(CARDS, params={"fields": "id"}).json()["cards"]])
+    plain = client.get("/api/collection/", headers={"Accept-Encoding": "identity"})
+    with client.stream("GET", "/api/collection/", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw) == plain.content
+    assert len(plain.json()["collection"]) == 102
+
+
+@pytest.mark.parametrize("encoding, decompressor", [
+    ("gzip", lambda: zlib.decompressobj(31)),
+    ("br", lambda: brotli.Decompressor()),
+])
+def test_each_streamed_chunk_can_be_decoded_on_arrival(encoding, decompressor):
+    rows = [b'{"id": "base1-%d", "name": "Card"}\n' % number for number in range(3)]
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        for row in rows:
+            await send({"type": "http.response.body", "body": row, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", encoding.encode())]}
+    asyncio.run(compression.CompressionMiddleware(app)(scope, None, send))
+
+    assert dict(sent[0]["headers"])[b"content-encoding"] == encoding.encode()
+    decoder = decompressor()
+    decode = decoder.decompress if encoding == "gzip" else decoder.process
+    # Rows far smaller than a compression block still come out whole, one per chunk
+    assert [decode(message["body"]) for message in sent[1:-1]] == rows
+    assert decode(sent[-1]["body"]) == b""
+
+
+@pytest.mark.parametrize("path, key", [(CARDS, "cards"), ("/api/collection/", "collection")])
+def test_columnar_pages_hold_the_same_rows(client, path, key):
+    db.apply_collection_changes([{"card_id": "base1-4", "quantity": 2}, {"card_id": "base1-1", "quantity": 1}])
+    params = {"fields": "card_id,name,quantity" if key == "collection" else "id,name,hp", "limit": 50}
+    objects = client.get(path, params=params).json()
+    columnar = client.get(path, params={**params, "layout": "columnar"}).json()
+
+    assert set(columnar) == {"columns", "rows", "next_cursor"}
+    assert columnar["columns"] == params["fields"].split(",")
+    assert [dict(zip(columnar["columns"], row)) for row in columnar["rows"]] == objects[key]
+    assert columnar["next_cursor"] == objects["next_cursor"]
+
+
+def test_columnar_collection_by_expansion(client):
+    db.update_card_quantity("base1-4", 2, variant="holofoil")
+    objects = client.get("/api/collection/base1/").json()
+    columnar = client.get("/api/collection/base1/", params={"layout": "columnar"}).json()
+    assert columnar["stats"] == objects["stats"]
+    assert [dict(zip(columnar["columns"], row)) for row in columnar["rows"]] == objects["collection"]
+    charizard = next(card for card in objects["collection"] if card["card_id"] == "base1-4")
+    assert (charizard["quantity"], charizard["variants"]) == (2, {"holofoil": 2})
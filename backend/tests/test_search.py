@@ -0,0 +1,73 @@
+import pytest
+
+import app.database as db
+from app.search import encode_cursor
+
+
+def _all_pages(query, limit, **filters):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = db.get_cards_by_name(query, limit=limit, cursor=cursor, **filters)
+        ids += [card["id"] for card in page["cards"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def _reference(sql, *params):
+    with db.read_connection() as conn:
+        return [row[0] for row in conn.execute(sql, params)]
+
+
+def test_text_search_pages_follow_the_ranked_order(database):
+    expected = _reference("""
+        SELECT c.id FROM cards_fts JOIN cards c ON c.rowid = cards_fts.rowid
+        WHERE cards_fts MATCH '"char"*' ORDER BY cards_fts.rank, c.name, c.id
+    """)
+    ids, pages = _all_pages("char", 17)
+    assert len(expected) > 17
+    assert ids == expected
+    assert pages == len(expected) // 17 + 1
+
+
+def test_filter_only_search_pages_follow_name_order(database):
+    expected = _reference("SELECT id FROM cards WHERE rarity = 'Rare Holo' ORDER BY name, id")
+    ids, _ = _all_pages("", 100, rarity="Rare Holo")
+    assert ids == expected
+
+
+def test_filtered_text_search(database):
+    ids, _ = _all_pages("pikachu", 5, type_="Lightning")
+    assert ids
+    with db.read_connection() as conn:
+        for card_id in ids:
+            types = {row[0] for row in conn.execute("SELECT type FROM card_types WHERE card_id = ?", (card_id,))}
+            assert "Lightning" in types
+
+
+def test_cards_are_returned_without_sort_keys(database):
+    card = db.get_cards_by_name("pikachu", limit=1)["cards"][0]
+    assert card["name"] == "Pikachu"
+    assert not any(key.startswith("_k") for key in card)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor", encode_cursor({"offset": 60}), encode_cursor({"after": [1]}),
+    encode_cursor({"after": [{}, {}, {}]}), encode_cursor({"after": [1.5, ["Charizard"], "base1-4"]}),
+])
+def test_invalid_search_cursor(database, cursor):
+    with pytest.raises(ValueError):
+        db.get_cards_by_name("char", cursor=cursor)
+
+
+def test_search_endpoint(client):
+    first = client.get("/api/search/cards/", params={"q": "char", "limit": 5}).json()
+    second = client.get("/api/search/cards/", params={"q": "char", "limit": 5, "cursor": first["next_cursor"]}).json()
+    assert len(first["cards"]) == len(second["cards"]) == 5
+    assert not {card["id"] for card in first["cards"]} & {card["id"] for card in second["cards"]}
+
+    assert client.get("/api/search/cards/", params={"q": "char", "cursor": "bogus"}).status_code == 400
+    tampered = encode_cursor({"after": [{}, {}, {}]})
+    assert client.get("/api/search/cards/", params={"q": "char", "cursor": tampered}).status_code == 400
+    assert client.get("/api/search/cards/").status_code == 400
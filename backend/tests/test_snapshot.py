@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+
+import pytest
+
+import app.database as db
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def snapshot(database, tmp_path):
+    """A snapshot built from the seed catalogue, then edited to look like a newer one."""
+    path = str(tmp_path / "snapshot.db")
+    db.build_snapshot(path, source_db=database)
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("UPDATE cards SET name = 'Alakazam Prime' WHERE id = 'base1-1'")
+        conn.execute("DELETE FROM cards WHERE id IN ('base1-2', 'base1-3')")
+        conn.execute("UPDATE catalogue_info SET value = '2099-01-01T00:00:00+00:00' WHERE key = 'version'")
+        conn.commit()
+    return path
+
+
+def _set_version(path, version):
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("UPDATE catalogue_info SET value = ? WHERE key = 'version'", (version,))
+        conn.commit()
+
+
+def _card_names(*card_ids):
+    with db.read_connection() as conn:
+        return dict(conn.execute(f"SELECT id, name FROM cards WHERE id IN ({', '.join('?' for _ in card_ids)})",
+                                 card_ids).fetchall())
+
+
+def test_build_carries_the_catalogue_only(database, tmp_path):
+    db.update_card_quantity("base1-4", 2)
+    db.create_owner("ash")
+    db.close_pool()
+
+    path = str(tmp_path / "snapshot.db")
+    version = db.build_snapshot(path, source_db=database)
+    assert db.snapshot_version(path) == version
+    assert not os.path.exists(path + ".building")
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("ATTACH DATABASE ? AS source", (database,))
+        count = "SELECT (SELECT COUNT(*) FROM {0}.cards), (SELECT COUNT(*) FROM {0}.expansions)"
+        assert conn.execute(count.format("main")).fetchone() == conn.execute(count.format("source")).fetchone()
+        assert conn.execute("SELECT COUNT(*) FROM main.collection").fetchone()[0] == 0
+        assert [row[0] for row in conn.execute("SELECT name FROM main.owners")] == [db.DEFAULT_OWNER]
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def test_apply_merges_the_catalogue_and_keeps_the_collection(database, snapshot):
+    db.create_owner("ash")
+    db.update_card_quantity("base1-2", 3)
+    db.update_card_quantity("base1-4", 1, owner_id=db.get_owner_id("ash"), variant="holofoil")
+    totals = db.get_total_cards_collection(), db.get_total_cards_collection(db.get_owner_id("ash"))
+
+    report = db.apply_snapshot(snapshot)
+    assert report["applied"] and report["version"] == "2099-01-01T00:00:00+00:00"
+    assert (report["updated"], report["removed"]) == (1, 1)
+    # Renamed, kept because it is collected, and removed
+    assert _card_names("base1-1", "base1-2", "base1-3") == {"base1-1": "Alakazam Prime", "base1-2": "Blastoise"}
+    assert [owner["name"] for owner in db.list_owners()] == [db.DEFAULT_OWNER, "ash"]
+    assert (db.get_total_cards_collection(), db.get_total_cards_collection(db.get_owner_id("ash"))) == totals
+    assert db.get_cards_by_name("alakazam prime")["cards"][0]["id"] == "base1-1"
+    assert db.snapshot_version(database) == report["version"]
+
+
+def test_if_newer_skips_an_older_or_equal_catalogue(database, snapshot):
+    assert db.apply_snapshot(snapshot, if_newer=True)["applied"]
+    db.update_card_quantity("base1-4", 1)
+
+    for version in ("2099-01-01T00:00:00+00:00", "2000-01-01T00:00:00+00:00"):
+        _set_version(snapshot, version)
+        with closing(sqlite3.connect(snapshot)) as conn:
+            conn.execute("UPDATE cards SET name = 'Changed' WHERE id = 'base1-1'")
+            conn.commit()
+        report = db.apply_snapshot(snapshot, if_newer=True)
+        assert report == {"applied": False, "version": "2099-01-01T00:00:00+00:00"}
+        assert _card_names("base1-1") == {"base1-1": "Alakazam Prime"}
+    assert db.get_total_cards_collection() == 1
+
+
+def test_entrypoint_command_skips_an_up_to_date_database(database, snapshot):
+    db.close_pool()
+    command = [sys.executable, "-m", "app.database", "apply-snapshot", "--if-newer", snapshot]
+    env = {**os.environ, "DATABASE_PATH": database}
+    for expected in ("applied", "is up to date"):
+        run = subprocess.run(command, cwd=BACKEND, env=env, capture_output=True, text=True, timeout=120)
+        assert run.returncode == 0, run.stderr
+        assert expected in run.stdout
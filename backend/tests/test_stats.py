@@ -0,0 +1,69 @@
+import random
+
+import app.database as db
+
+
+def _stats():
+    """collection_stats as {(owner, expansion, rarity): (collected, quantity)}, without emptied rows."""
+    with db.read_connection() as conn:
+        return {
+            (owner_id, expansion_id, rarity): (collected, quantity)
+            for owner_id, expansion_id, rarity, collected, quantity in conn.execute("""
+                SELECT owner_id, expansion_id, rarity, collected_cards, quantity FROM collection_stats
+            """)
+            if collected or quantity
+        }
+
+
+def _card_ids(count, seed=7):
+    with db.read_connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id")]
+    return random.Random(seed).sample(ids, count)
+
+
+def test_incremental_stats_match_a_rebuild(database):
+    rng = random.Random(1)
+    card_ids = _card_ids(300)
+    for _ in range(600):
+        db.update_card_quantity(rng.choice(card_ids), rng.choice([1, 1, 2, -1, -3]))
+    db.apply_collection_changes([
+        {"card_id": rng.choice(card_ids), "quantity": rng.choice([0, 1, 5])} for _ in range(200)
+    ] + [{"card_id": card_id, "change": 1} for card_id in card_ids[:50]])
+
+    incremental = _stats()
+    assert incremental
+    db.rebuild_stats()
+    assert _stats() == incremental
+
+    with db.read_connection() as conn:
+        total, expansions = conn.execute("""
+            SELECT SUM(col.quantity), COUNT(DISTINCT c.expansion_id)
+            FROM collection col JOIN cards c ON c.id = col.card_id WHERE col.owner_id = ?
+        """, (db.DEFAULT_OWNER_ID,)).fetchone()
+    assert db.get_total_cards_collection() == total
+    assert db.get_total_expansions_collection() == expansions
+
+
+def test_expansion_stats_follow_updates(database):
+    with db.read_connection() as conn:
+        card_id, rarity = conn.execute(
+            "SELECT id, rarity FROM cards WHERE expansion_id = 'base1' ORDER BY number_int LIMIT 1"
+        ).fetchone()
+    before = db.get_collection_by_expansion("base1")["stats"]
+    collected, total = map(int, before["rarities"][rarity].split("/"))
+
+    db.update_card_quantity(card_id, 3)
+    after = db.get_collection_by_expansion("base1")["stats"]
+    assert after["rarities"][rarity] == f"{collected + 1}/{total}"
+
+    db.update_card_quantity(card_id, -3)
+    assert db.get_collection_by_expansion("base1")["stats"] == before
+    assert db.get_total_cards_collection() == 0
+
+
+def test_removed_cards_leave_no_stats(database):
+    card_id = _card_ids(1)[0]
+    db.apply_collection_changes([{"card_id": card_id, "quantity": 4}, {"card_id": card_id, "change": -10}])
+    assert _stats() == {}
+    with db.read_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM collection").fetchone()[0] == 0
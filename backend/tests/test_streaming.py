@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.database as db
+from app import pool as db_pool
+
+# More streams than streaming connections and reader threads together
+STREAMS = db_pool.STREAM_POOL_SIZE + db_pool.READ_POOL_SIZE + 8
+
+
+@pytest.fixture
+def collected(client):
+    with db.read_connection() as conn:
+        card_ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id LIMIT 2500")]
+    db.apply_collection_changes([{"card_id": card_id, "quantity": 1} for card_id in card_ids])
+    return card_ids
+
+
+def test_overlapping_streams_all_finish(client, collected, monkeypatch):
+    # Long enough that waiting streams outlast slow ones instead of getting a 503
+    monkeypatch.setattr(db_pool, "STREAM_TIMEOUT", 60)
+
+    def fetch(i):
+        if i % 3 == 0:
+            return client.get("/api/collection/export", params={"format": "json"})
+        return client.get("/api/collection/", params={"limit": 2000, "fields": "card_id"})
+
+    def widget(_):
+        return client.get("/api/widgets/totalCards")
+
+    with ThreadPoolExecutor(max_workers=STREAMS + 8) as executor:
+        streams = [executor.submit(fetch, i) for i in range(STREAMS)]
+        widgets = [executor.submit(widget, i) for i in range(8)]
+        responses = [future.result(timeout=120) for future in streams]
+        assert all(future.result(timeout=120).status_code == 200 for future in widgets)
+
+    for i, response in enumerate(responses):
+        assert response.status_code == 200
+        if i % 3:
+            assert len(response.json()["collection"]) == 2000
+        else:
+            assert len(response.json()) == len(collected)
+
+
+def test_a_stream_gets_503_when_no_connection_frees_up(client, collected, monkeypatch):
+    monkeypatch.setattr(db_pool, "STREAM_TIMEOUT", 0.05)
+    pool = db.get_pool()
+    taken = [pool.acquire_stream() for _ in range(db_pool.STREAM_POOL_SIZE)]
+    try:
+        response = client.get("/api/collection/")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"]
+        assert client.get("/api/widgets/totalCards").status_code == 200
+    finally:
+        for conn in taken:
+            pool.release_stream(conn)
+    assert client.get("/api/collection/").status_code == 200
@@ -0,0 +1,93 @@
+import pytest
+
+import app.database as db
+
+# The sets of the stub API's catalogue (conftest.py)
+SET_IDS = ["base1", "base2", "base3", "base4", "base5"]
+
+# Every test here syncs into an empty database from the stub API (conftest.py)
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+def _card_ids(set_id):
+    with db.read_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT id FROM cards WHERE expansion_id = ?", (set_id,))}
+
+
+def test_full_sync_follows_pages_and_retries_rate_limits(stub, catalogue):
+    stub.rate_limit_every = 4
+    result = db.sync_catalogue(delta=False)
+
+    assert sorted(result["synced"]) == sorted(SET_IDS)
+    assert result["failed"] == {}
+    assert result["inserted"] == result["cards"] == catalogue.card_count()
+    assert stub.rate_limited > 0
+    for set_id in SET_IDS:
+        assert _card_ids(set_id) == {card["id"] for card in catalogue.cards(set_id)}
+    with db.read_connection() as conn:
+        states = dict(conn.execute("SELECT set_id, status FROM sync_state").fetchall())
+    assert states == {set_id: "done" for set_id in SET_IDS}
+
+
+def test_a_failing_set_does_not_stop_the_others(stub, catalogue):
+    catalogue.set_cards["base3"] = []
+    result = db.sync_catalogue(delta=False)
+
+    assert set(result["failed"]) == {"base3"}
+    assert sorted(result["synced"]) == sorted(set(SET_IDS) - {"base3"})
+    with db.read_connection() as conn:
+        assert conn.execute("SELECT status FROM sync_state WHERE set_id = 'base3'").fetchone()[0] == "failed"
+
+
+def test_resume_skips_finished_sets(stub):
+    db.sync_catalogue(delta=False)
+    stub.serve(stub.catalogue)
+    result = db.sync_cards(SET_IDS, resume=True)
+    assert result["synced"] == []
+    assert stub.requests == 0
+
+
+def test_delta_sync_skips_unchanged_sets(stub):
+    db.sync_catalogue(delta=False)
+    stub.serve(stub.catalogue)
+    result = db.sync_catalogue()
+    assert result["sets_changed"] == 0
+    assert stub.requests == 1  # just the /sets listing
+
+
+def test_delta_sync_applies_upstream_changes(stub, catalogue):
+    db.sync_catalogue(delta=False)
+    cards = catalogue.set_cards["base1"]
+    owned, removed, renamed = cards[1]["id"], cards[2]["id"], cards[0]["id"]
+    assert db.update_card_quantity(owned, 2)
+
+    catalogue.set_objects["base1"]["updatedAt"] = "2030/01/01 00:00:00"
+    cards[0]["name"] = "Alakazam Prime"
+    new_card = {**cards[3], "id": "base1-999", "number": "999"}
+    catalogue.set_cards["base1"] = [cards[0]] + cards[3:] + [new_card]  # drops the owned and another card
+    stub.serve(catalogue)
+
+    result = db.sync_catalogue()
+    assert result["sets_changed"] == 1
+    assert result["changes"] == {"base1": {"inserted": 1, "updated": 1, "removed": 1}}
+    ids = _card_ids("base1")
+    assert "base1-999" in ids and removed not in ids
+    assert owned in ids  # cards in the collection are kept
+    with db.read_connection() as conn:
+        assert conn.execute("SELECT name FROM cards WHERE id = ?", (renamed,)).fetchone()[0] == "Alakazam Prime"
+        assert conn.execute("SELECT updated_at FROM expansions WHERE id = 'base1'").fetchone()[0] == \
+            "2030/01/01 00:00:00"
+    assert [card["id"] for card in db.get_cards_by_name("alakazam prime")["cards"]] == [renamed]
+    assert db.sync_catalogue()["sets_changed"] == 0
+
+
+def test_unchanged_cards_keep_cached_views(stub, catalogue):
+    db.sync_catalogue(delta=False)
+    tree = db.get_expansion_tree()
+    result = db.sync_catalogue(delta=False)
+    assert result["inserted"] == result["updated"] == result["removed"] == 0
+    assert db.get_expansion_tree() is tree
+
+    catalogue.set_objects["base2"]["name"] = "Jungle (renamed)"
+    db.sync_catalogue(delta=False)
+    assert db.get_expansion_tree() is not tree
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app.database as db
+from app import prices
+
+TODAY = datetime.now(timezone.utc).date()
+
+
+def _api_day(days_ago):
+    return (TODAY - timedelta(days=days_ago)).strftime("%Y/%m/%d")
+
+
+def _price(catalogue, card_id, days_ago, tcgplayer=None, trend=None):
+    """Give a card of the stub catalogue TCGplayer prices ({variant: market}) and a Cardmarket trend price."""
+    card = next(card for card in catalogue.set_cards["base1"] if card["id"] == card_id)
+    if tcgplayer:
+        card["tcgplayer"] = {"updatedAt": _api_day(days_ago),
+                             "prices": {name: {"market": market} for name, market in tcgplayer.items()}}
+    if trend:
+        card["cardmarket"] = {"updatedAt": _api_day(days_ago), "prices": {"trendPrice": trend}}
+
+
+def _history(card_id):
+    with db.read_connection() as conn:
+        return [tuple(row) for row in conn.execute("""
+            SELECT source, variant, day, price FROM price_history WHERE card_id = ? ORDER BY source, variant, day
+        """, (card_id,))]
+
+
+@pytest.fixture
+def priced(client, catalogue, stub):
+    """Charizard and Alakazam priced ten days ago and again today, Blastoise never; a few copies of each owned."""
+    _price(catalogue, "base1-4", 10, {"holofoil": 250.0, "1stEditionHolofoil": 5000.0})
+    _price(catalogue, "base1-1", 10, {"holofoil": 40.0}, trend=30.0)
+    assert not db.sync_cards(["base1"])["failed"]
+    _price(catalogue, "base1-4", 0, {"holofoil": 300.0, "1stEditionHolofoil": 5000.0})
+    _price(catalogue, "base1-1", 0, {"holofoil": 40.0}, trend=35.0)
+    assert not db.sync_cards(["base1"])["failed"]
+
+    db.update_card_quantity("base1-4", 2, variant="holofoil")
+    db.update_card_quantity("base1-4", 1, variant="1stEditionHolofoil")
+    db.update_card_quantity("base1-4", 1)  # unspecified: valued as the first priced variant
+    db.update_card_quantity("base1-1", 1)
+    db.update_card_quantity("base1-2", 3)
+    return catalogue
+
+
+def test_syncs_append_only_changed_prices(priced, stub):
+    holofoil, first_edition = db.VARIANT_CODES["holofoil"], db.VARIANT_CODES["1steditionholofoil"]
+    then, now = prices.day_number(TODAY) - 10, prices.day_number(TODAY)
+    assert _history("base1-4") == [(0, holofoil, then, 25000), (0, holofoil, now, 30000),
+                                   (0, first_edition, then, 500000)]
+    assert _history("base1-1") == [(0, holofoil, then, 4000), (1, 0, then, 3000), (1, 0, now, 3500)]
+    assert _history("base1-2") == []
+
+    assert not db.sync_cards(["base1"])["failed"]
+    assert len(_history("base1-4")) == 3
+
+
+def test_collection_value_counts_quantities_and_variants(priced, client):
+    value = client.get("/api/collection/value", params={"days": 7}).json()
+    assert value == {
+        "source": "tcgplayer", "currency": "USD", "as_of": TODAY.isoformat(),
+        # 2 + 1 (unspecified) holofoil Charizards, a 1st edition one and a holofoil Alakazam
+        "value": 3 * 300.0 + 5000.0 + 40.0, "priced_quantity": 5, "unpriced_quantity": 3,
+        "change": {"days": 7, "value": 3 * 250.0 + 5000.0 + 40.0, "delta": 150.0},
+    }
+
+    cardmarket = client.get("/api/collection/value", params={"source": "cardmarket"}).json()
+    assert (cardmarket["currency"], cardmarket["value"], cardmarket["unpriced_quantity"]) == ("EUR", 35.0, 7)
+
+
+def test_a_card_without_a_price_is_counted_apart(priced, client):
+    db.apply_collection_changes([{"card_id": "base1-4", "quantity": 0}, {"card_id": "base1-1", "quantity": 0}])
+    value = client.get("/api/collection/value").json()
+    assert (value["value"], value["priced_quantity"], value["unpriced_quantity"]) == (0, 0, 3)
+    expansions = client.get("/api/collection/value/expansions").json()["expansions"]
+    assert expansions == [{"expansion_id": "base1", "name": "Base", "value": 0, "quantity": 3}]
+
+
+def test_value_by_expansion_and_movers(priced, client):
+    expansions = client.get("/api/collection/value/expansions").json()
+    assert expansions["expansions"] == [{"expansion_id": "base1", "name": "Base", "value": 5940.0, "quantity": 8}]
+
+    movers = client.get("/api/collection/movers", params={"days": 7}).json()
+    assert set(movers) == {"source", "currency", "as_of", "days", "gainers", "losers"}
+    assert movers["losers"] == []
+    assert [(entry["variant"], entry["quantity"], entry["change"]) for entry in movers["gainers"]] == [
+        ("holofoil", 2, 100.0), (None, 1, 50.0)]
+    assert movers["gainers"][0] == {
+        "card_id": "base1-4", "name": "Charizard", "variant": "holofoil", "quantity": 2,
+        "price_then": 250.0, "price": 300.0, "change": 100.0, "change_pct": 20.0,
+    }
+    # Nothing was priced a year ago, so there is nothing to compare
+    assert client.get("/api/collection/movers", params={"days": 365}).json()["gainers"] == []
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+
+import app.database as db
+
+REVERSE = db.VARIANT_CODES["reverseholofoil"]
+HOLO = db.VARIANT_CODES["holofoil"]
+
+
+def _state(card_id, owner_id=db.DEFAULT_OWNER_ID):
+    """A card's total and its recorded variant quantities."""
+    with db.read_connection() as conn:
+        total = conn.execute("SELECT quantity FROM collection WHERE owner_id = ? AND card_id = ?",
+                             (owner_id, card_id)).fetchone()
+        counts = dict(conn.execute(
+            "SELECT variant, quantity FROM collection_variants WHERE owner_id = ? AND card_id = ?", (owner_id, card_id)
+        ).fetchall())
+    return (total[0] if total else 0), counts
+
+
+def _apply(*items):
+    return db.apply_collection_changes(list(items))["results"]
+
+
+@pytest.fixture
+def mixed(database):
+    """base1-4 with 2 unspecified copies and 1 reverse holo."""
+    _apply({"card_id": "base1-4", "change": 2}, {"card_id": "base1-4", "change": 1, "variant": "reverseHolofoil"})
+    assert _state("base1-4") == (3, {REVERSE: 1})
+
+
+def test_changes_move_the_total(mixed):
+    _apply({"card_id": "base1-4", "change": -5, "variant": "reverseHolofoil"})
+    assert _state("base1-4") == (2, {})
+    _apply({"card_id": "base1-4", "quantity": 4, "variant": "holofoil"})
+    assert _state("base1-4") == (6, {HOLO: 4})
+
+
+def test_quantity_without_variant_is_the_total(mixed):
+    results = _apply({"card_id": "base1-4", "quantity": 0})
+    assert results[0]["quantity"] == 0
+    assert _state("base1-4") == (0, {})
+    assert db.get_total_cards_collection() == 0
+
+    _apply({"card_id": "base1-4", "change": 1, "variant": "reverseHolofoil"})
+    _apply({"card_id": "base1-4", "quantity": 5})
+    assert _state("base1-4") == (5, {})
+
+
+def test_set_import_of_a_plain_total(mixed):
+    db.import_collection(io.BytesIO(b"card_id,quantity\nbase1-4,3\n"), "csv", "set")
+    assert _state("base1-4") == (3, {})
+
+
+def test_export_round_trip_restores_the_breakdown(mixed):
+    _apply({"card_id": "base1-58", "change": 2, "variant": "holofoil"})
+    exported = b"".join(db.export_collection("csv"))
+    lines = exported.decode().splitlines()
+    assert [line.split(",")[5:] for line in lines[1:]] == [["2", "4", ""], ["1", "4", "reverseHolofoil"],
+                                                           ["0", "58", ""], ["2", "58", "holofoil"]]
+
+    # Into a collection that has drifted since, rather than an empty one
+    _apply({"card_id": "base1-4", "change": 3, "variant": "holofoil"},
+           {"card_id": "base1-58", "change": 1}, {"card_id": "base1-58", "change": 1, "variant": "normal"})
+    report = db.import_collection(io.BytesIO(exported), "csv", "set")
+    assert report["unmatched_count"] == 0
+    assert _state("base1-4") == (3, {REVERSE: 1})
+    assert _state("base1-58") == (2, {HOLO: 2})
+    assert b"".join(db.export_collection("csv")) == exported
+
+
+def test_variants_a_card_is_not_printed_in_are_refused(database):
+    with db.write_connection() as conn:
+        conn.execute("UPDATE cards SET variants = ? WHERE id = 'base1-4'", (1 << HOLO,))
+    results = _apply({"card_id": "base1-4", "change": 1, "variant": "reverseHolofoil"},
+                     {"card_id": "base1-4", "change": 1, "variant": "holofoil"},
+                     {"card_id": "base1-4", "change": 1, "variant": "shiny"})
+    assert [result["ok"] for result in results] == [False, True, False]
+    assert _state("base1-4") == (1, {HOLO: 1})
+
+
+def test_variant_endpoints(client):
+    response = client.post("/api/collection/batch", json={"items": [
+        {"card_id": "base1-4", "change": 2, "variant": "holofoil"},
+        {"card_id": "base1-4", "quantity": 1},
+    ]})
+    assert [result["quantity"] for result in response.json()["results"]] == [2, 1]
+    assert _state("base1-4") == (1, {})
+    assert client.post("/api/collection/batch", json={"items": [
+        {"card_id": "base1-4", "quantity": -1},
+    ]}).status_code == 422
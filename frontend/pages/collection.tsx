@@ -16,7 +16,7 @@ interface Card {
   collection_number: number;
   evolves_from: string | null;
   number: string;
-  hp: string | null;
+  hp: number | null;
   types: string | null;
   supertype: string;
 }
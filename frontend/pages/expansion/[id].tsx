@@ -12,7 +12,7 @@ interface Card {
   rarity: string | null;
   supertype: string;
   subtype: string | null;
-  hp: string | null;
+  hp: number | null;
   types: string | null;
   evolves_from: string | null;
   image_url: string;
@@ -50,7 +50,12 @@ export default function ExpansionDetail() {
             className="border p-3 rounded-lg shadow-md cursor-pointer hover:bg-gray-100 transition"
             onClick={() => setSelectedCard(card)}
           >
-            <img src={card.image_url} alt={card.name} className="w-full h-48 object-contain" />
+            <img
+              src={`${BACKEND_URL}/images/${card.id}?size=medium`}
+              alt={card.name}
+              loading="lazy"
+              className="w-full h-48 object-contain"
+            />
             <h2 className="text-lg font-semibold mt-2">{card.name}</h2>
             <p className="text-sm text-gray-500">
               #{card.number} - {card.rarity || "Common"}
@@ -77,7 +82,7 @@ export default function ExpansionDetail() {
 
               {/* Card Image (3x size) */}
               <img
-                src={selectedCard?.image_url}
+                src={selectedCard ? `${BACKEND_URL}/images/${selectedCard.id}?size=original` : undefined}
                 alt={selectedCard?.name}
                 className="w-full h-[500px] object-contain"
               />
@@ -9,6 +9,7 @@ interface Expansion {
   release_date: string;
   symbol_url: string;
   logo_url: string;
+  card_count: number;
 }
 
 interface ExpansionsGrouped {
@@ -47,13 +48,13 @@ export default function Expansions() {
                 className="border p-3 rounded-lg shadow-md hover:bg-gray-100 transition"
               >
                 <img
-                  src={expansion.logo_url}
+                  src={`${BACKEND_URL}/images/expansion/${expansion.id}/logo`}
                   alt={expansion.name}
                   className="w-full h-20 object-contain"
                 />
                 <h3 className="text-lg font-semibold mt-2">{expansion.name}</h3>
                 <p className="text-xs text-gray-500">
-                  Released: {expansion.release_date}
+                  Released: {expansion.release_date} · {expansion.card_count} cards
                 </p>
               </Link>
             ))}
@@ -11,7 +11,7 @@ interface Card {
   number: string;
   rarity: string | null;
   supertype: string;
-  hp: string | null;
+  hp: number | null;
   types: string | null;
   image_url: string;
 }
@@ -21,24 +21,30 @@ export default function SearchPage() {
   const [rarity, setRarity] = useState("");
   const [type_, setType_] = useState("");
   const [cards, setCards] = useState<Card[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [selectedCard, setSelectedCard] = useState<Card | null>(null);
 
-  const handleSearch = async (e: React.FormEvent) => {
-    e.preventDefault();
-    if (query.length < 1) return;
-
+  const fetchCards = async (cursor: string | null) => {
     setLoading(true);
-    let url = BACKEND_URL + `/search/cards/?q=${query}`;
+    let url = BACKEND_URL + `/search/cards/?q=${encodeURIComponent(query)}`;
     if (rarity) url += `&rarity=${rarity}`;
     if (type_) url += `&type_=${type_}`;
+    if (cursor) url += `&cursor=${cursor}`;
 
     const res = await fetch(url);
     const data = await res.json();
-    setCards(data.cards || []);
+    setCards((prev) => (cursor ? [...prev, ...(data.cards || [])] : data.cards || []));
+    setNextCursor(data.next_cursor || null);
     setLoading(false);
   };
 
+  const handleSearch = async (e: React.FormEvent) => {
+    e.preventDefault();
+    if (query.length < 1) return;
+    await fetchCards(null);
+  };
+
   return (
     <div className="p-4">
       <h1 className="text-2xl font-bold mb-4">Search Pokémon Cards</h1>
@@ -110,6 +116,17 @@ export default function SearchPage() {
         ))}
       </div>
 
+      {nextCursor && !loading && (
+        <div className="flex justify-center mt-4">
+          <button
+            onClick={() => fetchCards(nextCursor)}
+            className="bg-gray-200 px-4 py-2 rounded-lg shadow-md hover:bg-gray-300 transition"
+          >
+            Load more
+          </button>
+        </div>
+      )}
+
       {/* Card Detail Modal */}
       <Transition show={!!selectedCard} as={Fragment}>
         <Dialog as="div" className="relative z-50" onClose={() => setSelectedCard(null)}>
@@ -45,6 +45,36 @@ export default function Settings() {
     fetchExpansions();
   }, []);
 
+  // Sync endpoints return a background job; poll it until it finishes
+  const waitForJob = async (
+    jobId: string,
+    onProgress: (message: string) => void
+  ) => {
+    while (true) {
+      const res = await fetch(BACKEND_URL + `/jobs/${jobId}`);
+      const job = await res.json();
+      const progress = job.progress || {};
+      if (job.status === "queued" || job.status === "running") {
+        if (progress.sets_total) {
+          onProgress(
+            `Syncing… ${progress.sets_done}/${progress.sets_total} sets, ${progress.cards_written} cards`
+          );
+        }
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        continue;
+      }
+      return job;
+    }
+  };
+
+  const describeJob = (job: any, fallback: string) => {
+    if (job.status === "succeeded") {
+      return job.result?.message || fallback;
+    }
+    if (job.status === "cancelled") return "Update cancelled.";
+    return "Error: " + (job.error || "update failed");
+  };
+
   // Handler: Update Expansions
   const handleUpdateExpansions = async () => {
     setLoadingUpdateExpansions(true);
@@ -58,8 +88,10 @@ export default function Settings() {
         setUpdateExpansionsMessage("Error: " + errorData.detail);
       } else {
         const data = await res.json();
+        setUpdateExpansionsMessage(data.message);
+        const job = await waitForJob(data.job_id, setUpdateExpansionsMessage);
         setUpdateExpansionsMessage(
-          data.message || "Expansions updated successfully!"
+          describeJob(job, "Expansions updated successfully!")
         );
       }
     } catch (err: any) {
@@ -85,9 +117,9 @@ export default function Settings() {
         setUpdateCardsMessage("Error: " + errorData.detail);
       } else {
         const data = await res.json();
-        setUpdateCardsMessage(
-          data.message || "Cards updated successfully!"
-        );
+        setUpdateCardsMessage(data.message);
+        const job = await waitForJob(data.job_id, setUpdateCardsMessage);
+        setUpdateCardsMessage(describeJob(job, "Cards updated successfully!"));
       }
     } catch (err: any) {
       setUpdateCardsMessage("Error: " + err.message);